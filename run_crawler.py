@@ -34,28 +34,28 @@ def setup_logging():
     )
 
 
-def configure_settings(settings, spider_name, output_format='json'):
-    """配置爬虫设置"""
+def configure_components(settings, spider_name, output_format='json'):
+    """配置中间件、管道和输出文件（单机和分布式运行共用）"""
     # 启用Playwright（已在settings.py中配置）
     # 启用中间件
     settings.set('DOWNLOADER_MIDDLEWARES', {
         'scraper.middlewares.RandomUserAgentMiddleware': 400,
         'scrapy.downloadermiddlewares.useragent.UserAgentMiddleware': None,
+        'scraper.middlewares.AgeGateMiddleware': 650,
+        'scraper.middlewares.ProxyPoolMiddleware': 740,  # PROXY_ENABLED为False时不加载
+        'scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware': None,
+        'scraper.middlewares.RevalidatingHttpCacheMiddleware': 900,
+        'scraper.middlewares.DynamicRenderMiddleware': 950,  # DYNAMIC_RENDER_ENABLED为False时不加载
     })
     
     # 启用数据验证、清洗和数据库管道
     settings.set('ITEM_PIPELINES', {
-        'scraper.pipelines.DataValidationPipeline': 300,
-        'scraper.pipelines.DataCleaningPipeline': 400,
+        'scraper.pipelines.DataNormalizationPipeline': 300,
         'scraper.pipelines.MySQLPipeline': 500,
         'scraper.pipelines.MongoDBPipeline': 600,
     })
     
-    # 基本设置
-    settings.set('ROBOTSTXT_OBEY', False)  # 暂时禁用robots.txt
     settings.set('LOG_LEVEL', 'INFO')
-    settings.set('DOWNLOAD_DELAY', 1)
-    settings.set('CLOSESPIDER_ITEMCOUNT', 5)  # 限制爬取5条数据
     
     # 创建输出目录
     os.makedirs('data/export', exist_ok=True)
@@ -70,6 +70,16 @@ def configure_settings(settings, spider_name, output_format='json'):
     })
 
 
+def configure_settings(settings, spider_name, output_format='json'):
+    """配置爬虫设置"""
+    configure_components(settings, spider_name, output_format)
+    
+    # 基本设置
+    settings.set('ROBOTSTXT_OBEY', False)  # 暂时禁用robots.txt
+    settings.set('DOWNLOAD_DELAY', 1)
+    settings.set('CLOSESPIDER_ITEMCOUNT', 5)  # 限制爬取5条数据
+
+
 def run_spider(spider_name, output_format='json'):
     """运行指定爬虫"""
     try:
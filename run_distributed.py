@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分布式爬虫运行脚本（scrapy-redis）
+
+使用方法:
+    # 开始新一轮抓取：写入搜索分片种子（清空上一轮的队列和去重集合）
+    python run_distributed.py seed steam_top_sellers --pages 100
+
+    # 在每个爬虫节点上启动工作进程，节点共享Redis中的请求队列
+    python run_distributed.py crawl steam_top_sellers --max-idle 300
+"""
+
+import sys
+import argparse
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+from loguru import logger
+from run_crawler import setup_logging, configure_components
+
+
+def load_distributed_spiders():
+    """加载分布式爬虫，未安装scrapy-redis时退出"""
+    from scraper.distributed import DISTRIBUTED_SPIDERS
+    if not DISTRIBUTED_SPIDERS:
+        logger.error("分布式模式需要安装scrapy-redis: pip install scrapy-redis")
+        sys.exit(1)
+    return DISTRIBUTED_SPIDERS
+
+
+def seed(args):
+    """写入搜索分片种子"""
+    import redis
+    from scraper.distributed import seed_search_pages
+
+    load_distributed_spiders()
+    settings = get_project_settings()
+    pages = args.pages or settings.getint('MAX_PAGES_PER_SPIDER', 100)
+    server = redis.Redis.from_url(settings.get('REDIS_URL'))
+    seed_search_pages(server, args.spider, pages, reset=not args.no_reset)
+
+
+def worker_settings(spider_name, output_format='json', max_idle=0):
+    """工作进程的设置
+
+    只配置中间件、管道和输出文件，不使用单机试运行的条数限制、下载延迟和
+    robots.txt覆盖，工作进程按项目设置抓取到种子队列耗尽。
+    """
+    settings = get_project_settings()
+    configure_components(settings, spider_name, output_format)
+    settings.set('CLOSESPIDER_ITEMCOUNT', 0)
+    # 种子队列为空超过该时间（秒）后关闭工作进程，0表示一直等待新种子
+    settings.set('MAX_IDLE_TIME_BEFORE_CLOSE', max_idle)
+    return settings
+
+
+def crawl(args):
+    """启动分布式爬虫工作进程"""
+    spiders = load_distributed_spiders()
+    settings = worker_settings(args.spider, args.format, args.max_idle)
+
+    process = CrawlerProcess(settings)
+    logger.info(f"启动分布式爬虫节点: {args.spider}")
+    process.crawl(spiders[args.spider])
+    process.start()
+    logger.info(f"分布式爬虫节点 {args.spider} 已退出")
+
+
+def main():
+    """主函数"""
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description='游戏市场数据分布式爬虫')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    spider_names = ['steam_top_sellers', 'steam_popular']
+
+    seed_parser = subparsers.add_parser('seed', help='写入搜索分片种子')
+    seed_parser.add_argument('spider', choices=spider_names)
+    seed_parser.add_argument('--pages', type=int, default=0, help='分片数量，默认MAX_PAGES_PER_SPIDER')
+    seed_parser.add_argument('--no-reset', action='store_true', help='追加种子，不清空上一轮的队列和去重集合')
+    seed_parser.set_defaults(func=seed)
+
+    crawl_parser = subparsers.add_parser('crawl', help='启动爬虫工作进程')
+    crawl_parser.add_argument('spider', choices=spider_names)
+    crawl_parser.add_argument('--format', default='json', choices=['json', 'csv', 'xml'], help='输出格式')
+    crawl_parser.add_argument('--max-idle', type=int, default=0, help='空闲多少秒后退出，0表示一直等待')
+    crawl_parser.set_defaults(func=crawl)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+分布式爬取（scrapy-redis）
+
+多个爬虫节点共享Redis中的请求队列和去重集合：种子队列中的每个搜索分片
+只会被一个节点取走，详情页请求经共享去重集合过滤后进入共享队列，
+由任意空闲节点下载。分布式爬虫沿用单机爬虫的name，存储管道的集合/分表不变；
+它们不在SPIDER_MODULES中注册，由 run_distributed.py 按类启动。
+"""
+
+import json
+from loguru import logger
+from scraper.spiders.steam_spider import SteamTopSellersSpider, SteamPopularSpider
+
+try:
+    from scrapy_redis.spiders import RedisSpider
+except ImportError:  # scrapy-redis为可选依赖，未安装时分布式模式不可用
+    RedisSpider = None
+
+
+# 与scrapy_redis.defaults一致的Redis键格式
+START_URLS_KEY = '%(name)s:start_urls'
+SCHEDULER_QUEUE_KEY = '%(spider)s:requests'
+SCHEDULER_DUPEFILTER_KEY = '%(spider)s:dupefilter'
+
+# 分布式模式的调度设置（请求队列和去重集合都放在Redis中）
+REDIS_SCHEDULER_SETTINGS = {
+    'SCHEDULER': 'scrapy_redis.scheduler.Scheduler',
+    'DUPEFILTER_CLASS': 'scrapy_redis.dupefilter.RFPDupeFilter',
+    'SCHEDULER_QUEUE_CLASS': 'scrapy_redis.queue.PriorityQueue',
+    'SCHEDULER_PERSIST': True,  # 节点重启后继续消费共享队列，由种子命令重置
+    'DETAIL_CACHE_BACKEND': 'redis',  # 各节点共享详情页缓存
+}
+
+
+class DistributedSearchMixin:
+    """分布式搜索爬虫：从Redis种子队列读取分片编号，不自行调度后续分页"""
+    follow_next_pages = False
+
+    @classmethod
+    def update_settings(cls, settings):
+        super().update_settings(settings)
+        if settings.getbool('BLOOM_DUPEFILTER_ENABLED'):
+            # 共享去重集合改用Redis位图Bloom过滤器
+            settings.set('DUPEFILTER_CLASS', 'scraper.dupefilters.RedisBloomDupeFilter', priority='spider')
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider._setup_pagination()
+        return spider
+
+    def make_request_from_data(self, data):
+        """由种子数据 {"page": n} 构建搜索分片请求"""
+        if isinstance(data, bytes):
+            data = data.decode(self.redis_encoding)
+        try:
+            page = int(json.loads(data)['page'])
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"忽略无效的种子数据: {data!r}")
+            return None
+        if page >= self.max_pages:
+            return None
+        return self._search_page_request(page)
+
+
+DISTRIBUTED_SPIDERS = {}
+
+if RedisSpider is not None:
+    class SteamTopSellersRedisSpider(DistributedSearchMixin, RedisSpider, SteamTopSellersSpider):
+        """分布式Steam畅销游戏爬虫"""
+        custom_settings = {**SteamTopSellersSpider.custom_settings, **REDIS_SCHEDULER_SETTINGS}
+
+    class SteamPopularRedisSpider(DistributedSearchMixin, RedisSpider, SteamPopularSpider):
+        """分布式Steam热门游戏爬虫"""
+        custom_settings = {**SteamPopularSpider.custom_settings, **REDIS_SCHEDULER_SETTINGS}
+
+    DISTRIBUTED_SPIDERS = {
+        SteamTopSellersRedisSpider.name: SteamTopSellersRedisSpider,
+        SteamPopularRedisSpider.name: SteamPopularRedisSpider,
+    }
+
+
+def seed_search_pages(server, spider_name, pages, reset=True):
+    """把搜索分片编号写入种子队列，返回写入数量
+
+    reset为True时开始新一轮抓取：清空上一轮残留的种子、请求队列和去重集合，
+    否则已抓取过的详情页会被持久化的去重集合过滤掉。
+    """
+    key = START_URLS_KEY % {'name': spider_name}
+    if reset:
+        dupefilter_key = SCHEDULER_DUPEFILTER_KEY % {'spider': spider_name}
+        # Bloom去重的分片位图保存在 <dupefilter_key>:* 下
+        bloom_keys = list(server.scan_iter(match=f'{dupefilter_key}:*'))
+        server.delete(key, SCHEDULER_QUEUE_KEY % {'spider': spider_name}, dupefilter_key, *bloom_keys)
+    if pages <= 0:
+        return 0
+    server.rpush(key, *[json.dumps({'page': page}) for page in range(pages)])
+    logger.info(f"已向 {key} 写入 {pages} 个搜索分片")
+    return pages
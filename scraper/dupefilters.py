@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+请求去重过滤器
+
+Scrapy默认的RFPDupeFilter把每个请求指纹保存在Python集合中，全量抓取
+（全部详情页、评论、历史快照）时单进程和Redis中都会占用数百MB。
+这里提供基于可扩展Bloom过滤器的去重：
+
+- BloomDupeFilter: 进程内位数组，可配合JOBDIR持久化
+- RedisBloomDupeFilter: Redis位图 (SETBIT/GETBIT)，可作为scrapy-redis调度器的去重类
+
+误判（把新请求当作重复）概率由 BLOOMFILTER_ERROR_RATE 控制，不会漏判。
+"""
+
+import math
+import pickle
+import logging
+import time
+from pathlib import Path
+import redis
+from scrapy.dupefilters import RFPDupeFilter
+from scrapy.utils.job import job_dir
+from scrapy.utils.request import RequestFingerprinter
+from loguru import logger
+
+
+def bloom_parameters(capacity, error_rate):
+    """按容量和误判率计算位数组大小m和哈希函数个数k"""
+    bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+    hashes = max(1, int(round(bits / capacity * math.log(2))))
+    return bits, hashes
+
+
+def bit_offsets(key, bits, hashes):
+    """双重哈希计算k个位偏移；key为请求指纹（SHA1摘要，前16字节已足够随机）"""
+    h1 = int.from_bytes(key[:8], 'little')
+    h2 = int.from_bytes(key[8:16], 'little') | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+class BloomFilter:
+    """固定容量的Bloom过滤器（bytearray位数组）"""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bits, self.hashes = bloom_parameters(capacity, error_rate)
+        self.array = bytearray((self.bits + 7) // 8)
+        self.count = 0
+
+    def __contains__(self, key):
+        array = self.array
+        for offset in bit_offsets(key, self.bits, self.hashes):
+            if not array[offset >> 3] & (1 << (offset & 7)):
+                return False
+        return True
+
+    def add(self, key):
+        """加入key，返回key是否（可能）已存在"""
+        array = self.array
+        seen = True
+        for offset in bit_offsets(key, self.bits, self.hashes):
+            index, mask = offset >> 3, 1 << (offset & 7)
+            if not array[index] & mask:
+                array[index] |= mask
+                seen = False
+        if not seen:
+            self.count += 1
+        return seen
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    @property
+    def nbytes(self):
+        return len(self.array)
+
+
+class ScalableBloomFilter:
+    """可扩展Bloom过滤器 (Almeida et al., 2007)
+
+    当前分片达到容量后追加一个容量乘以growth、误判率乘以tightening的新分片，
+    总误判率收敛于 error_rate / (1 - tightening)，初始误判率据此折算。
+    """
+
+    def __init__(self, initial_capacity=1000000, error_rate=0.001, growth=2, tightening=0.5):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.filters = []
+        self._add_filter()
+
+    def _add_filter(self):
+        index = len(self.filters)
+        capacity = self.initial_capacity * self.growth ** index
+        error_rate = self.error_rate * (1 - self.tightening) * self.tightening ** index
+        self.filters.append(BloomFilter(capacity, error_rate))
+
+    def __contains__(self, key):
+        return any(key in bloom for bloom in reversed(self.filters))
+
+    def __len__(self):
+        return sum(bloom.count for bloom in self.filters)
+
+    def add(self, key):
+        """加入key，返回key是否（可能）已存在"""
+        current = self.filters[-1]
+        for bloom in self.filters[:-1]:
+            if key in bloom:
+                return True
+        if current.full:
+            if key in current:
+                return True
+            self._add_filter()
+            current = self.filters[-1]
+        return current.add(key)
+
+    @property
+    def nbytes(self):
+        return sum(bloom.nbytes for bloom in self.filters)
+
+
+class BloomDupeFilter(RFPDupeFilter):
+    """进程内Bloom过滤器去重
+
+    启用方式: DUPEFILTER_CLASS = 'scraper.dupefilters.BloomDupeFilter'
+    设置JOBDIR时，关闭爬虫会把位数组保存到 JOBDIR/requests.bloom，恢复抓取时读取。
+    """
+
+    def __init__(self, path=None, debug=False, *, fingerprinter=None,
+                 capacity=1000000, error_rate=0.001):
+        self.file = None
+        self.fingerprinter = fingerprinter or RequestFingerprinter()
+        self.logdupes = True
+        self.debug = debug
+        self.logger = logging.getLogger(__name__)
+        self.path = Path(path, 'requests.bloom') if path else None
+        if self.path and self.path.exists():
+            with self.path.open('rb') as f:
+                self.fingerprints = pickle.load(f)
+        else:
+            self.fingerprints = ScalableBloomFilter(capacity, error_rate)
+
+    @classmethod
+    def from_settings(cls, settings, *, fingerprinter=None):
+        return cls(
+            job_dir(settings),
+            settings.getbool('DUPEFILTER_DEBUG'),
+            fingerprinter=fingerprinter,
+            capacity=settings.getint('BLOOMFILTER_CAPACITY', 1000000),
+            error_rate=settings.getfloat('BLOOMFILTER_ERROR_RATE', 0.001),
+        )
+
+    def request_seen(self, request):
+        return self.fingerprints.add(self.fingerprinter.fingerprint(request))
+
+    def close(self, reason):
+        logger.info(
+            f"Bloom去重: {len(self.fingerprints)} 个指纹, "
+            f"{len(self.fingerprints.filters)} 个分片, {self.fingerprints.nbytes / 1024 / 1024:.1f} MB"
+        )
+        if self.path:
+            with self.path.open('wb') as f:
+                pickle.dump(self.fingerprints, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+# 原子地检查并写入指纹：只读检查已满的旧分片，在当前分片上SETBIT并根据返回的
+# 旧位判断是否已存在，新指纹递增当前分片计数。
+# KEYS: 各分片位图..., 计数哈希；ARGV: 每个分片依次为 哈希个数, 位偏移...
+# 返回 {是否已存在, 当前分片计数, Redis中的分片数}
+BLOOM_CHECK_AND_SET_SCRIPT = """
+local meta = KEYS[#KEYS]
+local current = #KEYS - 1
+local position = 1
+for index = 1, current do
+    local hashes = tonumber(ARGV[position])
+    local seen = 1
+    for i = position + 1, position + hashes do
+        local bit
+        if index < current then
+            bit = redis.call('getbit', KEYS[index], ARGV[i])
+        else
+            bit = redis.call('setbit', KEYS[index], ARGV[i], 1)
+        end
+        if bit == 0 then
+            seen = 0
+            if index < current then
+                break
+            end
+        end
+    end
+    if seen == 1 then
+        return {1, tonumber(redis.call('hget', meta, current - 1) or 0), redis.call('hlen', meta)}
+    end
+    position = position + hashes + 1
+end
+local count = redis.call('hincrby', meta, current - 1, 1)
+return {0, count, redis.call('hlen', meta)}
+"""
+
+
+class RedisBloomDupeFilter(RFPDupeFilter):
+    """Redis位图Bloom过滤器去重，多个爬虫节点共享
+
+    分片位图保存在 {key}:{序号}，各分片已写入的数量保存在哈希 {key}:meta。
+    与scrapy-redis调度器配合时 (from_spider)，key为 SCHEDULER_DUPEFILTER_KEY，
+    默认 '<spider>:dupefilter'。计数在多节点间是近似值，只影响分片扩容的时机。
+    独立使用且未设置 BLOOMFILTER_REDIS_KEY 时每次运行生成临时键，关闭时删除
+    （与scrapy-redis未设置SCHEDULER_PERSIST时清除去重键一致）。
+    """
+
+    def __init__(self, server, key, debug=False, *, fingerprinter=None,
+                 capacity=1000000, error_rate=0.001, growth=2, tightening=0.5, persist=True):
+        self.file = None
+        self.server = server
+        self.key = key
+        self.fingerprinter = fingerprinter or RequestFingerprinter()
+        self.logdupes = True
+        self.debug = debug
+        self.logger = logging.getLogger(__name__)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.persist = persist  # False时关闭爬虫会删除位图
+        self.slices = []  # [(容量, 位数, 哈希个数)]
+        self._load_slices()
+
+    @classmethod
+    def from_settings(cls, settings, *, fingerprinter=None, key=None):
+        server = redis.Redis.from_url(settings.get('REDIS_URL'))
+        persist = True
+        if key is None:
+            key = settings.get('BLOOMFILTER_REDIS_KEY')
+        if key is None:
+            # 独立使用（非scrapy-redis调度器）且未指定键时，每次运行使用新的临时键
+            key = f'dupefilter:bloom:{int(time.time())}'
+            persist = False
+        return cls(
+            server,
+            key,
+            settings.getbool('DUPEFILTER_DEBUG'),
+            fingerprinter=fingerprinter,
+            capacity=settings.getint('BLOOMFILTER_CAPACITY', 1000000),
+            error_rate=settings.getfloat('BLOOMFILTER_ERROR_RATE', 0.001),
+            persist=persist,
+        )
+
+    @classmethod
+    def from_spider(cls, spider):
+        """scrapy-redis调度器的构造入口"""
+        settings = spider.settings
+        key = settings.get('SCHEDULER_DUPEFILTER_KEY', '%(spider)s:dupefilter') % {'spider': spider.name}
+        return cls.from_settings(settings, fingerprinter=spider.crawler.request_fingerprinter, key=key)
+
+    def _slice_parameters(self, index):
+        capacity = self.capacity * self.growth ** index
+        error_rate = self.error_rate * (1 - self.tightening) * self.tightening ** index
+        return (capacity,) + bloom_parameters(capacity, error_rate)
+
+    def _load_slices(self):
+        """按Redis中已有的分片数恢复分片参数"""
+        existing = self.server.hlen(f'{self.key}:meta')
+        self.slices = [self._slice_parameters(index) for index in range(max(1, existing))]
+
+    def request_seen(self, request):
+        fingerprint = self.fingerprinter.fingerprint(request)
+        keys = [f'{self.key}:{index}' for index in range(len(self.slices))] + [f'{self.key}:meta']
+        args = []
+        for _, bits, hashes in self.slices:
+            args.append(hashes)
+            args.extend(bit_offsets(fingerprint, bits, hashes))
+
+        # 检查和写入在一个Lua脚本中完成，多个节点同时看到同一个新请求时只有一个返回未见过
+        seen, count, existing = self.server.eval(BLOOM_CHECK_AND_SET_SCRIPT, len(keys), *keys, *args)
+
+        if int(existing) > len(self.slices):
+            # 其他节点已经扩容
+            self.slices.extend(self._slice_parameters(index) for index in range(len(self.slices), int(existing)))
+        elif int(count) >= self.slices[-1][0]:
+            # 当前分片已满，之后的新指纹写入下一个分片
+            self.slices.append(self._slice_parameters(len(self.slices)))
+        return bool(int(seen))
+
+    def clear(self):
+        """删除所有分片位图（scrapy-redis调度器flush时调用）"""
+        keys = [f'{self.key}:{index}' for index in range(len(self.slices))]
+        self.server.delete(f'{self.key}:meta', *keys)
+        self.slices = [self._slice_parameters(0)]
+
+    def close(self, reason=''):
+        """临时键在关闭时删除；其余保留位图，新一轮抓取由种子命令清除"""
+        if not self.persist:
+            self.clear()
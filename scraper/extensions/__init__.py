@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""
+扩展模块
+"""
+from .adaptive_rate import AdaptiveRateLimiter
+from .httpcache import SQLiteCacheStorage
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+自适应限速扩展
+
+按下载槽（默认每个域名，启用代理池时每个代理）以AIMD方式调整请求速率：
+响应正常且延迟未超过目标时加性增加速率，遇到429/503或Steam的限流页面时
+乘性降低速率（遵守Retry-After），通过下载槽的delay生效。
+当前速率写入爬虫统计 adaptive_rate/rate/<下载槽>。
+启用代理池时同一域名分布在多个下载槽上，各下载槽的速率再受域名上限
+ADAPTIVE_RATE_DOMAIN_MAX 约束（按该域名当前活跃的下载槽数平分），
+代理数量增加时整个域名的请求速率不会随之成倍增加。
+与AutoThrottle同样修改下载槽的delay，两者不应同时启用。
+"""
+
+import time
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+from loguru import logger
+
+
+# Steam限流页面的特征文本（小写字节串）
+RATE_LIMIT_MARKERS = (
+    b"you've made too many requests recently",
+    b'too many requests',
+    '您最近提出的请求过多'.encode('utf-8'),
+    '请求过于频繁'.encode('utf-8'),
+)
+# 只在较小的页面中查找限流特征，正常的商店页面远大于此
+RATE_LIMIT_BODY_MAX = 64 * 1024
+
+
+class SlotRate:
+    """单个下载槽的速率状态"""
+    __slots__ = ('rate', 'last_decrease')
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.last_decrease = 0.0
+
+
+class AdaptiveRateLimiter:
+    """AIMD自适应限速扩展"""
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('ADAPTIVE_RATE_ENABLED'):
+            raise NotConfigured
+
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.min_rate = settings.getfloat('ADAPTIVE_RATE_MIN', 0.1)
+        self.max_rate = settings.getfloat('ADAPTIVE_RATE_MAX', 2.0)
+        self.domain_max_rate = settings.getfloat('ADAPTIVE_RATE_DOMAIN_MAX') or self.max_rate
+        self.increase = settings.getfloat('ADAPTIVE_RATE_INCREASE', 0.05)
+        self.decrease = settings.getfloat('ADAPTIVE_RATE_DECREASE', 0.5)
+        self.cooldown = settings.getfloat('ADAPTIVE_RATE_COOLDOWN', 5)
+        self.target_latency = settings.getfloat('ADAPTIVE_RATE_TARGET_LATENCY', 5)
+        self.backoff_codes = {int(code) for code in settings.getlist('ADAPTIVE_RATE_BACKOFF_CODES', [429, 503])}
+        self.clock = time.monotonic
+        self.slots = {}
+        self.domain_slots = {}  # 域名 -> 出现过的下载槽
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.response_downloaded, signal=signals.response_downloaded)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def spider_opened(self, spider):
+        """以爬虫的DOWNLOAD_DELAY作为初始速率"""
+        delay = getattr(spider, 'download_delay', None) or self.crawler.settings.getfloat('DOWNLOAD_DELAY')
+        self.start_rate = self._clamp(1.0 / delay if delay > 0 else self.max_rate)
+        logger.info(
+            f"自适应限速: 初始 {self.start_rate:.2f} 请求/秒, "
+            f"范围 {self.min_rate:.2f}-{self.max_rate:.2f} 请求/秒"
+        )
+
+    def response_downloaded(self, response, request, spider):
+        key = request.meta.get('download_slot')
+        slots = self.crawler.engine.downloader.slots
+        slot = slots.get(key)
+        if slot is None:
+            return
+
+        state = self.slots.get(key)
+        if state is None:
+            state = self.slots[key] = SlotRate(self.start_rate)
+
+        if self._is_rate_limited(response):
+            self._back_off(key, state, response)
+        else:
+            latency = request.meta.get('download_latency')
+            if latency is None or latency <= self.target_latency:
+                state.rate = min(self.max_rate, state.rate + self.increase)
+            # 延迟超过目标时保持当前速率
+
+        slot.delay = 1.0 / min(state.rate, self._domain_share(urlparse_cached(request).hostname, key, slots))
+        self.stats.set_value(f'adaptive_rate/rate/{key}', round(state.rate, 3))
+
+    def _domain_share(self, domain, key, slots):
+        """域名上限按该域名仍然活跃（未被下载器回收）的下载槽数平分"""
+        keys = self.domain_slots.setdefault(domain, set())
+        keys.add(key)
+        keys.intersection_update(slots)
+        return self.domain_max_rate / len(keys)
+
+    def _is_rate_limited(self, response):
+        """429/503等响应码，或Steam返回200的限流页面"""
+        if response.status in self.backoff_codes:
+            return True
+        body = response.body
+        if len(body) > RATE_LIMIT_BODY_MAX:
+            return False
+        lowered = body.lower()
+        return any(marker in lowered for marker in RATE_LIMIT_MARKERS)
+
+    def _back_off(self, key, state, response):
+        """乘性降低速率，冷却期内的并发限流响应只降低一次"""
+        self.stats.inc_value('adaptive_rate/rate_limited')
+        now = self.clock()
+        retry_after = self._retry_after(response)
+        if now - state.last_decrease < self.cooldown and retry_after is None:
+            return
+        rate = self._clamp(state.rate * self.decrease)
+        if retry_after:
+            # Retry-After优先于最低速率
+            rate = min(rate, 1.0 / retry_after)
+        state.rate = rate
+        state.last_decrease = now
+        self.stats.inc_value('adaptive_rate/backoffs')
+        logger.warning(f"下载槽 {key} 被限流 (HTTP {response.status})，速率降至 {state.rate:.2f} 请求/秒")
+
+    def _retry_after(self, response):
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return None
+
+    def _clamp(self, rate):
+        return min(self.max_rate, max(self.min_rate, rate))
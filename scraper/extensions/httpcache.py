@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP缓存存储
+
+SQLiteCacheStorage把响应保存在单个SQLite文件中，代替每个响应一组小文件的
+FilesystemCacheStorage：响应体按内容哈希去重，使用zstd压缩（未安装zstandard时
+退回zlib），并按最大体积（最久未访问优先）和最长保存时间淘汰。多个爬虫进程
+共享同一个缓存文件：使用WAL日志，每次写入都是一个短事务，锁冲突时按
+HTTPCACHE_SQLITE_BUSY_TIMEOUT 等待；每 HTTPCACHE_SQLITE_EVICT_EVERY 次写入淘汰一次。
+读取缓存不写数据库，访问时间先记在内存中，随下一次写入或淘汰批量更新。
+响应体带有引用计数和压缩后大小，总大小保存在 totals 表中随写入更新；淘汰时按
+索引分批删除，每批一个短事务，不扫描全表。
+
+RevalidatingCachePolicy在缓存超过 HTTPCACHE_REVALIDATE_AFTER_SECS 后发送条件请求
+(If-None-Match / If-Modified-Since)，配合RevalidatingHttpCacheMiddleware在304时
+刷新缓存条目，未变化的页面不再完整下载。年龄验证页和跳转到年龄验证页的重定向
+不缓存，由AgeGateMiddleware带Cookie重试后缓存正常页面。
+
+启用方式:
+    HTTPCACHE_STORAGE = 'scraper.extensions.httpcache.SQLiteCacheStorage'
+    HTTPCACHE_POLICY = 'scraper.extensions.httpcache.RevalidatingCachePolicy'
+"""
+
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+from contextlib import contextmanager
+from scrapy.http import Headers
+from scrapy.extensions.httpcache import RFC2616Policy, rfc1123_to_epoch
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from scraper.middlewares.age_gate import is_age_gate
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+from loguru import logger
+
+try:
+    import zstandard
+except ImportError:  # zstandard为可选依赖
+    zstandard = None
+
+
+class Codec:
+    """压缩编解码器，数据库中记录编码名，读取时按记录解压"""
+
+    def __init__(self, prefer='zstd', level=3):
+        self.name = 'zstd' if prefer == 'zstd' and zstandard is not None else 'zlib'
+        self.level = level
+        if zstandard is not None:
+            self._compressor = zstandard.ZstdCompressor(level=level)
+            self._decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data):
+        if self.name == 'zstd':
+            return self._compressor.compress(data)
+        return zlib.compress(data, min(self.level, 9))
+
+    def decompress(self, data, name):
+        if name == 'zstd':
+            if zstandard is None:
+                raise RuntimeError('缓存使用zstd压缩，需要安装zstandard')
+            return self._decompressor.decompress(data)
+        if name == 'zlib':
+            return zlib.decompress(data)
+        return data
+
+
+class RevalidatingCachePolicy(RFC2616Policy):
+    """条件重新验证缓存策略
+
+    与DummyPolicy一样缓存所有响应（不要求响应带有缓存头），缓存条目在
+    HTTPCACHE_REVALIDATE_AFTER_SECS 内直接使用；之后用保存的ETag/Last-Modified
+    发送条件请求，由服务器返回304或新的完整响应。缓存年龄按缓存响应的Date头计算，
+    304刷新缓存时Date随之更新。
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.ignore_http_codes = [int(code) for code in settings.getlist('HTTPCACHE_IGNORE_HTTP_CODES')]
+        self.revalidate_after = settings.getint('HTTPCACHE_REVALIDATE_AFTER_SECS', 3600)
+
+    def should_cache_response(self, response, request):
+        if response.status == 304 or response.status in self.ignore_http_codes:
+            return False
+        return not is_age_gate(response)
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        if is_age_gate(cachedresponse):
+            return False  # 旧版本缓存的年龄验证页，不发送条件请求，重新完整下载
+        date = rfc1123_to_epoch(cachedresponse.headers.get(b'Date'))
+        if date and time.time() - date < self.revalidate_after:
+            return True
+        self._set_conditional_validators(request, cachedresponse)
+        return False
+
+
+class SQLiteCacheStorage:
+    """单文件SQLite HTTP缓存存储"""
+
+    SCHEMA_VERSION = 2  # 保存在 PRAGMA user_version 中，版本不同的缓存文件重建
+    SCHEMA = (
+        """CREATE TABLE IF NOT EXISTS responses (
+            spider TEXT NOT NULL,
+            fingerprint BLOB NOT NULL,
+            url TEXT NOT NULL,
+            method TEXT NOT NULL,
+            status INTEGER NOT NULL,
+            response_url TEXT NOT NULL,
+            headers BLOB NOT NULL,
+            body_hash BLOB NOT NULL,
+            codec TEXT NOT NULL,
+            stored_at REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            PRIMARY KEY (spider, fingerprint)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)",
+        "CREATE INDEX IF NOT EXISTS idx_responses_stored ON responses (stored_at)",
+        """CREATE TABLE IF NOT EXISTS bodies (
+            hash BLOB PRIMARY KEY,
+            codec TEXT NOT NULL,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            refs INTEGER NOT NULL
+        ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS totals (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        ) WITHOUT ROWID""",
+        "INSERT OR IGNORE INTO totals VALUES ('body_bytes', 0)",
+    )
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings['HTTPCACHE_DIR'], createdir=True)
+        self.path = os.path.join(self.cachedir, settings.get('HTTPCACHE_SQLITE_FILE', 'httpcache.sqlite'))
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.max_bytes = settings.getint('HTTPCACHE_SQLITE_MAX_BYTES', 2 * 1024 ** 3)
+        self.max_age = settings.getint('HTTPCACHE_SQLITE_MAX_AGE', 7 * 24 * 3600)
+        self.busy_timeout = settings.getfloat('HTTPCACHE_SQLITE_BUSY_TIMEOUT', 30)
+        self.evict_every = settings.getint('HTTPCACHE_SQLITE_EVICT_EVERY', 1000)
+        self.evict_batch = max(1, settings.getint('HTTPCACHE_SQLITE_EVICT_BATCH', 500))
+        self.codec = Codec(settings.get('HTTPCACHE_COMPRESSION', 'zstd'), settings.getint('HTTPCACHE_COMPRESSION_LEVEL', 3))
+        self.access_flush_size = settings.getint('HTTPCACHE_SQLITE_ACCESS_FLUSH_SIZE', 1000)
+        self.db = None
+        self._writes = 0
+        self._accessed = {}  # (爬虫名, 指纹) -> 尚未写入数据库的访问时间
+
+    def open_spider(self, spider):
+        self._fingerprinter = spider.crawler.request_fingerprinter
+        # 自动提交模式，timeout为其他进程持有写锁时的等待时间
+        self.db = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        with self._transaction():
+            if self.db.execute('PRAGMA user_version').fetchone()[0] != self.SCHEMA_VERSION:
+                # 新文件或旧版本的缓存（没有引用计数和大小），缓存可以丢弃，直接重建
+                for table in ('responses', 'bodies', 'totals'):
+                    self.db.execute(f'DROP TABLE IF EXISTS {table}')
+                self.db.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+            for statement in self.SCHEMA:
+                self.db.execute(statement)
+        self.evict()
+        logger.debug(f"使用SQLite HTTP缓存: {self.path} (压缩: {self.codec.name})")
+
+    def close_spider(self, spider):
+        self.evict()
+        self.db.close()
+        self.db = None
+
+    def retrieve_response(self, spider, request):
+        """返回缓存的响应，不存在或已过期时返回None"""
+        fingerprint = self._fingerprint(request)
+        row = self._load(spider.name, fingerprint)
+        if row is None:
+            return None
+        status, response_url, raw_headers, codec, data, body_codec, stored_at = row
+        if 0 < self.expiration_secs < time.time() - stored_at:
+            return None  # 已过期
+        self._accessed[(spider.name, fingerprint)] = time.time()
+        if len(self._accessed) >= self.access_flush_size:
+            # 只读取不写入时也定期更新访问时间，每批一个写事务
+            with self._transaction():
+                self._flush_accessed()
+        headers = Headers(headers_raw_to_dict(self.codec.decompress(raw_headers, codec)))
+        body = self.codec.decompress(data, body_codec)
+        respcls = responsetypes.from_args(headers=headers, url=response_url, body=body)
+        return respcls(url=response_url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        """保存响应，相同内容的响应体只保存一份"""
+        body = response.body
+        body_hash = hashlib.sha256(body).digest()[:16]  # SHA-NI加速，比blake2b快
+        now = time.time()
+        # 压缩在事务之外完成，减少写锁的持有时间
+        row = (
+            spider.name, self._fingerprint(request), request.url, request.method,
+            response.status, response.url,
+            self.codec.compress(headers_dict_to_raw(response.headers)),
+            body_hash, self.codec.name, now, now,
+        )
+        data = None if self._has_body(body_hash) else self.codec.compress(body)
+        with self._transaction():
+            old = self.db.execute(
+                'SELECT body_hash FROM responses WHERE spider = ? AND fingerprint = ?', row[:2],
+            ).fetchone()
+            old_hash = old[0] if old is not None else None
+            if old_hash != body_hash:
+                if not self._has_body(body_hash):
+                    if data is None:
+                        data = self.codec.compress(body)  # 其他进程刚刚淘汰了这个响应体
+                    self.db.execute(
+                        'INSERT INTO bodies (hash, codec, data, size, refs) VALUES (?, ?, ?, ?, 0)',
+                        (body_hash, self.codec.name, data, len(data)),
+                    )
+                    self._add_body_bytes(len(data))
+                self.db.execute('UPDATE bodies SET refs = refs + 1 WHERE hash = ?', (body_hash,))
+            self.db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', row)
+            if old_hash is not None and old_hash != body_hash:
+                self._release_bodies([old_hash])
+            self._flush_accessed()
+
+        self._writes += 1
+        if self.evict_every > 0 and self._writes % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        """按最长保存时间和最大体积淘汰缓存，返回删除的响应数
+
+        每批最多删除 HTTPCACHE_SQLITE_EVICT_BATCH 个响应，每批一个短事务，
+        其他进程的写入可以在批次之间进行。
+        """
+        with self._transaction():
+            self._flush_accessed()
+        deleted = 0
+        if self.max_age > 0:
+            cutoff = time.time() - self.max_age
+            while True:
+                with self._transaction():
+                    rows = self.db.execute(
+                        'SELECT spider, fingerprint, body_hash FROM responses '
+                        'WHERE stored_at < ? ORDER BY stored_at LIMIT ?',
+                        (cutoff, self.evict_batch),
+                    ).fetchall()
+                    self._delete_responses(rows)
+                deleted += len(rows)
+                if len(rows) < self.evict_batch:
+                    break
+        if self.max_bytes > 0:
+            while True:
+                with self._transaction():
+                    victims = self._size_victims(self._body_bytes() - self.max_bytes)
+                    self._delete_responses(victims)
+                deleted += len(victims)
+                if not victims:
+                    break
+        if deleted:
+            logger.info(f"HTTP缓存淘汰 {deleted} 个响应")
+        return deleted
+
+    def _size_victims(self, excess):
+        """按最久未访问顺序选出一批需要删除的响应，响应体的最后一个引用被删除时才释放空间"""
+        if excess <= 0:
+            return []
+        rows = self.db.execute(
+            'SELECT r.spider, r.fingerprint, r.body_hash, b.refs, b.size '
+            'FROM responses r JOIN bodies b ON b.hash = r.body_hash ORDER BY r.accessed_at LIMIT ?',
+            (self.evict_batch,),
+        )
+        victims = []
+        refs = {}
+        for spider_name, fingerprint, body_hash, body_refs, size in rows:
+            if excess <= 0:
+                break
+            victims.append((spider_name, fingerprint, body_hash))
+            refs[body_hash] = refs.get(body_hash, body_refs) - 1
+            if refs[body_hash] == 0:
+                excess -= size
+        return victims
+
+    def _delete_responses(self, rows):
+        """删除响应 [(爬虫名, 指纹, 响应体哈希)] 并释放不再被引用的响应体"""
+        if not rows:
+            return
+        self.db.executemany(
+            'DELETE FROM responses WHERE spider = ? AND fingerprint = ?',
+            [(spider_name, fingerprint) for spider_name, fingerprint, _ in rows],
+        )
+        self._release_bodies([body_hash for _, _, body_hash in rows])
+
+    def _release_bodies(self, hashes):
+        """减少响应体的引用计数，删除计数归零的响应体"""
+        counts = {}
+        for body_hash in hashes:
+            counts[body_hash] = counts.get(body_hash, 0) + 1
+        self.db.executemany('UPDATE bodies SET refs = refs - ? WHERE hash = ?',
+                            [(count, body_hash) for body_hash, count in counts.items()])
+        freed = 0
+        for body_hash in counts:
+            row = self.db.execute('SELECT size FROM bodies WHERE hash = ? AND refs <= 0', (body_hash,)).fetchone()
+            if row is not None:
+                self.db.execute('DELETE FROM bodies WHERE hash = ?', (body_hash,))
+                freed += row[0]
+        if freed:
+            self._add_body_bytes(-freed)
+
+    def _add_body_bytes(self, delta):
+        self.db.execute("UPDATE totals SET value = value + ? WHERE name = 'body_bytes'", (delta,))
+
+    def _flush_accessed(self):
+        """在当前写事务中批量更新访问时间"""
+        if not self._accessed:
+            return
+        accessed, self._accessed = self._accessed, {}
+        self.db.executemany(
+            'UPDATE responses SET accessed_at = ? WHERE spider = ? AND fingerprint = ?',
+            [(accessed_at, spider_name, fingerprint) for (spider_name, fingerprint), accessed_at in accessed.items()],
+        )
+
+    def _has_body(self, body_hash):
+        return self.db.execute('SELECT 1 FROM bodies WHERE hash = ?', (body_hash,)).fetchone() is not None
+
+    def _body_bytes(self):
+        return self.db.execute("SELECT value FROM totals WHERE name = 'body_bytes'").fetchone()[0]
+
+    def _load(self, spider_name, fingerprint):
+        return self.db.execute(
+            'SELECT r.status, r.response_url, r.headers, r.codec, b.data, b.codec, r.stored_at '
+            'FROM responses r JOIN bodies b ON b.hash = r.body_hash '
+            'WHERE r.spider = ? AND r.fingerprint = ?',
+            (spider_name, fingerprint),
+        ).fetchone()
+
+    def _fingerprint(self, request):
+        return self._fingerprinter.fingerprint(request)
+
+    @contextmanager
+    def _transaction(self):
+        """短写事务，开始时即获取写锁（BEGIN IMMEDIATE），避免读事务升级为写事务时死锁"""
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
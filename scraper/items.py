@@ -3,39 +3,117 @@
 数据项定义
 """
 
+import sys
 import scrapy
 from scrapy import Field
 
 
 class SteamGameItem(scrapy.Item):
-    """Steam游戏数据项"""
+    """Steam游戏数据项
+    
+    Field元数据 cleaner 指定清洗方式 (见 scraper.pipelines.data_cleaning.CLEANERS)，
+    None表示不需要清洗；validator 指定格式验证方式
+    (见 scraper.pipelines.data_validation.VALIDATORS)；normalizer 指定规范化
+    管道转换的类型 (见 scraper.pipelines.data_normalization.NORMALIZERS)，
+    默认与 cleaner 相同。
+    """
     # 排名信息
-    rank = Field()                    # 排名位置
-    rank_type = Field()               # 排名类型 (topsellers/popular/new)
+    rank = Field(cleaner=None)        # 排名位置
+    rank_type = Field(cleaner=None)   # 排名类型 (topsellers/popular/new)
     
     # 基本信息
-    name = Field()                    # 游戏名称
-    app_id = Field()                  # Steam应用ID
-    price = Field()                   # 当前价格
-    original_price = Field()          # 原价
-    discount_percent = Field()        # 折扣百分比
+    name = Field(validator='name')    # 游戏名称
+    app_id = Field(cleaner=None, validator='app_id')  # Steam应用ID
+    price = Field(cleaner='price', validator='price')  # 当前价格
+    original_price = Field(normalizer='price')  # 原价
+    discount_percent = Field(normalizer='number', validator='percent')  # 折扣百分比
     
     # 统计数据
-    peak_players = Field()            # 峰值在线人数
-    current_players = Field()         # 当前在线人数
-    positive_rate = Field()           # 好评率
-    total_reviews = Field()           # 总评论数
+    peak_players = Field(cleaner='number')     # 峰值在线人数
+    current_players = Field(cleaner='number')  # 当前在线人数
+    positive_rate = Field(cleaner='number', validator='percent')  # 好评率
+    total_reviews = Field(cleaner='number', validator='count')    # 总评论数
     
     # 详细信息
     developer = Field()               # 开发商
     publisher = Field()               # 发行商
-    release_date = Field()            # 发行日期
-    genres = Field()                  # 游戏类型
-    tags = Field()                    # 标签
+    release_date = Field(cleaner='date')  # 发行日期
+    genres = Field(cleaner=None)      # 游戏类型
+    tags = Field(cleaner=None)        # 标签
     
     # 系统信息
-    crawl_time = Field()              # 爬取时间
-    crawl_date = Field()              # 爬取日期
+    crawl_time = Field(cleaner=None, validator='datetime')  # 爬取时间
+    crawl_date = Field(cleaner=None, validator='date')      # 爬取日期
+
+
+class SteamGameRecord:
+    """等待详情页期间使用的紧凑Steam游戏记录
+    
+    分页抓取时大量半填充的数据项随详情页请求的meta在调度器中排队。
+    记录使用__slots__存储字段，重复率高的字符串（排名类型、开发商、
+    类型、标签等）经过sys.intern驻留，类型/标签存为元组。
+    提供与数据项相同的下标访问，产出到管道前用 to_item() 转换为SteamGameItem。
+    """
+    __slots__ = tuple(SteamGameItem.fields)
+    
+    # 驻留的字符串字段和字符串列表字段
+    INTERNED_FIELDS = frozenset(('rank_type', 'developer', 'publisher', 'crawl_date'))
+    INTERNED_LIST_FIELDS = frozenset(('genres', 'tags'))
+    
+    def __init__(self, **fields):
+        for field in self.__slots__:
+            object.__setattr__(self, field, None)
+        for field, value in fields.items():
+            self[field] = value
+    
+    @classmethod
+    def from_item(cls, item):
+        """由SteamGameItem创建记录"""
+        return cls(**item)
+    
+    def to_item(self):
+        """转换为SteamGameItem，未设置的字段不写入"""
+        item = SteamGameItem()
+        for field in self.__slots__:
+            value = getattr(self, field)
+            if value is None:
+                continue
+            if field in self.INTERNED_LIST_FIELDS:
+                value = list(value)
+            item[field] = value
+        return item
+    
+    def __getitem__(self, field):
+        if field not in SteamGameItem.fields:
+            raise KeyError(field)
+        value = getattr(self, field)
+        if value is None:
+            raise KeyError(field)
+        return value
+    
+    def __setitem__(self, field, value):
+        if field not in SteamGameItem.fields:
+            raise KeyError(f"{self.__class__.__name__} does not support field: {field}")
+        if value is not None:
+            if field in self.INTERNED_LIST_FIELDS:
+                value = tuple(sys.intern(v) if isinstance(v, str) else v for v in value)
+            elif field in self.INTERNED_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+        setattr(self, field, value)
+    
+    def __contains__(self, field):
+        return field in SteamGameItem.fields and getattr(self, field) is not None
+    
+    def get(self, field, default=None):
+        value = getattr(self, field, None) if field in SteamGameItem.fields else None
+        return default if value is None else value
+    
+    def update(self, fields):
+        for field, value in fields.items():
+            self[field] = value
+    
+    def __repr__(self):
+        return f"{self.__class__.__name__}(app_id={self.app_id!r}, name={self.name!r})"
 
 
 class MobileGameItem(scrapy.Item):
@@ -2,4 +2,8 @@
 """
 中间件模块
 """
-from .random_user_agent import RandomUserAgentMiddleware 
\ No newline at end of file
+from .random_user_agent import RandomUserAgentMiddleware
+from .proxy_pool import ProxyPoolMiddleware
+from .httpcache import RevalidatingHttpCacheMiddleware
+from .dynamic_render import DynamicRenderMiddleware
+from .age_gate import AgeGateMiddleware
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+年龄验证中间件
+
+成人内容游戏的详情页会被重定向到 /agecheck/app/<id>/ 或直接返回年龄验证页，
+浪费一次请求并得到不完整的数据项。这里为配置的域名预先设置年龄验证Cookie
+(birthtime、wants_mature_content 等)；仍然命中年龄验证时带上Cookie重试一次，
+并统计命中次数。年龄验证页由这里处理，不交给动态渲染；RevalidatingCachePolicy
+不缓存年龄验证响应（见 is_age_gate），重试得到的正常页面照常缓存。
+
+优先级需小于CookiesMiddleware (700)：请求先在这里附加Cookie再由其写入Cookie头；
+响应先在这里检查，再交给RedirectMiddleware (600) 跟随重定向。
+"""
+
+from urllib.parse import urlparse
+from scrapy.exceptions import NotConfigured
+from loguru import logger
+
+# 年龄验证页的标记
+AGE_GATE_PATH = '/agecheck/'
+AGE_GATE_BODY_MARKERS = (b'id="app_agegate"', b'agegate_birthday_selector')
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+
+
+def is_age_gate(response):
+    """响应是否为年龄验证页或跳转到年龄验证页的重定向"""
+    if AGE_GATE_PATH in response.url:
+        return True
+    if response.status in REDIRECT_CODES:
+        return AGE_GATE_PATH.encode() in response.headers.get('Location', b'')
+    return any(marker in response.body for marker in AGE_GATE_BODY_MARKERS)
+
+
+def age_gate_cookies(birthtime):
+    """通过Steam年龄验证所需的Cookie"""
+    return {
+        'birthtime': str(birthtime),
+        'lastagecheckage': '1-0-1990',
+        'wants_mature_content': '1',
+        'mature_content': '1',
+    }
+
+
+class AgeGateMiddleware:
+    """预置年龄验证Cookie并在命中年龄验证页时重试一次"""
+
+    def __init__(self, domains, birthtime=631152001, cookies_enabled=True, stats=None):
+        self.domains = frozenset(domains)
+        self.cookies = age_gate_cookies(birthtime)
+        self.cookie_header = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        self.cookies_enabled = cookies_enabled
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """从爬虫设置中创建中间件实例"""
+        settings = crawler.settings
+        if not settings.getbool('AGE_GATE_ENABLED', True):
+            raise NotConfigured('年龄验证中间件未启用 (AGE_GATE_ENABLED)')
+        return cls(
+            settings.getlist('AGE_GATE_DOMAINS', ['store.steampowered.com']),
+            birthtime=settings.getint('AGE_GATE_BIRTHTIME', 631152001),
+            cookies_enabled=settings.getbool('COOKIES_ENABLED'),
+            stats=crawler.stats,
+        )
+
+    def process_request(self, request, spider):
+        """为配置的域名附加年龄验证Cookie"""
+        if urlparse(request.url).hostname in self.domains:
+            self._seed(request)
+        return None
+
+    def process_response(self, request, response, spider):
+        """检测年龄验证页，带Cookie重试原始请求一次"""
+        if urlparse(request.url).hostname not in self.domains or not is_age_gate(response):
+            return response
+
+        self._inc_stat('age_gate/detected')
+        if request.meta.get('age_gate_retried'):
+            self._inc_stat('age_gate/failed')
+            logger.warning(f"重试后仍然命中年龄验证: {request.url}")
+            return response
+
+        self._inc_stat('age_gate/retried')
+        logger.debug(f"命中年龄验证，带Cookie重试: {request.url}")
+        # 已跟随重定向到年龄验证页时重试最初的页面
+        url = request.meta.get('redirect_urls', [request.url])[0]
+        retry_request = request.replace(url=url, dont_filter=True)
+        retry_request.meta['age_gate_retried'] = True
+        # Cookie头由CookiesMiddleware按Cookie罐重新生成，去掉旧值
+        retry_request.headers.pop('Cookie', None)
+        self._seed(retry_request, force=True)
+        return retry_request
+
+    def _seed(self, request, force=False):
+        if not self.cookies_enabled:
+            if force or b'birthtime=' not in request.headers.get('Cookie', b''):
+                cookie = request.headers.get('Cookie')
+                request.headers['Cookie'] = f"{cookie.decode()}; {self.cookie_header}" if cookie else self.cookie_header
+            return
+        cookies = request.cookies
+        if isinstance(cookies, dict):
+            if force or 'birthtime' not in cookies:
+                request.cookies = {**cookies, **self.cookies}
+        else:
+            # 列表形式的Cookie（带domain/path）
+            names = {cookie.get('name') for cookie in cookies}
+            if force or 'birthtime' not in names:
+                request.cookies = [cookie for cookie in cookies if cookie.get('name') not in self.cookies] + \
+                    [{'name': name, 'value': value, 'path': '/'} for name, value in self.cookies.items()]
+
+    def _inc_stat(self, key):
+        if self.stats is not None:
+            self.stats.inc_value(key)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+按需动态渲染中间件
+
+所有请求先走普通HTTP下载；只有响应命中检测规则（目标数据由JS填充等）
+或请求meta中 render=True 时，才从浏览器池借用Playwright页面重新获取并渲染。
+meta中 render=False 的请求从不渲染。
+渲染时按 DYNAMIC_RENDER_BLOCK_PROFILE 拦截图片、视频等资源；请求meta中的
+render_fragment（或规则的fragment）为CSS选择器时，响应只包含匹配的DOM片段。
+渲染结果带有 X-Dynamic-Render 头，被HTTP缓存保存后再次读取（包括304重新验证）
+时不会重复渲染；渲染后仍缺少数据的页面因此只渲染一次。
+
+Playwright是asyncio库，需要 TWISTED_REACTOR 为 AsyncioSelectorReactor。
+"""
+
+import re
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse
+from scrapy.utils.defer import deferred_from_coro
+from scrapy.utils.reactor import is_asyncio_reactor_installed
+from loguru import logger
+from scraper.utils.playwright_utils import BrowserPool, extract_fragment
+
+# 转发给浏览器的请求头（Cookie由CookiesMiddleware (700) 设置）
+FORWARDED_HEADERS = ('Accept-Language', 'Cookie', 'Referer')
+
+# 渲染结果的响应头，值为触发渲染的原因
+RENDERED_HEADER = 'X-Dynamic-Render'
+
+
+class RenderRule:
+    """动态渲染检测规则
+
+    url: 适用的URL正则
+    required: CSS选择器，匹配不到非空文本时说明数据由JS填充
+    when: CSS选择器，配置时只有页面匹配它（数据确实存在、由JS加载）才检查required
+    markers: 响应URL或正文中出现任一字符串时需要渲染
+             （年龄验证页由AgeGateMiddleware带Cookie重试，不需要配置渲染规则）
+    fragment: 渲染后只保留匹配该CSS选择器的DOM片段
+    """
+
+    def __init__(self, name, url, required=None, markers=(), fragment=None, when=None):
+        self.name = name
+        self.url = re.compile(url)
+        self.required = required
+        self.when = when
+        self.markers = tuple(markers)
+        self.fragment = fragment
+        self._body_markers = tuple(marker.encode() for marker in self.markers)
+
+    @classmethod
+    def from_setting(cls, rule):
+        return cls(
+            rule['name'], rule['url'], rule.get('required'), rule.get('markers', ()),
+            rule.get('fragment'), rule.get('when'),
+        )
+
+    def matches(self, response):
+        """返回响应是否需要渲染"""
+        if not self.url.search(response.url):
+            return False
+        if any(marker in response.url for marker in self.markers):
+            return True
+        if any(marker in response.body for marker in self._body_markers):
+            return True
+        if self.required:
+            if self.when and not response.css(self.when):
+                return False
+            text = response.css(self.required).xpath('normalize-space()').get()
+            return not text
+        return False
+
+
+class DynamicRenderMiddleware:
+    """按需动态渲染下载中间件
+
+    优先级应大于HttpCacheMiddleware (900)，渲染后的响应才会被缓存。
+    """
+
+    def __init__(self, pool, rules, timeout=30, wait_until='domcontentloaded', stats=None):
+        self.pool = pool
+        self.rules = rules
+        self.timeout_ms = int(timeout * 1000)
+        self.wait_until = wait_until
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """从爬虫设置中创建中间件实例"""
+        settings = crawler.settings
+        if not settings.getbool('DYNAMIC_RENDER_ENABLED'):
+            raise NotConfigured('动态渲染未启用 (DYNAMIC_RENDER_ENABLED)')
+        if not is_asyncio_reactor_installed():
+            raise NotConfigured('动态渲染需要 TWISTED_REACTOR = AsyncioSelectorReactor')
+
+        pool = BrowserPool(
+            settings.get('DYNAMIC_RENDER_BROWSER', 'chromium'),
+            max_browsers=settings.getint('DYNAMIC_RENDER_MAX_BROWSERS', 1),
+            contexts_per_browser=settings.getint('DYNAMIC_RENDER_CONTEXTS_PER_BROWSER', 4),
+            max_uses=settings.getint('DYNAMIC_RENDER_MAX_USES', 50),
+            max_memory_mb=settings.getint('DYNAMIC_RENDER_MAX_MEMORY_MB', 512),
+            warm_contexts=0,  # 第一次需要渲染时才启动浏览器
+            block_profile=settings.get('DYNAMIC_RENDER_BLOCK_PROFILE', 'light'),
+        )
+        rules = [RenderRule.from_setting(rule) for rule in settings.getlist('DYNAMIC_RENDER_RULES')]
+        middleware = cls(
+            pool,
+            rules,
+            timeout=settings.getfloat('DYNAMIC_RENDER_TIMEOUT', 30),
+            wait_until=settings.get('DYNAMIC_RENDER_WAIT_UNTIL', 'domcontentloaded'),
+            stats=crawler.stats,
+        )
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_closed(self, spider):
+        """关闭浏览器池"""
+        profile = self.pool.block_profile
+        if profile is not None and self.stats is not None:
+            self.stats.set_value('dynamic_render/blocked_requests', profile.blocked)
+            self.stats.set_value('dynamic_render/allowed_requests', profile.allowed)
+        return deferred_from_coro(self.pool.shutdown())
+
+    def process_request(self, request, spider):
+        """meta中 render=True 的请求直接渲染，失败时回退到普通下载"""
+        if request.meta.get('render') is True:
+            return deferred_from_coro(self._render(request, 'meta', fallback=None))
+        return None
+
+    def process_response(self, request, response, spider):
+        """检测需要渲染的响应并重新获取"""
+        if request.meta.get('render') is not None or 'rendered' in response.flags:
+            return response  # 已明确指定是否渲染（render=True在process_request中已尝试）
+        if RENDERED_HEADER in response.headers:
+            return response  # 缓存中的渲染结果
+        if response.status != 200 or not isinstance(response, HtmlResponse):
+            return response  # 重定向等交给后续中间件，跟随后的页面再检测
+        rule = self.match(response)
+        if rule is None:
+            return response
+        return deferred_from_coro(self._render(request, rule.name, fallback=response, fragment=rule.fragment))
+
+    def match(self, response):
+        """返回命中的检测规则"""
+        for rule in self.rules:
+            if rule.matches(response):
+                return rule
+        return None
+
+    async def _render(self, request, reason, fallback, fragment=None):
+        """用浏览器池中的页面获取并渲染请求，失败时返回fallback"""
+        fragment = request.meta.get('render_fragment', fragment)
+        self._inc_stat('dynamic_render/requests')
+        self._inc_stat(f'dynamic_render/reason/{reason}')
+        # 被重定向时渲染最初请求的页面
+        url = request.meta.get('redirect_urls', [request.url])[0]
+        headers = {}
+        for name in FORWARDED_HEADERS:
+            value = request.headers.get(name)
+            if value:
+                headers[name] = value.decode('latin-1')
+        try:
+            async with self.pool.page() as page:
+                await page.set_extra_http_headers(headers)
+                result = await page.goto(url, wait_until=self.wait_until, timeout=self.timeout_ms)
+                selector = request.meta.get('render_wait_for')
+                if selector:
+                    await page.wait_for_selector(selector, timeout=self.timeout_ms)
+                body = await extract_fragment(page, fragment) if fragment else None
+                if body is None:
+                    body = await page.content()
+                rendered_url = page.url
+        except Exception as e:
+            self._inc_stat('dynamic_render/failed')
+            logger.warning(f"动态渲染失败 ({reason}): {request.url} - {e}")
+            return fallback
+
+        logger.debug(f"动态渲染 ({reason}): {request.url}")
+        return HtmlResponse(
+            rendered_url,
+            status=result.status if result is not None else 200,
+            body=body,
+            headers={RENDERED_HEADER: reason},
+            encoding='utf-8',
+            request=request,
+            flags=['rendered'],
+        )
+
+    def _inc_stat(self, key):
+        if self.stats is not None:
+            self.stats.inc_value(key)
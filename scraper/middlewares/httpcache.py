@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+条件重新验证HTTP缓存中间件
+
+Scrapy的HttpCacheMiddleware在304时返回旧的缓存响应，但不更新缓存条目，
+之后每次请求都要重新验证。这里在304时把响应中的新头（Date、ETag、
+Cache-Control等）合并到缓存响应并写回存储，重新开始计算缓存年龄，
+并统计条件请求中304的比例和节省的下载字节数。
+"""
+
+from email.utils import formatdate
+from scrapy.downloadermiddlewares.httpcache import HttpCacheMiddleware
+from loguru import logger
+
+# 304响应中这些头描述的是空响应体本身，不能覆盖缓存响应的对应头
+NOT_MODIFIED_SKIP_HEADERS = {b'Content-Length', b'Content-Encoding', b'Content-Type', b'Transfer-Encoding'}
+
+
+class RevalidatingHttpCacheMiddleware(HttpCacheMiddleware):
+    """在304时刷新缓存条目的HTTP缓存中间件
+
+    替换 scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware (900)，
+    配合 HTTPCACHE_POLICY = 'scraper.extensions.httpcache.RevalidatingCachePolicy' 使用。
+    """
+
+    def spider_closed(self, spider):
+        conditional = self.stats.get_value('httpcache/conditional', 0, spider=spider)
+        if conditional:
+            not_modified = self.stats.get_value('httpcache/not_modified', 0, spider=spider)
+            self.stats.set_value('httpcache/not_modified_ratio', round(not_modified / conditional, 4), spider=spider)
+            saved = self.stats.get_value('httpcache/not_modified_bytes', 0, spider=spider)
+            logger.info(
+                f"HTTP缓存重新验证: 条件请求 {conditional} 个, 304 {not_modified} 个 "
+                f"({not_modified / conditional:.1%}), 节省下载 {saved / 1024 / 1024:.1f} MB"
+            )
+        super().spider_closed(spider)
+
+    def process_response(self, request, response, spider):
+        cachedresponse = request.meta.get('cached_response')
+        if cachedresponse is None or request.meta.get('dont_cache', False) or 'cached' in response.flags:
+            return super().process_response(request, response, spider)
+
+        if b'If-None-Match' in request.headers or b'If-Modified-Since' in request.headers:
+            self.stats.inc_value('httpcache/conditional', spider=spider)
+        if response.status != 304:
+            return super().process_response(request, response, spider)
+
+        request.meta.pop('cached_response')
+        refreshed = self._refresh(cachedresponse, response)
+        self.stats.inc_value('httpcache/not_modified', spider=spider)
+        self.stats.inc_value('httpcache/not_modified_bytes', len(cachedresponse.body), spider=spider)
+        self.storage.store_response(spider, request, refreshed)
+        return refreshed
+
+    @staticmethod
+    def _refresh(cachedresponse, response):
+        """把304响应的头合并到缓存响应 (RFC 7234 4.3.4)"""
+        headers = cachedresponse.headers.copy()
+        for name, values in response.headers.items():
+            if name not in NOT_MODIFIED_SKIP_HEADERS:
+                headers.setlist(name, values)
+        if b'Date' not in response.headers:
+            headers[b'Date'] = formatdate(usegmt=True)
+        return cachedresponse.replace(headers=headers)
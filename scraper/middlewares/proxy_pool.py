@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+代理池中间件
+
+从PROXY_LIST_FILE加载代理，按代理记录成功率、封禁响应 (429/403) 和
+下载延迟的指数移动平均，按"健康度/延迟"加权选择代理；
+每个代理使用独立的下载槽 (download_slot) 并限制并发，
+连续失败的代理按指数退避隔离一段时间。
+"""
+
+import os
+import time
+import random
+from urllib.parse import urlparse
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from loguru import logger
+from scraper.middlewares.dynamic_render import RENDERED_HEADER
+
+
+class ProxyState:
+    """单个代理的健康状态"""
+    __slots__ = ('url', 'slot', 'successes', 'failures', 'bans', 'latency',
+                 'active', 'consecutive_failures', 'quarantined_until')
+
+    def __init__(self, url, initial_latency=1.0):
+        self.url = url
+        self.slot = f'proxy:{urlparse(url).netloc.rpartition("@")[2]}'
+        self.successes = 0
+        self.failures = 0
+        self.bans = 0
+        self.latency = initial_latency  # 延迟EWMA（秒），新代理使用乐观初值以便被尝试
+        self.active = 0                 # 已分配但尚未完成的请求数
+        self.consecutive_failures = 0
+        self.quarantined_until = 0.0
+
+    @property
+    def health(self):
+        """平滑后的成功率 (拉普拉斯平滑，新代理为0.5)"""
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    @property
+    def weight(self):
+        return self.health ** 2 / max(self.latency, 0.05)
+
+    def available(self, now):
+        return now >= self.quarantined_until
+
+
+class ProxyPool:
+    """代理池：加权选择、健康统计和隔离"""
+
+    def __init__(self, proxies, mode=0, max_concurrency=2, latency_alpha=0.3,
+                 quarantine_base=30, quarantine_max=1800, rng=None, clock=time.monotonic):
+        self.proxies = [ProxyState(url) for url in dict.fromkeys(proxies)]
+        self.by_url = {proxy.url: proxy for proxy in self.proxies}
+        self.mode = mode  # 0=加权随机, 1=轮询
+        self.max_concurrency = max_concurrency
+        self.latency_alpha = latency_alpha
+        self.quarantine_base = quarantine_base
+        self.quarantine_max = quarantine_max
+        self.rng = rng or random.Random()
+        self.clock = clock
+        self._cursor = 0
+
+    def __len__(self):
+        return len(self.proxies)
+
+    def choose(self):
+        """选择代理并占用一个并发名额"""
+        now = self.clock()
+        available = [proxy for proxy in self.proxies if proxy.available(now)]
+        if not available:
+            # 全部处于隔离期时使用最早解除隔离的代理，不直连暴露本机IP
+            proxy = min(self.proxies, key=lambda p: p.quarantined_until)
+        else:
+            candidates = [proxy for proxy in available if proxy.active < self.max_concurrency]
+            if not candidates:
+                # 全部满载时排队到负载最低的代理（下载槽限制实际并发）
+                proxy = min(available, key=lambda p: p.active / p.weight)
+            elif self.mode == 1:
+                proxy = candidates[self._cursor % len(candidates)]
+                self._cursor += 1
+            else:
+                proxy = self.rng.choices(candidates, weights=[p.weight for p in candidates])[0]
+        proxy.active += 1
+        return proxy
+
+    def release(self, proxy):
+        proxy.active = max(0, proxy.active - 1)
+
+    def record_success(self, proxy, latency):
+        proxy.successes += 1
+        proxy.consecutive_failures = 0
+        if latency is not None:
+            proxy.latency += self.latency_alpha * (latency - proxy.latency)
+
+    def record_failure(self, proxy, ban=False):
+        """记录失败并按连续失败次数指数退避隔离，返回隔离秒数"""
+        proxy.failures += 1
+        proxy.bans += ban
+        proxy.consecutive_failures += 1
+        duration = min(self.quarantine_max, self.quarantine_base * 2 ** (proxy.consecutive_failures - 1))
+        proxy.quarantined_until = self.clock() + duration
+        return duration
+
+    def available_count(self):
+        now = self.clock()
+        return sum(proxy.available(now) for proxy in self.proxies)
+
+
+def load_proxy_list(path):
+    """读取代理列表文件，忽略空行和注释"""
+    proxies = []
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    proxies.append(line)
+    return proxies
+
+
+class ProxyPoolMiddleware:
+    """代理池下载中间件
+
+    优先级需小于HttpProxyMiddleware (750)，以便代理URL中的认证信息被处理。
+    请求meta中已手动指定proxy的请求不经过代理池。
+    """
+
+    def __init__(self, pool, ban_codes=(403, 429), ban_retry_times=3, stats=None):
+        self.pool = pool
+        self.ban_codes = {int(code) for code in ban_codes}
+        self.ban_retry_times = ban_retry_times
+        self.stats = stats
+        self.crawler = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        """从爬虫设置中创建中间件实例"""
+        settings = crawler.settings
+        if not settings.getbool('PROXY_ENABLED'):
+            raise NotConfigured('代理池未启用 (PROXY_ENABLED)')
+
+        proxies = load_proxy_list(settings.get('PROXY_LIST_FILE'))
+        if not proxies:
+            raise NotConfigured(f"代理列表为空: {settings.get('PROXY_LIST_FILE')}")
+
+        pool = ProxyPool(
+            proxies,
+            mode=settings.getint('PROXY_MODE', 0),
+            max_concurrency=settings.getint('PROXY_MAX_CONCURRENCY', 2),
+            latency_alpha=settings.getfloat('PROXY_LATENCY_ALPHA', 0.3),
+            quarantine_base=settings.getfloat('PROXY_QUARANTINE_BASE', 30),
+            quarantine_max=settings.getfloat('PROXY_QUARANTINE_MAX', 1800),
+        )
+        middleware = cls(
+            pool,
+            ban_codes=settings.getlist('PROXY_BAN_CODES', [403, 429]),
+            ban_retry_times=settings.getint('PROXY_BAN_RETRY_TIMES', 3),
+            stats=crawler.stats,
+        )
+        middleware.crawler = crawler
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider):
+        """爬虫开启时为每个代理的下载槽设置并发上限"""
+        downloader = self.crawler.engine.downloader if self.crawler and self.crawler.engine else None
+        slot_settings = getattr(downloader, 'per_slot_settings', None)
+        if slot_settings is not None:
+            for proxy in self.pool.proxies:
+                slot_settings.setdefault(proxy.slot, {}).setdefault('concurrency', self.pool.max_concurrency)
+        logger.info(f"使用代理池中间件，共加载 {len(self.pool)} 个代理，每个代理并发 {self.pool.max_concurrency}")
+
+    def spider_closed(self, spider):
+        """爬虫结束时输出各代理的健康状态"""
+        for proxy in sorted(self.pool.proxies, key=lambda p: -p.weight):
+            logger.info(
+                f"代理 {proxy.slot}: 成功 {proxy.successes}, 失败 {proxy.failures} (封禁 {proxy.bans}), "
+                f"延迟 {proxy.latency:.2f}s"
+            )
+
+    def process_request(self, request, spider):
+        """为请求分配代理"""
+        if request.meta.get('proxy') and 'pool_proxy' not in request.meta:
+            return None  # 手动指定的代理
+        proxy = self.pool.choose()
+        request.meta['proxy'] = proxy.url
+        request.meta['pool_proxy'] = proxy.url
+        request.meta['download_slot'] = proxy.slot
+        self._inc_stat('proxy_pool/assigned')
+        return None
+
+    def process_response(self, request, response, spider):
+        """根据响应更新代理健康度，封禁时换代理重试"""
+        proxy = self._release(request)
+        if proxy is None:
+            return response
+        if 'cached' in response.flags:
+            # HTTP缓存命中，请求没有经过代理，不计入代理健康度
+            self._inc_stat('proxy_pool/cached')
+            return response
+        if 'rendered' in response.flags or RENDERED_HEADER in response.headers:
+            # 浏览器渲染的响应不经过代理，状态码和耗时与代理无关
+            self._inc_stat('proxy_pool/rendered')
+            return response
+
+        if response.status in self.ban_codes:
+            duration = self.pool.record_failure(proxy, ban=True)
+            self._inc_stat('proxy_pool/banned')
+            logger.warning(f"代理 {proxy.slot} 被封禁 (HTTP {response.status})，隔离 {duration:.0f} 秒")
+            retries = request.meta.get('proxy_ban_retry_times', 0)
+            if retries < self.ban_retry_times:
+                retry_request = request.copy()
+                retry_request.meta['proxy_ban_retry_times'] = retries + 1
+                retry_request.dont_filter = True
+                return retry_request
+            return response
+
+        self.pool.record_success(proxy, request.meta.get('download_latency'))
+        return response
+
+    def process_exception(self, request, exception, spider):
+        """下载异常计为代理失败，交给RetryMiddleware重试（重试时重新选择代理）"""
+        proxy = self._release(request)
+        if proxy is not None:
+            duration = self.pool.record_failure(proxy)
+            self._inc_stat('proxy_pool/failures')
+            logger.debug(f"代理 {proxy.slot} 请求异常 ({exception.__class__.__name__})，隔离 {duration:.0f} 秒")
+        return None
+
+    def _release(self, request):
+        """释放请求占用的代理名额，返回对应的代理状态"""
+        proxy = self.pool.by_url.get(request.meta.get('pool_proxy'))
+        if proxy is not None:
+            self.pool.release(proxy)
+        return proxy
+
+    def _inc_stat(self, key):
+        if self.stats is not None:
+            self.stats.inc_value(key)
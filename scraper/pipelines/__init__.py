@@ -4,5 +4,6 @@
 """
 from .data_cleaning import DataCleaningPipeline
 from .data_validation import DataValidationPipeline
+from .data_normalization import DataNormalizationPipeline
 from .mongodb_pipeline import MongoDBPipeline
 from .mysql_pipeline import MySQLPipeline 
\ No newline at end of file
@@ -1,114 +1,126 @@
 # -*- coding: utf-8 -*-
 """
 数据清洗管道
+
+每个字段的清洗方式由数据项类的Field元数据 ``cleaner`` 声明：
+未声明时按普通文本清洗，声明为None时跳过。清洗函数和正则在模块
+加载时编译一次，每个数据项类的清洗计划只生成一次，数据项只遍历一遍。
 """
 
 import re
-from datetime import datetime
+from itemadapter import ItemAdapter
 from scrapy.exceptions import DropItem
 
 
+# 多余空白字符
+WHITESPACE_RE = re.compile(r'\s+')
+# 特殊字符
+SPECIAL_CHARS_RE = re.compile(r'[^\w\s\u4e00-\u9fff\-\.\,\!\?\(\)\[\]\{\}]')
+# 需要清洗的文本（非空格空白、连续空格或特殊字符），不匹配时只需去除首尾空白
+DIRTY_TEXT_RE = re.compile(r'[^\S ]|  |[^\w\s\u4e00-\u9fff\-\.\,\!\?\(\)\[\]\{\}]')
+
+PRICE_RE = re.compile(r'[\d,]+\.?\d*')
+NUMBER_RE = re.compile(r'[\d,]+')
+DATE_RE = re.compile(
+    r'(\d{4})年(\d{1,2})月(\d{1,2})日'
+    r'|(\d{4})-(\d{1,2})-(\d{1,2})'
+    r'|(\d{4})/(\d{1,2})/(\d{1,2})'
+)
+
+
+def clean_text(text):
+    """清理字符串：去除首尾空白、合并空白字符、去除特殊字符"""
+    text = text.strip()
+    if DIRTY_TEXT_RE.search(text) is None:
+        return text
+    text = WHITESPACE_RE.sub(' ', text)
+    return SPECIAL_CHARS_RE.sub('', text)
+
+
+def clean_price(text):
+    """格式化价格，提取数字部分"""
+    text = clean_text(text)
+    match = PRICE_RE.search(text)
+    return match.group() if match else text
+
+
+def clean_number(text):
+    """格式化数字，去除千分位"""
+    text = clean_text(text)
+    match = NUMBER_RE.search(text)
+    return match.group().replace(',', '') if match else text
+
+
+def clean_date(text):
+    """格式化日期为 YYYY-MM-DD"""
+    text = clean_text(text)
+    match = DATE_RE.search(text)
+    if not match:
+        return text
+    year, month, day = [group for group in match.groups() if group is not None]
+    return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
+
+
+# 清洗函数注册表 (Field元数据 cleaner -> 清洗函数)
+CLEANERS = {
+    'text': clean_text,
+    'price': clean_price,
+    'number': clean_number,
+    'date': clean_date,
+}
+
+
 class DataCleaningPipeline:
     """数据清洗管道"""
     
+    required_fields = ('name', 'crawl_time', 'crawl_date')
+    
+    def __init__(self):
+        self._plans = {}  # 数据项类 -> [(字段, 清洗函数)]
+    
     def process_item(self, item, spider):
         """清洗数据项"""
-        # 清理字符串字段
-        for field in item.fields:
-            if field in item and isinstance(item[field], str):
-                item[field] = self._clean_string(item[field])
+        values = ItemAdapter(item)
+        for field, cleaner in self._get_plan(item):
+            value = values.get(field)
+            if value and isinstance(value, str):
+                values[field] = cleaner(value)
         
         # 验证必要字段
         if not self._validate_required_fields(item):
             raise DropItem(f"缺少必要字段: {item}")
         
-        # 数据格式化
-        self._format_data(item)
-        
         return item
     
-    def _clean_string(self, text):
-        """清理字符串"""
-        if not text:
-            return text
-        
-        # 去除首尾空白
-        text = text.strip()
-        
-        # 去除多余空白字符
-        text = re.sub(r'\s+', ' ', text)
-        
-        # 去除特殊字符
-        text = re.sub(r'[^\w\s\u4e00-\u9fff\-\.\,\!\?\(\)\[\]\{\}]', '', text)
-        
-        return text
+    def _get_plan(self, item):
+        """获取数据项类的清洗计划"""
+        fields = getattr(item, 'fields', None)
+        if fields is None:
+            # 普通字典没有字段声明，所有字段按普通文本清洗
+            return [(field, clean_text) for field in item]
+        
+        item_class = type(item)
+        plan = self._plans.get(item_class)
+        if plan is None:
+            plan = self._plans[item_class] = self._build_plan(fields)
+        return plan
+    
+    def _build_plan(self, fields):
+        """根据Field元数据生成清洗计划"""
+        plan = []
+        for field, meta in fields.items():
+            name = meta.get('cleaner', 'text')
+            if name is None:
+                continue
+            if name not in CLEANERS:
+                raise ValueError(f"未注册的清洗方式: {field} -> {name}")
+            plan.append((field, CLEANERS[name]))
+        return plan
     
     def _validate_required_fields(self, item):
         """验证必要字段"""
-        required_fields = ['name', 'crawl_time', 'crawl_date']
-        
-        for field in required_fields:
-            if field not in item or not item[field]:
+        for field in self.required_fields:
+            if not item.get(field):
                 return False
         
         return True
-    
-    def _format_data(self, item):
-        """格式化数据"""
-        # 格式化价格
-        if 'price' in item and item['price']:
-            item['price'] = self._format_price(item['price'])
-        
-        # 格式化数字字段
-        numeric_fields = ['peak_players', 'current_players', 'positive_rate', 'total_reviews']
-        for field in numeric_fields:
-            if field in item and item[field]:
-                item[field] = self._format_number(item[field])
-        
-        # 格式化日期
-        if 'release_date' in item and item['release_date']:
-            item['release_date'] = self._format_date(item['release_date'])
-    
-    def _format_price(self, price_str):
-        """格式化价格"""
-        if not price_str:
-            return price_str
-        
-        # 提取数字
-        match = re.search(r'[\d,]+\.?\d*', price_str)
-        if match:
-            return match.group()
-        
-        return price_str
-    
-    def _format_number(self, num_str):
-        """格式化数字"""
-        if not num_str:
-            return num_str
-        
-        # 提取数字
-        match = re.search(r'[\d,]+', str(num_str))
-        if match:
-            return match.group().replace(',', '')
-        
-        return num_str
-    
-    def _format_date(self, date_str):
-        """格式化日期"""
-        if not date_str:
-            return date_str
-        
-        # 尝试解析常见日期格式
-        date_patterns = [
-            r'(\d{4})年(\d{1,2})月(\d{1,2})日',
-            r'(\d{4})-(\d{1,2})-(\d{1,2})',
-            r'(\d{4})/(\d{1,2})/(\d{1,2})',
-        ]
-        
-        for pattern in date_patterns:
-            match = re.search(pattern, date_str)
-            if match:
-                year, month, day = match.groups()
-                return f"{year}-{month.zfill(2)}-{day.zfill(2)}"
-        
-        return date_str 
\ No newline at end of file
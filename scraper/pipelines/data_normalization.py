@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+数据规范化管道（清洗+验证合并）
+
+每个字段只解析一次：价格转为Decimal，计数转为int，发行日期转为
+datetime.date，文本按普通规则清洗；随后直接在类型化的值上做范围验证。
+后续管道和两个存储后端直接使用这些类型化的值，不再重复解析字符串。
+字段的处理方式沿用Field元数据 ``cleaner`` / ``validator`` 的声明，
+``normalizer`` 可单独指定规范化方式（默认与 ``cleaner`` 相同）。
+"""
+
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from itemadapter import ItemAdapter
+from scrapy.exceptions import DropItem
+from .data_cleaning import clean_text, PRICE_RE, NUMBER_RE, DATE_RE
+from .data_validation import DataValidationPipeline, CompiledValidator, VALIDATORS
+
+
+FREE_PRICE = Decimal('0.00')
+# 中文日期以外，Steam英文页面使用的日期格式
+FALLBACK_DATE_FORMATS = ('%d %b, %Y', '%b %d, %Y', '%d %B, %Y', '%B %d, %Y')
+
+
+def to_decimal(text):
+    """解析价格为Decimal，免费游戏为0"""
+    if '免费' in text or 'Free' in text:
+        return FREE_PRICE
+    match = PRICE_RE.search(text)
+    if not match:
+        raise ValueError(f"无法解析价格: {text}")
+    try:
+        return Decimal(match.group().replace(',', ''))
+    except InvalidOperation:
+        raise ValueError(f"无法解析价格: {text}")
+
+
+def to_int(text):
+    """解析计数为int，去除千分位"""
+    match = NUMBER_RE.search(text)
+    if not match:
+        raise ValueError(f"无法解析数字: {text}")
+    digits = match.group().replace(',', '')
+    if not digits:
+        raise ValueError(f"无法解析数字: {text}")
+    return int(digits)
+
+
+def to_date(text):
+    """解析日期为datetime.date"""
+    match = DATE_RE.search(text)
+    if match:
+        year, month, day = [group for group in match.groups() if group is not None]
+        return date(int(year), int(month), int(day))
+    text = text.strip()
+    for date_format in FALLBACK_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"无法解析日期: {text}")
+
+
+# 规范化函数注册表 (Field元数据 normalizer/cleaner -> 规范化函数)
+NORMALIZERS = {
+    'text': clean_text,
+    'price': to_decimal,
+    'number': to_int,
+    'date': to_date,
+}
+
+# 类型化值的验证函数，未列出的沿用字符串验证函数
+TYPED_VALIDATORS = dict(VALIDATORS)
+TYPED_VALIDATORS.update({
+    'price': lambda value: isinstance(value, Decimal) and value >= 0,
+    'percent': lambda value: isinstance(value, int) and 0 <= value <= 100,
+    'count': lambda value: isinstance(value, int) and value >= 0,
+})
+
+
+class NormalizingValidator(CompiledValidator):
+    """编译后的规范化验证器，一次遍历完成类型转换和验证"""
+    
+    def __init__(self, required_fields, steps):
+        super().__init__(required_fields, ())
+        self.steps = tuple(steps)  # ((字段, 规范化函数, 验证函数), ...)
+    
+    def validate(self, item):
+        """就地规范化数据项，返回错误列表 [(字段, 错误类型)]"""
+        values = ItemAdapter(item)
+        errors = []
+        for field, normalize, check in self.steps:
+            value = values.get(field)
+            if value is None:
+                continue
+            if normalize is not None and isinstance(value, str):
+                try:
+                    value = values[field] = normalize(value)
+                except ValueError:
+                    # 无法解析的可选字段置空，不把原始字符串传给存储后端
+                    del values[field]
+                    errors.append((field, 'invalid'))
+                    continue
+            if check is not None and not check(value):
+                errors.append((field, 'invalid'))
+        for field in self.required_fields:
+            value = values.get(field)
+            if value is None or str(value).strip() == '':
+                errors.append((field, 'missing'))
+        return errors
+
+
+class DataNormalizationPipeline(DataValidationPipeline):
+    """数据规范化管道，替代先验证后清洗的两个管道"""
+    
+    def _compile(self, required_fields, fields):
+        """根据Field元数据编译规范化验证器"""
+        steps = []
+        for field, meta in fields.items():
+            normalizer_name = meta.get('normalizer', meta.get('cleaner', 'text'))
+            validator_name = meta.get('validator')
+            if normalizer_name is not None and normalizer_name not in NORMALIZERS:
+                raise ValueError(f"未注册的清洗方式: {field} -> {normalizer_name}")
+            if validator_name is not None and validator_name not in TYPED_VALIDATORS:
+                raise ValueError(f"未注册的验证方式: {field} -> {validator_name}")
+            normalize = NORMALIZERS[normalizer_name] if normalizer_name else None
+            check = TYPED_VALIDATORS[validator_name] if validator_name else None
+            if normalize is not None or check is not None:
+                steps.append((field, normalize, check))
+        if not fields:
+            # 普通字典没有字段声明，只检查必填字段
+            return CompiledValidator(required_fields, ())
+        return NormalizingValidator(required_fields, steps)
@@ -1,138 +1,205 @@
 # -*- coding: utf-8 -*-
 """
 数据验证管道
+
+字段格式规则由数据项类的Field元数据 ``validator`` 声明，必填字段按爬虫配置。
+两者在每个爬虫第一次处理数据项时编译为一个验证器并缓存；正则预编译并
+合并为单个分支表达式，数字和日期先走廉价的快速路径。验证失败按字段计入
+Scrapy统计，爬虫结束时输出一行汇总，不再逐条打印警告。
 """
 
 import re
-from datetime import datetime
+from collections import Counter
+from datetime import date, datetime
+from itemadapter import ItemAdapter
 from scrapy.exceptions import DropItem
 from loguru import logger
 
 
+APP_ID_RE = re.compile(r'\d+')
+# 支持免费、人民币、美元等价格格式
+PRICE_RE = re.compile(
+    r'免费'
+    r'|¥\s*\d+(?:\.\d{2})?'
+    r'|\$\s*\d+(?:\.\d{2})?'
+    r'|\d+(?:\.\d{2})?\s*元'
+    r'|\d+(?:\.\d{2})?\s*USD'
+)
+DATE_RE = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})')
+ISO_DATETIME_RE = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d{1,6})?')
+
+
+def validate_name(value):
+    """验证游戏名称"""
+    return isinstance(value, str) and 1 <= len(value.strip()) <= 200
+
+
+def validate_app_id(value):
+    """验证Steam应用ID"""
+    return isinstance(value, str) and APP_ID_RE.fullmatch(value) is not None
+
+
+def validate_price(value):
+    """验证价格格式"""
+    return isinstance(value, str) and PRICE_RE.fullmatch(value.strip()) is not None
+
+
+def validate_percent(value):
+    """验证0-100的百分比（折扣、好评率）"""
+    if not isinstance(value, str):
+        return False
+    if value.isascii() and value.isdigit():
+        return int(value) <= 100
+    try:
+        return 0 <= int(value) <= 100
+    except ValueError:
+        return False
+
+
+def validate_count(value):
+    """验证非负计数（评论数量）"""
+    if not isinstance(value, str):
+        return False
+    value = value.replace(',', '')
+    if value.isascii() and value.isdigit():
+        return True
+    try:
+        return int(value) >= 0
+    except ValueError:
+        return False
+
+
+def validate_datetime(value):
+    """验证ISO日期时间格式"""
+    if not isinstance(value, str):
+        return False
+    if ISO_DATETIME_RE.fullmatch(value):
+        return True
+    try:
+        datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return True
+    except ValueError:
+        return False
+
+
+def validate_date(value):
+    """验证 YYYY-MM-DD 日期格式"""
+    if not isinstance(value, str):
+        return False
+    match = DATE_RE.fullmatch(value)
+    if not match:
+        return False
+    try:
+        date(*map(int, match.groups()))
+        return True
+    except ValueError:
+        return False
+
+
+# 格式验证函数注册表 (Field元数据 validator -> 验证函数)
+VALIDATORS = {
+    'name': validate_name,
+    'app_id': validate_app_id,
+    'price': validate_price,
+    'percent': validate_percent,
+    'count': validate_count,
+    'datetime': validate_datetime,
+    'date': validate_date,
+}
+
+
+class CompiledValidator:
+    """编译后的验证器，对应一个爬虫和一个数据项类"""
+    
+    def __init__(self, required_fields, checks):
+        self.required_fields = tuple(required_fields)
+        self.checks = tuple(checks)  # ((字段, 验证函数, 是否必填), ...)
+    
+    def validate(self, item):
+        """返回错误列表 [(字段, 错误类型)]，错误类型为 missing 或 invalid"""
+        values = ItemAdapter(item)
+        errors = []
+        for field in self.required_fields:
+            value = values.get(field)
+            if value is None or str(value).strip() == '':
+                errors.append((field, 'missing'))
+        for field, check, required in self.checks:
+            value = values.get(field)
+            if value is not None and not check(value):
+                errors.append((field, 'invalid'))
+        return errors
+
+
 class DataValidationPipeline:
     """数据验证管道"""
     
-    def __init__(self):
+    default_required_fields = ('name', 'crawl_time', 'crawl_date')
+    
+    def __init__(self, stats=None):
         """初始化验证器"""
+        self.stats = stats
         self.required_fields = {
-            'steam_top_sellers': ['name', 'app_id', 'crawl_time', 'crawl_date'],
-            'steam_popular': ['name', 'app_id', 'crawl_time', 'crawl_date'],
-        }
-        
-        self.field_validators = {
-            'name': self._validate_name,
-            'app_id': self._validate_app_id,
-            'price': self._validate_price,
-            'discount_percent': self._validate_discount,
-            'positive_rate': self._validate_positive_rate,
-            'total_reviews': self._validate_reviews,
-            'crawl_time': self._validate_datetime,
-            'crawl_date': self._validate_date,
+            'steam_top_sellers': ('name', 'app_id', 'crawl_time', 'crawl_date'),
+            'steam_popular': ('name', 'app_id', 'crawl_time', 'crawl_date'),
         }
+        self._validators = {}     # (爬虫名, 数据项类) -> CompiledValidator
+        self.error_counts = {}    # 爬虫名 -> Counter((字段, 错误类型))
+    
+    @classmethod
+    def from_crawler(cls, crawler):
+        """从爬虫设置中创建管道实例"""
+        return cls(crawler.stats)
     
     def process_item(self, item, spider):
         """验证数据项"""
-        try:
-            # 获取爬虫特定的必填字段
-            required_fields = self.required_fields.get(spider.name, ['name', 'crawl_time', 'crawl_date'])
-            
-            # 验证必填字段
-            for field in required_fields:
-                if not self._validate_required_field(item, field):
-                    raise DropItem(f"缺少必填字段: {field}")
-            
-            # 验证字段格式
-            for field, value in item.items():
-                if field in self.field_validators and value is not None:
-                    if not self.field_validators[field](value):
-                        logger.warning(f"字段 {field} 格式无效: {value}")
-                        # 对于非关键字段，只记录警告，不丢弃数据
-                        if field in required_fields:
-                            raise DropItem(f"字段 {field} 格式无效: {value}")
-            
-            logger.debug(f"数据验证通过: {item.get('name', 'Unknown')}")
+        validator = self._get_validator(spider.name, item)
+        errors = validator.validate(item)
+        if not errors:
             return item
-            
-        except Exception as e:
-            logger.error(f"数据验证失败: {e}")
-            raise DropItem(f"数据验证失败: {e}")
-    
-    def _validate_required_field(self, item, field):
-        """验证必填字段是否存在且不为空"""
-        return field in item and item[field] is not None and str(item[field]).strip() != ''
-    
-    def _validate_name(self, value):
-        """验证游戏名称"""
-        if not isinstance(value, str):
-            return False
-        return len(value.strip()) >= 1 and len(value.strip()) <= 200
-    
-    def _validate_app_id(self, value):
-        """验证Steam应用ID"""
-        if not isinstance(value, str):
-            return False
-        return bool(re.match(r'^\d+$', str(value)))
-    
-    def _validate_price(self, value):
-        """验证价格格式"""
-        if not isinstance(value, str):
-            return False
-        # 支持免费、价格、折扣价格等格式
-        price_patterns = [
-            r'^免费$',
-            r'^¥\s*\d+(\.\d{2})?$',
-            r'^\$\s*\d+(\.\d{2})?$',
-            r'^\d+(\.\d{2})?\s*元$',
-            r'^\d+(\.\d{2})?\s*USD$',
-        ]
-        return any(re.match(pattern, value.strip()) for pattern in price_patterns)
-    
-    def _validate_discount(self, value):
-        """验证折扣百分比"""
-        if not isinstance(value, str):
-            return False
-        try:
-            discount = int(value)
-            return 0 <= discount <= 100
-        except ValueError:
-            return False
+        
+        self._record_errors(spider, errors)
+        for field, kind in errors:
+            if kind == 'missing':
+                raise DropItem(f"缺少必填字段: {field}")
+            if field in validator.required_fields:
+                raise DropItem(f"字段 {field} 格式无效: {item.get(field)}")
+        
+        # 对于非关键字段，只计数，不丢弃数据
+        return item
     
-    def _validate_positive_rate(self, value):
-        """验证好评率"""
-        if not isinstance(value, str):
-            return False
-        try:
-            rate = int(value)
-            return 0 <= rate <= 100
-        except ValueError:
-            return False
+    def close_spider(self, spider):
+        """爬虫结束时输出验证错误汇总"""
+        counts = self.error_counts.pop(spider.name, None)
+        if counts:
+            summary = ', '.join(f"{field}/{kind}={count}" for (field, kind), count in counts.most_common())
+            logger.warning(f"数据验证错误汇总 ({spider.name}): {summary}")
     
-    def _validate_reviews(self, value):
-        """验证评论数量"""
-        if not isinstance(value, str):
-            return False
-        try:
-            reviews = int(value.replace(',', ''))
-            return reviews >= 0
-        except ValueError:
-            return False
+    def _get_validator(self, spider_name, item):
+        """获取（必要时编译）爬虫和数据项类对应的验证器"""
+        key = (spider_name, type(item))
+        validator = self._validators.get(key)
+        if validator is None:
+            required = self.required_fields.get(spider_name, self.default_required_fields)
+            validator = self._validators[key] = self._compile(required, getattr(item, 'fields', {}))
+        return validator
     
-    def _validate_datetime(self, value):
-        """验证日期时间格式"""
-        if not isinstance(value, str):
-            return False
-        try:
-            datetime.fromisoformat(value.replace('Z', '+00:00'))
-            return True
-        except ValueError:
-            return False
+    def _compile(self, required_fields, fields):
+        """根据Field元数据编译验证器"""
+        checks = []
+        for field, meta in fields.items():
+            name = meta.get('validator')
+            if name is None:
+                continue
+            if name not in VALIDATORS:
+                raise ValueError(f"未注册的验证方式: {field} -> {name}")
+            checks.append((field, VALIDATORS[name], field in required_fields))
+        return CompiledValidator(required_fields, checks)
     
-    def _validate_date(self, value):
-        """验证日期格式"""
-        if not isinstance(value, str):
-            return False
-        try:
-            datetime.strptime(value, '%Y-%m-%d')
-            return True
-        except ValueError:
-            return False 
\ No newline at end of file
+    def _record_errors(self, spider, errors):
+        """按字段累计验证错误"""
+        counts = self.error_counts.setdefault(spider.name, Counter())
+        for field, kind in errors:
+            counts[(field, kind)] += 1
+            if self.stats:
+                self.stats.inc_value(f'validation/{kind}/{field}', spider=spider)
+        logger.debug(f"数据验证错误: {errors}")
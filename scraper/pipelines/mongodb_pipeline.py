@@ -4,30 +4,57 @@ MongoDB存储管道
 """
 
 import os
-from datetime import datetime
-from pymongo import MongoClient
-from pymongo.errors import DuplicateKeyError, ConnectionFailure
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from bson.decimal128 import Decimal128
+from pymongo import MongoClient, InsertOne, UpdateOne
+from pymongo.errors import DuplicateKeyError, ConnectionFailure, BulkWriteError
+from twisted.internet import defer, task
 from scrapy.exceptions import DropItem
 from loguru import logger
+from .threaded_writer import ThreadedWriter, WriteQueueFullError
 
 
 class MongoDBPipeline:
-    """MongoDB存储管道"""
+    """MongoDB存储管道
     
-    def __init__(self, mongodb_uri, mongodb_database):
+    batch_size大于1时启用缓冲模式：数据项先转换为upsert操作放入缓冲区，
+    达到数量阈值、时间阈值或爬虫结束时用 bulk_write(ordered=False) 批量写入。
+    
+    write_threads大于0时，所有写入都在后台线程池中执行，process_item返回Deferred，
+    不阻塞reactor线程。
+    """
+    
+    def __init__(self, mongodb_uri, mongodb_database, batch_size=1, flush_interval=5, stats=None,
+                 write_threads=0, max_pending_writes=8):
         """初始化MongoDB连接"""
         self.mongodb_uri = mongodb_uri
         self.mongodb_database = mongodb_database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = stats
         self.client = None
         self.db = None
         self.collections = {}
+        self.buffers = {}
+        self.last_flush = time.monotonic()
+        self.flush_task = None
+        self.write_threads = write_threads
+        self.max_pending_writes = max_pending_writes
+        self.writer = None
     
     @classmethod
     def from_crawler(cls, crawler):
         """从爬虫设置中创建管道实例"""
         mongodb_uri = crawler.settings.get('MONGODB_URI', 'mongodb://localhost:27017')
         mongodb_database = crawler.settings.get('MONGODB_DATABASE', 'gamemarket')
-        return cls(mongodb_uri, mongodb_database)
+        batch_size = crawler.settings.getint('MONGODB_BATCH_SIZE', 1)
+        flush_interval = crawler.settings.getfloat('MONGODB_FLUSH_INTERVAL', 5)
+        write_threads = crawler.settings.getint('MONGODB_WRITE_THREADS', 0)
+        max_pending_writes = crawler.settings.getint('STORAGE_MAX_PENDING_WRITES', 8)
+        return cls(mongodb_uri, mongodb_database, batch_size, flush_interval, crawler.stats,
+                   write_threads, max_pending_writes)
     
     def open_spider(self, spider):
         """爬虫开始时连接数据库"""
@@ -42,6 +69,16 @@ class MongoDBPipeline:
             # 创建索引
             self._create_indexes(spider.name)
             
+            # 后台写入线程池（MongoClient是线程安全的，可以多线程并发写入）
+            if self.write_threads > 0:
+                self.writer = ThreadedWriter('mongodb-writer', self.write_threads, self.max_pending_writes)
+                self.writer.start()
+            
+            # 缓冲模式下定时刷新，避免低流量时数据长时间停留在缓冲区
+            if self.batch_size > 1 and self.flush_interval > 0:
+                self.flush_task = task.LoopingCall(self._flush_if_due, spider)
+                self.flush_task.start(self.flush_interval, now=False)
+            
             logger.info(f"MongoDB连接成功: {self.mongodb_uri}/{self.mongodb_database}")
             
         except ConnectionFailure as e:
@@ -50,6 +87,16 @@ class MongoDBPipeline:
     
     def close_spider(self, spider):
         """爬虫结束时关闭数据库连接"""
+        if self.flush_task and self.flush_task.running:
+            self.flush_task.stop()
+        d = self._flush(spider)
+        if self.writer:
+            d.addBoth(lambda _: self.writer.stop())
+        d.addBoth(lambda _: self._close_client())
+        return d
+    
+    def _close_client(self):
+        """关闭MongoDB客户端"""
         if self.client:
             self.client.close()
             logger.info("MongoDB连接已关闭")
@@ -64,22 +111,30 @@ class MongoDBPipeline:
                 return item
             
             # 准备存储的数据
-            data = dict(item)
+            data = self._prepare_document(item, spider)
             
-            # 添加元数据
-            data['_spider'] = spider.name
-            data['_crawl_time'] = datetime.now()
-            data['_created_at'] = datetime.now()
+            if self.batch_size > 1:
+                # 缓冲模式：加入缓冲区，达到阈值时批量写入
+                buffer = self.buffers.setdefault(spider.name, [])
+                buffer.append(self._to_operation(data))
+                if len(buffer) >= self.batch_size:
+                    # 触发写入的数据项等待本批写入完成，形成反压
+                    return self._flush(spider).addCallback(lambda _: item)
+                return item
             
-            # 根据爬虫类型设置不同的主键
-            if spider.name == 'steam_top_sellers' or spider.name == 'steam_popular':
-                # Steam游戏使用app_id作为主键
-                if 'app_id' in data and data['app_id']:
-                    data['_id'] = data['app_id']
-                else:
-                    # 如果没有app_id，使用名称和时间组合
-                    data['_id'] = f"{data.get('name', 'unknown')}_{data.get('crawl_date', 'unknown')}"
+            if self.writer:
+                return self.writer.submit(self._write_one, collection, data).addCallback(lambda _: item)
+            self._write_one(collection, data)
+            return item
             
+        except Exception as e:
+            logger.error(f"存储到MongoDB失败: {e}")
+            # 不丢弃数据，继续传递给下一个管道
+            return item
+    
+    def _write_one(self, collection, data):
+        """逐条写入单个文档"""
+        try:
             # 尝试插入数据
             try:
                 collection.insert_one(data)
@@ -95,13 +150,109 @@ class MongoDBPipeline:
                     {'$set': update_data}
                 )
                 logger.debug(f"更新MongoDB记录: {data.get('name', 'Unknown')}")
-            
-            return item
-            
         except Exception as e:
             logger.error(f"存储到MongoDB失败: {e}")
-            # 不丢弃数据，继续传递给下一个管道
-            return item
+    
+    def _prepare_document(self, item, spider):
+        """把数据项转换为MongoDB文档"""
+        data = dict(item)
+        
+        # BSON不支持Decimal和date，转换为Decimal128和datetime
+        for key, value in data.items():
+            if isinstance(value, Decimal):
+                data[key] = Decimal128(value)
+            elif isinstance(value, date) and not isinstance(value, datetime):
+                data[key] = datetime(value.year, value.month, value.day)
+        
+        # 添加元数据
+        now = datetime.now()
+        data['_spider'] = spider.name
+        data['_crawl_time'] = now
+        data['_created_at'] = now
+        
+        # 根据爬虫类型设置不同的主键
+        if spider.name == 'steam_top_sellers' or spider.name == 'steam_popular':
+            # Steam游戏使用app_id作为主键
+            if 'app_id' in data and data['app_id']:
+                data['_id'] = data['app_id']
+            else:
+                # 如果没有app_id，使用名称和时间组合
+                data['_id'] = f"{data.get('name', 'unknown')}_{data.get('crawl_date', 'unknown')}"
+        
+        return data
+    
+    def _to_operation(self, data):
+        """把文档转换为批量写入操作（有主键时upsert，保留首次创建时间）"""
+        if '_id' not in data:
+            return InsertOne(data)
+        
+        update_data = {k: v for k, v in data.items() if not k.startswith('_')}
+        update_data['_spider'] = data['_spider']
+        update_data['_crawl_time'] = data['_crawl_time']
+        update_data['_updated_at'] = data['_created_at']
+        return UpdateOne(
+            {'_id': data['_id']},
+            {'$set': update_data, '$setOnInsert': {'_created_at': data['_created_at']}},
+            upsert=True
+        )
+    
+    def _flush_if_due(self, spider):
+        """定时检查，距上次刷新超过时间阈值时写入缓冲区"""
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            return self._flush(spider)
+    
+    def _flush(self, spider):
+        """取出缓冲区并批量写入MongoDB，返回写入完成的Deferred"""
+        self.last_flush = time.monotonic()
+        operations = self.buffers.pop(spider.name, None)
+        collection = self.collections.get(spider.name)
+        if not operations or collection is None:
+            return defer.succeed(None)
+        
+        if self.writer:
+            try:
+                d = self.writer.submit(self._write_batch, collection, operations)
+            except WriteQueueFullError as e:
+                # 数据放回缓冲区，下次刷新时再写入
+                logger.warning(f"{e}，{len(operations)} 条数据留待下次刷新")
+                self.buffers[spider.name] = operations + self.buffers.get(spider.name, [])
+                return defer.succeed(None)
+            if self.stats:
+                self.stats.max_value('mongodb/pending_writes_max', len(self.writer.pending), spider=spider)
+        else:
+            d = defer.maybeDeferred(self._write_batch, collection, operations)
+        d.addCallback(self._record_batch, spider)
+        return d
+    
+    def _write_batch(self, collection, operations):
+        """执行批量写入（可能在后台线程中），返回 (写入数, 失败数, 耗时毫秒)"""
+        start = time.perf_counter()
+        errors = 0
+        try:
+            result = collection.bulk_write(operations, ordered=False)
+            written = result.upserted_count + result.modified_count + result.inserted_count
+        except BulkWriteError as e:
+            errors = len(e.details.get('writeErrors', []))
+            written = len(operations) - errors
+            logger.warning(f"MongoDB批量写入部分失败: {errors}/{len(operations)} 条")
+        except Exception as e:
+            errors = len(operations)
+            written = 0
+            logger.error(f"MongoDB批量写入失败: {e}")
+        latency_ms = (time.perf_counter() - start) * 1000
+        
+        logger.debug(f"MongoDB批量写入: {len(operations)} 条, 耗时 {latency_ms:.1f}ms, 失败 {errors} 条")
+        return written, errors, latency_ms
+    
+    def _record_batch(self, result, spider):
+        """在reactor线程中记录批量写入统计"""
+        written, errors, latency_ms = result
+        if self.stats:
+            self.stats.inc_value('mongodb/batches', spider=spider)
+            self.stats.inc_value('mongodb/items_written', written, spider=spider)
+            self.stats.inc_value('mongodb/batch_errors', errors, spider=spider)
+            self.stats.inc_value('mongodb/batch_latency_ms_total', round(latency_ms), spider=spider)
+            self.stats.max_value('mongodb/batch_latency_ms_max', round(latency_ms), spider=spider)
     
     def _create_indexes(self, spider_name):
         """创建数据库索引"""
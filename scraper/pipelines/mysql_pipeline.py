@@ -5,27 +5,66 @@ MySQL存储管道
 
 import os
 import re
-from datetime import datetime
+import time
+from datetime import date, datetime
 from decimal import Decimal
 import pymysql
 from pymysql.err import IntegrityError, OperationalError
+from twisted.internet import defer, task
 from scrapy.exceptions import DropItem
 from loguru import logger
+from .threaded_writer import ThreadedWriter, WriteQueueFullError
+from scraper.utils.cache_invalidation import WebCacheInvalidator, steam_crawl_namespaces
+
+
+# Steam游戏分表的写入列（顺序与批量写入的参数元组一致）
+STEAM_GAME_COLUMNS = (
+    'app_id', 'name', 'price', 'original_price', 'discount_percent',
+    'developer', 'publisher', 'release_date', 'positive_rate', 'total_reviews',
+    'genres', 'tags', 'rank', 'rank_type', 'crawl_date', 'created_at', 'updated_at',
+)
+
+# 唯一键 (app_id, crawl_date) 冲突时不更新的列
+STEAM_GAME_KEEP_ON_UPDATE = ('app_id', 'crawl_date', 'created_at')
 
 
 class MySQLPipeline:
-    """MySQL存储管道"""
+    """MySQL存储管道
+    
+    batch_size大于1时启用批量模式：数据行先放入缓冲区，达到数量阈值、
+    时间阈值或爬虫结束时用一条 executemany 的
+    INSERT ... ON DUPLICATE KEY UPDATE 写入，每批只提交一次。
+    
+    async_writes为True时，所有写入都在单线程的后台线程池中执行（pymysql连接
+    不是线程安全的），process_item返回Deferred，不阻塞reactor线程。
     
-    def __init__(self, mysql_host, mysql_port, mysql_user, mysql_password, mysql_database):
+    爬虫结束且数据写入完成后，通过cache_invalidator发布快照就绪事件，Web进程
+    据此预热受影响的缓存命名空间（概览、图表、最新数据以及本次写入的榜单类型）。
+    """
+    
+    def __init__(self, mysql_host, mysql_port, mysql_user, mysql_password, mysql_database,
+                 batch_size=1, flush_interval=5, stats=None, async_writes=False, max_pending_writes=8,
+                 cache_invalidator=None):
         """初始化MySQL连接参数"""
         self.mysql_host = mysql_host
         self.mysql_port = mysql_port
         self.mysql_user = mysql_user
         self.mysql_password = mysql_password
         self.mysql_database = mysql_database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = stats
         self.connection = None
         self.cursor = None
         self.tables = {}  # 存储分表信息
+        self.buffers = {}
+        self.last_flush = time.monotonic()
+        self.flush_task = None
+        self.async_writes = async_writes
+        self.max_pending_writes = max_pending_writes
+        self.writer = None
+        self.cache_invalidator = cache_invalidator
+        self.items_received = False  # 本次抓取是否写入了数据
     
     @classmethod
     def from_crawler(cls, crawler):
@@ -35,7 +74,14 @@ class MySQLPipeline:
         mysql_user = crawler.settings.get('MYSQL_USER', 'root')
         mysql_password = crawler.settings.get('MYSQL_PASSWORD', '')
         mysql_database = crawler.settings.get('MYSQL_DATABASE', 'gamemarket')
-        return cls(mysql_host, mysql_port, mysql_user, mysql_password, mysql_database)
+        batch_size = crawler.settings.getint('MYSQL_BATCH_SIZE', 1)
+        flush_interval = crawler.settings.getfloat('MYSQL_FLUSH_INTERVAL', 5)
+        async_writes = crawler.settings.getbool('MYSQL_ASYNC_WRITES', False)
+        max_pending_writes = crawler.settings.getint('STORAGE_MAX_PENDING_WRITES', 8)
+        cache_invalidator = WebCacheInvalidator.from_settings(crawler.settings)
+        return cls(mysql_host, mysql_port, mysql_user, mysql_password, mysql_database,
+                   batch_size, flush_interval, crawler.stats, async_writes, max_pending_writes,
+                   cache_invalidator)
     
     def open_spider(self, spider):
         """爬虫开始时连接数据库"""
@@ -54,6 +100,16 @@ class MySQLPipeline:
             # 创建分表结构
             self._create_partitioned_tables(spider.name)
             
+            # 后台写入线程（单线程，保证同一连接上的调用串行执行）
+            if self.async_writes:
+                self.writer = ThreadedWriter('mysql-writer', 1, self.max_pending_writes)
+                self.writer.start()
+            
+            # 批量模式下定时刷新，避免低流量时数据长时间停留在缓冲区
+            if self.batch_size > 1 and self.flush_interval > 0:
+                self.flush_task = task.LoopingCall(self._flush_if_due, spider)
+                self.flush_task.start(self.flush_interval, now=False)
+            
             logger.info(f"MySQL连接成功: {self.mysql_host}:{self.mysql_port}/{self.mysql_database}")
             
         except Exception as e:
@@ -62,6 +118,26 @@ class MySQLPipeline:
     
     def close_spider(self, spider):
         """爬虫结束时关闭数据库连接"""
+        if self.flush_task and self.flush_task.running:
+            self.flush_task.stop()
+        d = self._flush(spider)
+        if self.writer:
+            d.addBoth(lambda _: self.writer.stop())
+        d.addBoth(lambda _: self._close_connection())
+        d.addBoth(lambda _: self._publish_snapshot_ready(spider))
+        return d
+    
+    def _publish_snapshot_ready(self, spider):
+        """数据写入完成后通知Web进程预热受影响的缓存"""
+        if not self.cache_invalidator or not self.items_received:
+            return
+        namespaces = steam_crawl_namespaces()
+        receivers = self.cache_invalidator.snapshot_ready(spider.name, namespaces)
+        if self.stats:
+            self.stats.set_value('mysql/snapshot_ready_receivers', receivers, spider=spider)
+    
+    def _close_connection(self):
+        """关闭MySQL连接"""
         if self.cursor:
             self.cursor.close()
         if self.connection:
@@ -72,6 +148,11 @@ class MySQLPipeline:
         """处理数据项并存储到MySQL"""
         try:
             if spider.name in ['steam_top_sellers', 'steam_popular']:
+                self.items_received = True
+                if self.batch_size > 1:
+                    return self._buffer_steam_item(item, spider)
+                if self.writer:
+                    return self.writer.submit(self._process_steam_item, item, spider)
                 return self._process_steam_item(item, spider)
             else:
                 logger.warning(f"未知的爬虫类型: {spider.name}")
@@ -97,25 +178,7 @@ class MySQLPipeline:
                 return item
             
             # 准备数据
-            data = {
-                'app_id': item.get('app_id'),
-                'name': item.get('name'),
-                'price': self._parse_price(item.get('price')),
-                'original_price': self._parse_price(item.get('original_price')),
-                'discount_percent': self._parse_int(item.get('discount_percent')),
-                'developer': item.get('developer'),
-                'publisher': item.get('publisher'),
-                'release_date': self._parse_date(item.get('release_date')),
-                'positive_rate': self._parse_int(item.get('positive_rate')),
-                'total_reviews': self._parse_int(item.get('total_reviews')),
-                'genres': self._parse_list(item.get('genres')),
-                'tags': self._parse_list(item.get('tags')),
-                'rank': item.get('rank'),
-                'rank_type': item.get('rank_type'),
-                'crawl_date': item.get('crawl_date'),
-                'created_at': datetime.now(),
-                'updated_at': datetime.now()
-            }
+            data = self._build_steam_row(item)
             
             # 检查是否已存在记录（基于app_id和crawl_date的组合）
             self.cursor.execute(
@@ -139,6 +202,125 @@ class MySQLPipeline:
             logger.error(f"处理Steam数据失败: {e}")
             return item
     
+    def _buffer_steam_item(self, item, spider):
+        """批量模式：把数据行加入缓冲区，达到阈值时批量写入"""
+        if not self.connection or not self.tables.get(spider.name):
+            logger.error("数据库连接或分表未建立，跳过数据处理")
+            return item
+        
+        data = self._build_steam_row(item)
+        buffer = self.buffers.setdefault(spider.name, [])
+        buffer.append(tuple(data[column] for column in STEAM_GAME_COLUMNS))
+        if len(buffer) >= self.batch_size:
+            # 触发写入的数据项等待本批写入完成，形成反压
+            return self._flush(spider).addCallback(lambda _: item)
+        return item
+    
+    def _build_steam_row(self, item):
+        """把数据项转换为Steam游戏分表的数据行"""
+        now = datetime.now()
+        return {
+            'app_id': item.get('app_id'),
+            'name': item.get('name'),
+            'price': self._parse_price(item.get('price')),
+            'original_price': self._parse_price(item.get('original_price')),
+            'discount_percent': self._parse_int(item.get('discount_percent')),
+            'developer': item.get('developer'),
+            'publisher': item.get('publisher'),
+            'release_date': self._parse_date(item.get('release_date')),
+            'positive_rate': self._parse_int(item.get('positive_rate')),
+            'total_reviews': self._parse_int(item.get('total_reviews')),
+            'genres': self._parse_list(item.get('genres')),
+            'tags': self._parse_list(item.get('tags')),
+            'rank': item.get('rank'),
+            'rank_type': item.get('rank_type'),
+            'crawl_date': item.get('crawl_date'),
+            'created_at': now,
+            'updated_at': now
+        }
+    
+    def _upsert_sql(self, table_name):
+        """构建批量写入语句（按唯一键 uk_app_date 去重）"""
+        columns = ', '.join(f'`{column}`' for column in STEAM_GAME_COLUMNS)
+        placeholders = ', '.join(['%s'] * len(STEAM_GAME_COLUMNS))
+        updates = ', '.join(
+            f'`{column}` = VALUES(`{column}`)'
+            for column in STEAM_GAME_COLUMNS if column not in STEAM_GAME_KEEP_ON_UPDATE
+        )
+        return (
+            f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders}) "
+            f"ON DUPLICATE KEY UPDATE {updates}"
+        )
+    
+    def _flush_if_due(self, spider):
+        """定时检查，距上次刷新超过时间阈值时写入缓冲区"""
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            return self._flush(spider)
+    
+    def _flush(self, spider):
+        """取出缓冲区并批量写入MySQL，返回写入完成的Deferred"""
+        self.last_flush = time.monotonic()
+        rows = self.buffers.pop(spider.name, None)
+        table_name = self.tables.get(spider.name)
+        if not rows or not table_name:
+            return defer.succeed(None)
+        if not self.cursor or not self.connection:
+            logger.error(f"数据库连接未建立，丢弃 {len(rows)} 条待写入数据")
+            return defer.succeed(None)
+        
+        if self.writer:
+            try:
+                d = self.writer.submit(self._write_batch, table_name, rows)
+            except WriteQueueFullError as e:
+                # 数据放回缓冲区，下次刷新时再写入
+                logger.warning(f"{e}，{len(rows)} 条数据留待下次刷新")
+                self.buffers[spider.name] = rows + self.buffers.get(spider.name, [])
+                return defer.succeed(None)
+            if self.stats:
+                self.stats.max_value('mysql/pending_writes_max', len(self.writer.pending), spider=spider)
+        else:
+            d = defer.maybeDeferred(self._write_batch, table_name, rows)
+        d.addCallback(self._record_batch, spider)
+        return d
+    
+    def _write_batch(self, table_name, rows):
+        """执行批量写入并提交（可能在后台线程中），返回 (写入数, 失败数, 耗时毫秒)"""
+        start = time.perf_counter()
+        errors = self._write_rows(self._upsert_sql(table_name), rows)
+        latency_ms = (time.perf_counter() - start) * 1000
+        
+        logger.debug(f"MySQL批量写入: {len(rows)} 条 (表: {table_name}), 耗时 {latency_ms:.1f}ms")
+        return len(rows) - errors, errors, latency_ms
+    
+    def _write_rows(self, sql, rows):
+        """写入并提交一批数据行，返回失败的行数
+        
+        个别数据行出错（数据越界、编码错误等）时把批次对半拆分后重试，只有出错的
+        行计为失败；连接断开、锁等待超时等OperationalError对整批相同，不再拆分。
+        """
+        try:
+            self.cursor.executemany(sql, rows)
+            self.connection.commit()
+            return 0
+        except Exception as e:
+            self.connection.rollback()
+            if len(rows) == 1 or isinstance(e, OperationalError):
+                logger.error(f"MySQL批量写入失败 ({len(rows)} 条): {e}")
+                return len(rows)
+            logger.warning(f"MySQL批量写入失败，拆分 {len(rows)} 条数据重试: {e}")
+        middle = len(rows) // 2
+        return self._write_rows(sql, rows[:middle]) + self._write_rows(sql, rows[middle:])
+    
+    def _record_batch(self, result, spider):
+        """在reactor线程中记录批量写入统计"""
+        written, errors, latency_ms = result
+        if self.stats:
+            self.stats.inc_value('mysql/batches', spider=spider)
+            self.stats.inc_value('mysql/items_written', written, spider=spider)
+            self.stats.inc_value('mysql/batch_errors', errors, spider=spider)
+            self.stats.inc_value('mysql/batch_latency_ms_total', round(latency_ms), spider=spider)
+            self.stats.max_value('mysql/batch_latency_ms_max', round(latency_ms), spider=spider)
+    
     def _create_partitioned_tables(self, spider_name):
         """创建按日期分表的表结构"""
         try:
@@ -296,6 +478,9 @@ class MySQLPipeline:
     
     def _parse_price(self, price_str):
         """解析价格字符串为数字"""
+        if isinstance(price_str, Decimal):
+            # 规范化管道已输出Decimal，直接使用
+            return price_str
         if not price_str:
             return None
         
@@ -310,6 +495,8 @@ class MySQLPipeline:
     
     def _parse_int(self, value):
         """解析字符串为整数"""
+        if isinstance(value, int):
+            return value
         if not value:
             return None
         try:
@@ -319,6 +506,8 @@ class MySQLPipeline:
     
     def _parse_date(self, date_str):
         """解析日期字符串"""
+        if isinstance(date_str, date):
+            return date_str
         if not date_str:
             return None
         
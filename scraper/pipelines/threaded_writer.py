@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+存储管道的后台写入线程池
+
+把阻塞的数据库调用移出Twisted reactor线程。同时在途的写入数由信号量限制；
+管道把写入的Deferred返回给Scrapy，数据项在写入完成前一直占用scraper槽位，
+槽位占满时引擎暂停调度新的下载，从而形成反压，等待队列不会无限增长。
+
+反压依赖这一约定：submit返回的Deferred必须交还给Scrapy（或由交还给Scrapy的
+Deferred等待）。等待信号量的写入数超过max_waiting时说明有调用方违反了约定，
+submit抛出WriteQueueFullError，而不是让等待队列继续增长。
+"""
+
+from twisted.internet import defer, threads
+from twisted.python.threadpool import ThreadPool
+from loguru import logger
+
+
+class WriteQueueFullError(Exception):
+    """等待写入的调用数超过上限（调用方没有等待submit返回的Deferred）"""
+
+
+class ThreadedWriter:
+    """有界的后台写入线程池"""
+    
+    def __init__(self, name, max_threads=1, max_pending=8, max_waiting=1000):
+        self.name = name
+        self.pool = ThreadPool(minthreads=1, maxthreads=max_threads, name=name)
+        self.semaphore = defer.DeferredSemaphore(max_pending)
+        self.max_waiting = max_waiting  # 应大于CONCURRENT_ITEMS，正常反压下不会达到
+        self.pending = set()
+    
+    def start(self):
+        """启动线程池"""
+        self.pool.start()
+        logger.info(f"后台写入线程池已启动: {self.name} (线程数 {self.pool.max}, 在途上限 {self.semaphore.limit})")
+    
+    def submit(self, func, *args, **kwargs):
+        """在线程池中执行阻塞调用，返回Deferred（调用方必须等待它）"""
+        from twisted.internet import reactor
+        if self.waiting >= self.max_waiting:
+            raise WriteQueueFullError(f"{self.name}: 等待写入数达到上限 {self.max_waiting}")
+        d = self.semaphore.run(threads.deferToThreadPool, reactor, self.pool, func, *args, **kwargs)
+        self.pending.add(d)
+        d.addBoth(self._finished, d)
+        return d
+    
+    @property
+    def waiting(self):
+        """等待信号量的写入数"""
+        return len(self.semaphore.waiting)
+    
+    def _finished(self, result, d):
+        self.pending.discard(d)
+        return result
+    
+    def stop(self):
+        """等待在途写入完成后停止线程池"""
+        d = defer.DeferredList(list(self.pending), consumeErrors=True)
+        d.addBoth(lambda _: self.pool.stop())
+        return d
@@ -36,8 +36,32 @@ RETRY_HTTP_CODES = [500, 502, 503, 504, 408, 429]
 #     "https": "scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler"
 # }
 
-# 使用标准reactor，避免Playwright兼容性问题
-# TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
+# 年龄验证（AgeGateMiddleware）：为这些域名预置年龄验证Cookie，命中年龄验证页时重试一次
+# 年龄验证页只由该中间件处理，不在DYNAMIC_RENDER_RULES中渲染，也不写入HTTP缓存
+AGE_GATE_ENABLED = True
+AGE_GATE_DOMAINS = ['store.steampowered.com']
+AGE_GATE_BIRTHTIME = 631152001  # 1990-01-01
+
+# 按需动态渲染（DynamicRenderMiddleware）：先普通HTTP下载，命中检测规则
+# 或请求meta中 render=True 时才通过浏览器池中的Playwright页面重新获取
+DYNAMIC_RENDER_ENABLED = os.getenv('DYNAMIC_RENDER_ENABLED', 'false').lower() == 'true'
+DYNAMIC_RENDER_BROWSER = 'chromium'
+DYNAMIC_RENDER_MAX_BROWSERS = 1
+DYNAMIC_RENDER_CONTEXTS_PER_BROWSER = 4  # 每个浏览器同时渲染的页面数
+DYNAMIC_RENDER_MAX_USES = 50  # 上下文使用多少次后重建
+DYNAMIC_RENDER_MAX_MEMORY_MB = 512  # 页面JS堆超过该值时重建上下文
+DYNAMIC_RENDER_TIMEOUT = 30  # 秒
+DYNAMIC_RENDER_WAIT_UNTIL = 'domcontentloaded'
+DYNAMIC_RENDER_BLOCK_PROFILE = 'light'  # none / light（图片、视频、字体、统计脚本）/ strict（另拦截样式表等）
+DYNAMIC_RENDER_RULES = [
+    # 评测摘要由JS填充；只在页面声明有评测 (schema.org reviewCount) 时检查，没有评测的新游戏不渲染
+    {'name': 'review_summary', 'url': r'store\.steampowered\.com/app/\d+',
+     'when': 'meta[itemprop="reviewCount"]', 'required': 'span.game_review_summary'},
+]
+
+# Playwright需要asyncio reactor，只在启用动态渲染时切换
+if DYNAMIC_RENDER_ENABLED:
+    TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 
 # Playwright设置（暂时禁用）
 # PLAYWRIGHT_LAUNCH_OPTIONS = {
@@ -66,12 +90,16 @@ DEFAULT_REQUEST_HEADERS = {
 DOWNLOADER_MIDDLEWARES = {
     'scraper.middlewares.RandomUserAgentMiddleware': 400,
     'scrapy.downloadermiddlewares.useragent.UserAgentMiddleware': None,
+    'scraper.middlewares.AgeGateMiddleware': 650,  # 需在CookiesMiddleware (700) 之前、RedirectMiddleware (600) 之后
+    'scraper.middlewares.ProxyPoolMiddleware': 740,  # 需在HttpProxyMiddleware (750) 之前
+    'scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware': None,
+    'scraper.middlewares.RevalidatingHttpCacheMiddleware': 900,  # 304时刷新缓存条目
+    'scraper.middlewares.DynamicRenderMiddleware': 950,  # 需在缓存之后，渲染结果才会被缓存
 }
 
 # 管道设置
 ITEM_PIPELINES = {
-    'scraper.pipelines.DataValidationPipeline': 300,
-    'scraper.pipelines.DataCleaningPipeline': 400,
+    'scraper.pipelines.DataNormalizationPipeline': 300,
     'scraper.pipelines.MongoDBPipeline': 500,
     'scraper.pipelines.MySQLPipeline': 600,
 }
@@ -80,15 +108,40 @@ ITEM_PIPELINES = {
 REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379')
 REDIS_ENCODING = 'utf-8'
 
+# 请求去重 (Bloom过滤器，全量抓取时代替保存全部指纹的集合)
+# 单机使用 scraper.dupefilters.BloomDupeFilter，分布式模式使用 RedisBloomDupeFilter
+BLOOM_DUPEFILTER_ENABLED = os.getenv('BLOOM_DUPEFILTER_ENABLED', 'false').lower() == 'true'
+if BLOOM_DUPEFILTER_ENABLED:
+    DUPEFILTER_CLASS = 'scraper.dupefilters.BloomDupeFilter'
+BLOOMFILTER_CAPACITY = 1000000    # 首个分片的容量，写满后按2倍扩容
+BLOOMFILTER_ERROR_RATE = 0.001    # 误判率（新请求被当作重复的概率）
+# RedisBloomDupeFilter独立使用时的位图键；未设置时每次运行使用临时键，关闭爬虫时删除
+BLOOMFILTER_REDIS_KEY = os.getenv('BLOOMFILTER_REDIS_KEY')
+
 # 数据库设置
 MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017')
 MONGODB_DATABASE = os.getenv('MONGODB_DATABASE', 'gamemarket')
+MONGODB_BATCH_SIZE = 500     # 批量写入条数阈值 (1=逐条写入)
+MONGODB_FLUSH_INTERVAL = 5   # 批量写入时间阈值 (秒)
 
 MYSQL_HOST = os.getenv('MYSQL_HOST', 'localhost')
 MYSQL_PORT = int(os.getenv('MYSQL_PORT', 3306))
 MYSQL_USER = os.getenv('MYSQL_USER', 'root')
 MYSQL_PASSWORD = os.getenv('MYSQL_PASSWORD', '')
 MYSQL_DATABASE = os.getenv('MYSQL_DATABASE', 'gamemarket')
+MYSQL_BATCH_SIZE = 200       # 批量写入条数阈值 (1=逐条写入)
+MYSQL_FLUSH_INTERVAL = 5     # 批量写入时间阈值 (秒)
+
+# 存储管道后台写入 (数据库调用移出reactor线程)
+MONGODB_WRITE_THREADS = 4        # MongoDB写入线程数 (0=在reactor线程中同步写入)
+MYSQL_ASYNC_WRITES = True        # MySQL在单独的写入线程中执行
+STORAGE_MAX_PENDING_WRITES = 8   # 每个管道同时在途的写入数上限
+
+# Web缓存失效 (爬虫结束时发布快照就绪事件，Web看板预热受影响的缓存，需与web/config.py一致)
+WEB_CACHE_INVALIDATION_ENABLED = os.getenv('WEB_CACHE_INVALIDATION_ENABLED', 'true').lower() == 'true'
+WEB_CACHE_KEY_PREFIX = os.getenv('CACHE_KEY_PREFIX', 'gamemarket:cache')
+WEB_CACHE_INVALIDATION_CHANNEL = os.getenv('CACHE_INVALIDATION_CHANNEL', 'gamemarket:cache:invalidate')
+WEB_SNAPSHOT_CHANNEL = os.getenv('SNAPSHOT_CHANNEL', 'gamemarket:crawl:snapshot_ready')  # 快照就绪事件，Web进程据此预热缓存
 
 # 日志设置
 LOG_LEVEL = 'INFO'
@@ -96,13 +149,39 @@ LOG_FILE = f'data/logs/crawler_{datetime.now().strftime("%Y%m%d")}.log'
 
 # 缓存设置
 HTTPCACHE_ENABLED = True
-HTTPCACHE_EXPIRATION_SECS = 3600
+HTTPCACHE_EXPIRATION_SECS = 0  # 缓存条目不过期，超过重新验证时间后发送条件请求
+HTTPCACHE_POLICY = 'scraper.extensions.httpcache.RevalidatingCachePolicy'
+HTTPCACHE_REVALIDATE_AFTER_SECS = int(os.getenv('HTTPCACHE_REVALIDATE_AFTER_SECS', 3600))
 HTTPCACHE_DIR = 'data/cache'
 HTTPCACHE_IGNORE_HTTP_CODES = []
-HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'
-
-# 自动限速
-AUTOTHROTTLE_ENABLED = True
+HTTPCACHE_STORAGE = 'scraper.extensions.httpcache.SQLiteCacheStorage'
+# SQLite缓存存储：单文件、zstd压缩、按内容哈希去重响应体
+HTTPCACHE_SQLITE_FILE = 'httpcache.sqlite'
+HTTPCACHE_SQLITE_MAX_BYTES = int(os.getenv('HTTPCACHE_SQLITE_MAX_BYTES', 2 * 1024 ** 3))  # 压缩后响应体总大小上限
+HTTPCACHE_SQLITE_MAX_AGE = int(os.getenv('HTTPCACHE_SQLITE_MAX_AGE', 7 * 24 * 3600))  # 超过该时间（秒）的缓存被淘汰
+HTTPCACHE_SQLITE_BUSY_TIMEOUT = 30  # 其他进程持有写锁时的最长等待时间（秒）
+HTTPCACHE_SQLITE_EVICT_EVERY = 1000  # 每写入多少个响应淘汰一次，0表示只在打开和关闭时淘汰
+HTTPCACHE_SQLITE_EVICT_BATCH = 500  # 淘汰时每个事务最多删除的响应数
+HTTPCACHE_SQLITE_ACCESS_FLUSH_SIZE = 1000  # 内存中累积多少条访问时间后写入（写入和淘汰时也会写入）
+HTTPCACHE_COMPRESSION = 'zstd'  # zstd 或 zlib（未安装zstandard时自动使用zlib）
+HTTPCACHE_COMPRESSION_LEVEL = 3
+
+# 自适应限速 (按下载槽AIMD调整速率，替代AutoThrottle)
+ADAPTIVE_RATE_ENABLED = os.getenv('ADAPTIVE_RATE_ENABLED', 'true').lower() == 'true'
+EXTENSIONS = {
+    'scraper.extensions.AdaptiveRateLimiter': 500,
+}
+ADAPTIVE_RATE_MIN = 0.1               # 最低速率（请求/秒/下载槽）
+ADAPTIVE_RATE_MAX = 2.0               # 每个下载槽的最高速率
+ADAPTIVE_RATE_DOMAIN_MAX = ADAPTIVE_RATE_MAX  # 每个域名所有下载槽合计的最高速率（合规上限）
+ADAPTIVE_RATE_INCREASE = 0.05         # 每个正常响应增加的速率
+ADAPTIVE_RATE_DECREASE = 0.5          # 被限流时的速率乘数
+ADAPTIVE_RATE_COOLDOWN = 5            # 两次降速之间的最短间隔（秒）
+ADAPTIVE_RATE_TARGET_LATENCY = 5      # 下载延迟超过该值（秒）时不再提速
+ADAPTIVE_RATE_BACKOFF_CODES = [429, 503]
+
+# 自动限速 (与自适应限速二选一)
+AUTOTHROTTLE_ENABLED = not ADAPTIVE_RATE_ENABLED
 AUTOTHROTTLE_START_DELAY = 1
 AUTOTHROTTLE_MAX_DELAY = 60
 AUTOTHROTTLE_TARGET_CONCURRENCY = 1.0
@@ -111,7 +190,13 @@ AUTOTHROTTLE_DEBUG = False
 # 代理设置
 PROXY_ENABLED = os.getenv('PROXY_ENABLED', 'False').lower() == 'true'
 PROXY_LIST_FILE = 'config/proxies.txt'
-PROXY_MODE = 0  # 0=随机, 1=轮询
+PROXY_MODE = 0  # 0=按健康度和延迟加权随机, 1=轮询
+PROXY_MAX_CONCURRENCY = 2         # 每个代理的并发请求上限（独立下载槽）
+PROXY_BAN_CODES = [403, 429]      # 视为代理被封禁的响应码
+PROXY_BAN_RETRY_TIMES = 3         # 被封禁时换代理重试的次数
+PROXY_LATENCY_ALPHA = 0.3         # 延迟指数移动平均的平滑系数
+PROXY_QUARANTINE_BASE = 30        # 失败代理的初始隔离秒数，连续失败时翻倍
+PROXY_QUARANTINE_MAX = 1800       # 最长隔离秒数
 
 # 用户代理设置
 USER_AGENT_LIST_FILE = 'config/user_agents.txt'
@@ -128,4 +213,19 @@ FEEDS = {
 
 # 自定义设置
 CRAWL_DATE = datetime.now().strftime('%Y-%m-%d')
-MAX_PAGES_PER_SPIDER = 100  # 每个爬虫最大页数限制 
\ No newline at end of file
+MAX_PAGES_PER_SPIDER = 100  # 每个爬虫最大页数限制
+
+# 搜索结果分页设置 (通过JSON分片接口抓取完整榜单，也可用 -a paginate=1 开启)
+SEARCH_PAGINATION_ENABLED = os.getenv('SEARCH_PAGINATION_ENABLED', 'False').lower() == 'true'
+SEARCH_PAGE_SIZE = 50        # 每页条数 (count参数)
+SEARCH_PAGE_CONCURRENCY = 4  # 同时在途的分页请求数
+
+# 详情页缓存设置 (按app_id缓存详情字段，新鲜时跳过详情页请求)
+DETAIL_CACHE_ENABLED = os.getenv('DETAIL_CACHE_ENABLED', 'false').lower() == 'true'
+DETAIL_CACHE_BACKEND = os.getenv('DETAIL_CACHE_BACKEND', 'sqlite')  # sqlite=本地磁盘, redis=多节点共享
+DETAIL_CACHE_PATH = 'data/detail_cache.sqlite'
+DETAIL_CACHE_TTL = {
+    'static': 7 * 24 * 3600,  # 发行商、发行日期、类型
+    'tags': 3 * 24 * 3600,    # 标签
+    'reviews': 6 * 3600,      # 好评率、评论数
+} 
\ No newline at end of file
@@ -5,95 +5,182 @@ Steam游戏数据爬虫
 
 import scrapy
 import re
+from scrapy import signals
 from datetime import datetime
-from urllib.parse import urljoin
-from scraper.items import SteamGameItem
+from urllib.parse import urljoin, urlencode
+from scrapy.selector import Selector
+from scraper.items import SteamGameRecord
+from scraper.utils.row_extractor import SearchRowExtractor
+from scraper.utils.detail_cache import DetailCache
 from loguru import logger
 
 
-class SteamTopSellersSpider(scrapy.Spider):
-    """Steam畅销游戏爬虫"""
-    name = "steam_top_sellers"
-    allowed_domains = ["steampowered.com"]
-    start_urls = ["https://store.steampowered.com/search/?filter=topsellers&cc=cn"]  # 中国区
+# 搜索结果分片接口（无限滚动使用的JSON接口）
+SEARCH_RESULTS_URL = "https://store.steampowered.com/search/results/"
+
+# 列表行解析器（选择器和正则在模块加载时编译）
+row_extractor = SearchRowExtractor()
+
+# 可选的列表字段，仅在解析到值时写入数据项
+OPTIONAL_ROW_FIELDS = ('price', 'original_price', 'discount_percent')
+
+
+def build_record(row, rank, rank_type):
+    """由列表行字段构建紧凑记录（随详情页请求排队）"""
+    item = SteamGameRecord()
     
-    custom_settings = {
-        "DOWNLOAD_DELAY": 3,  # 合规延迟
-        # 移除Playwright设置，使用标准HTTP下载器
-        # "PLAYWRIGHT_ENABLED": True,
-        # "PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT": 30000,
-    }
+    # 排名信息
+    item['rank'] = rank  # 排名从1开始
+    item['rank_type'] = rank_type
+    
+    # 基本信息
+    item['name'] = row['name']
+    item['app_id'] = row['app_id']
+    for field in OPTIONAL_ROW_FIELDS:
+        if row[field] is not None:
+            item[field] = row[field]
+    item['developer'] = row['developer']
+    
+    # 爬取时间
+    now = datetime.now()
+    item['crawl_time'] = now.isoformat()
+    item['crawl_date'] = now.strftime('%Y-%m-%d')
+    return item
+
+
+def build_item(row, rank, rank_type):
+    """由列表行字段构建数据项"""
+    return build_record(row, rank, rank_type).to_item()
+
 
+class SteamSearchSpider(scrapy.Spider):
+    """Steam搜索榜单爬虫基类
+    
+    默认只解析start_urls的首个HTML页面；开启分页模式后改为请求搜索结果的
+    JSON分片接口（start/count参数），并发调度分页，直到达到
+    MAX_PAGES_PER_SPIDER或某一页不再出现新的app_id为止。
+    """
+    search_filter = None  # 搜索过滤器 (topsellers/popularnew)
+    rank_type = None      # 写入数据项的排名类型
+    list_label = "Steam游戏"
+    detail_groups = ()    # 详情页解析的字段分组，见 scraper.utils.detail_cache.FIELD_GROUPS
+    follow_next_pages = True  # 分页模式下是否自行调度后续分页（分布式模式由种子队列提供分页）
+    
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        """创建爬虫实例，按设置打开详情页缓存"""
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.detail_cache = None
+        if crawler.settings.getbool('DETAIL_CACHE_ENABLED', False) and spider.detail_groups:
+            spider.detail_cache = DetailCache.from_settings(crawler.settings)
+            crawler.signals.connect(spider._close_detail_cache, signal=signals.spider_closed)
+        return spider
+    
+    def _close_detail_cache(self, spider):
+        """爬虫结束时关闭详情页缓存"""
+        self.detail_cache.close()
+    
+    def start_requests(self):
+        """生成起始请求"""
+        if not self._pagination_enabled():
+            yield from super().start_requests()
+            return
+        
+        self._setup_pagination()
+        logger.info(f"{self.list_label}分页模式: 每页 {self.page_size} 条, 最多 {self.max_pages} 页, 并发 {self.page_window} 页")
+        for page in range(min(self.page_window, self.max_pages)):
+            yield self._search_page_request(page)
+    
+    def _setup_pagination(self):
+        """读取分页设置并初始化去重状态"""
+        self.page_size = self.settings.getint('SEARCH_PAGE_SIZE', 50)
+        self.max_pages = self.settings.getint('MAX_PAGES_PER_SPIDER', 100)
+        self.page_window = max(1, self.settings.getint('SEARCH_PAGE_CONCURRENCY', 4))
+        self.seen_app_ids = set()
+    
+    def _pagination_enabled(self):
+        """分页模式开关，爬虫参数 -a paginate=1 优先于设置项"""
+        paginate = getattr(self, 'paginate', None)
+        if paginate is not None:
+            return str(paginate).lower() in ('1', 'true', 'yes')
+        return self.settings.getbool('SEARCH_PAGINATION_ENABLED', False)
+    
+    def _search_page_request(self, page):
+        """构建搜索结果分片请求"""
+        params = {
+            'filter': self.search_filter,
+            'cc': 'cn',  # 中国区
+            'start': page * self.page_size,
+            'count': self.page_size,
+            'infinite': 1,
+        }
+        return scrapy.Request(
+            f"{SEARCH_RESULTS_URL}?{urlencode(params)}",
+            callback=self.parse_search_page,
+            cb_kwargs={'page': page},
+        )
+    
     def parse(self, response):
         """解析游戏列表页"""
-        logger.info(f"开始解析Steam畅销游戏页面: {response.url}")
+        logger.info(f"开始解析{self.list_label}页面: {response.url}")
+        
+        rows = row_extractor.extract(response)
+        logger.info(f"找到 {len(rows)} 个游戏")
         
-        # 尝试多种CSS选择器
-        games = response.css('div#search_resultsRows a.search_result_row')
-        if not games:
-            games = response.css('a.search_result_row')
-        if not games:
-            games = response.css('div.search_result_row')
+        yield from self._follow_rows(response, enumerate(rows), rank_offset=0)
+    
+    def parse_search_page(self, response, page):
+        """解析搜索结果JSON分片"""
+        try:
+            data = response.json()
+        except (AttributeError, ValueError) as e:
+            # 限流页、错误页等非JSON响应
+            logger.warning(f"{self.list_label}第 {page + 1} 页不是有效的JSON: {response.url} ({e})")
+            self.crawler.stats.inc_value('search/invalid_json')
+            return
+        rows = row_extractor.extract(Selector(text=data.get('results_html') or '<html></html>'))
         
-        logger.info(f"找到 {len(games)} 个游戏")
+        # 保留行在本页中的位置，去掉重复行后其余行的排名不变
+        new_rows = []
+        for index, row in enumerate(rows):
+            if row['app_id'] and row['app_id'] in self.seen_app_ids:
+                continue
+            if row['app_id']:
+                self.seen_app_ids.add(row['app_id'])
+            new_rows.append((index, row))
         
-        for i, game in enumerate(games):
-            item = SteamGameItem()
-            
-            # 排名信息
-            item['rank'] = i + 1  # 排名从1开始
-            item['rank_type'] = 'topsellers'  # 热销榜类型
-            
-            # 基本信息
-            item['name'] = game.css('span.title::text').get()
-            if not item['name']:
-                item['name'] = game.css('div.search_name a span::text').get()
-            
-            item['app_id'] = game.attrib.get('data-ds-appid')
-            if not item['app_id']:
-                # 从URL中提取app_id
-                href = game.attrib.get('href', '')
-                app_match = re.search(r'/app/(\d+)/', href)
-                if app_match:
-                    item['app_id'] = app_match.group(1)
-            
-            # 价格信息
-            price_elem = game.css('div.discount_final_price::text')
-            if price_elem:
-                item['price'] = price_elem.get().strip()
-            else:
-                # 尝试其他价格选择器
-                price_elem = game.css('div.search_price::text')
-                if price_elem:
-                    item['price'] = price_elem.get().strip()
-            
-            original_price_elem = game.css('div.discount_original_price::text')
-            if original_price_elem:
-                item['original_price'] = original_price_elem.get().strip()
-            
-            # 折扣信息
-            discount_elem = game.css('div.discount_pct::text')
-            if discount_elem:
-                discount_text = discount_elem.get()
-                if discount_text:
-                    match = re.search(r'-(\d+)%', discount_text)
-                    if match:
-                        item['discount_percent'] = match.group(1)
-            
-            # 开发商
-            item['developer'] = game.css('div.search_developer::text').get()
-            if not item['developer']:
-                item['developer'] = game.css('div.search_developer span::text').get()
-            
-            # 爬取时间
-            item['crawl_time'] = datetime.now().isoformat()
-            item['crawl_date'] = datetime.now().strftime('%Y-%m-%d')
+        start = int(data.get('start', page * self.page_size))
+        logger.info(f"{self.list_label}第 {page + 1} 页: {len(rows)} 个游戏, 新增 {len(new_rows)} 个")
+        
+        if not new_rows:
+            # 没有新的app_id，说明已到列表末尾，不再调度后续分页
+            logger.info(f"{self.list_label}第 {page + 1} 页无新数据，停止分页")
+            return
+        
+        yield from self._follow_rows(response, new_rows, rank_offset=start)
+        if not self.follow_next_pages:
+            return
+        
+        # 每完成一页，补充调度窗口之后的下一页
+        next_page = page + self.page_window
+        total_count = data.get('total_count')
+        if next_page < self.max_pages and (total_count is None or next_page * self.page_size < int(total_count)):
+            yield self._search_page_request(next_page)
+    
+    def _follow_rows(self, response, indexed_rows, rank_offset):
+        """为列表行构建数据项并进入详情页，indexed_rows为 (行在页中的位置, 行) 序列"""
+        for index, row in indexed_rows:
+            rank = rank_offset + index + 1
+            item = build_record(row, rank=rank, rank_type=self.rank_type)
             
-            logger.info(f"解析游戏 {i+1}: {item['name']} (ID: {item['app_id']})")
+            logger.info(f"解析游戏 {rank}: {item['name']} (ID: {item['app_id']})")
             
             # 进入详情页获取更多信息
-            detail_url = game.attrib.get('href')
-            if detail_url:
+            detail_url = row['detail_url']
+            if detail_url and self._merge_cached_detail(item):
+                # 详情缓存仍然新鲜，跳过详情页请求
+                yield item.to_item()
+            elif detail_url:
                 yield response.follow(
                     detail_url, 
                     self.parse_detail, 
@@ -101,10 +188,10 @@ class SteamTopSellersSpider(scrapy.Spider):
                 )
             else:
                 # 如果没有详情页，直接yield当前数据
-                yield item
-
+                yield item.to_item()
+    
     def parse_detail(self, response):
-        """解析游戏详情页"""
+        """解析游戏详情页，按detail_groups解析对应的字段分组"""
         item = response.meta['item']
         logger.info(f"解析详情页: {item['name']}")
         
@@ -129,136 +216,86 @@ class SteamTopSellersSpider(scrapy.Spider):
             item['genres'] = [genre.strip() for genre in genres]
         
         # 标签
-        tags = response.css('a.app_tag::text').getall()
-        if tags:
-            item['tags'] = [tag.strip() for tag in tags[:10]]  # 限制标签数量
-        
-        # 评分信息
-        positive_rate_elem = response.css('span.game_review_summary::text')
-        if positive_rate_elem:
-            positive_text = positive_rate_elem.get()
-            if positive_text:
-                # 提取好评率数字
-                match = re.search(r'(\d+)%', positive_text)
-                if match:
-                    item['positive_rate'] = match.group(1)
+        if 'tags' in self.detail_groups:
+            tags = response.css('a.app_tag::text').getall()
+            if tags:
+                item['tags'] = [tag.strip() for tag in tags[:10]]  # 限制标签数量
         
-        # 评论数量
-        reviews_elem = response.css('span.responsive_hidden::text')
-        if reviews_elem:
-            reviews_text = reviews_elem.get()
-            if reviews_text:
-                # 提取评论数量
-                match = re.search(r'(\d+(?:,\d+)*)', reviews_text)
-                if match:
-                    item['total_reviews'] = match.group(1).replace(',', '')
+        if 'reviews' in self.detail_groups:
+            # 评分信息
+            positive_rate_elem = response.css('span.game_review_summary::text')
+            if positive_rate_elem:
+                positive_text = positive_rate_elem.get()
+                if positive_text:
+                    # 提取好评率数字
+                    match = re.search(r'(\d+)%', positive_text)
+                    if match:
+                        item['positive_rate'] = match.group(1)
+            
+            # 评论数量
+            reviews_elem = response.css('span.responsive_hidden::text')
+            if reviews_elem:
+                reviews_text = reviews_elem.get()
+                if reviews_text:
+                    # 提取评论数量
+                    match = re.search(r'(\d+(?:,\d+)*)', reviews_text)
+                    if match:
+                        item['total_reviews'] = match.group(1).replace(',', '')
         
+        self._store_detail(item)
         logger.info(f"详情页解析完成: {item['name']}")
-        yield item
+        yield item.to_item()
+    
+    def _merge_cached_detail(self, item):
+        """把新鲜的详情缓存合并进数据项，命中时返回True"""
+        if self.detail_cache is None or not item['app_id']:
+            return False
+        
+        cached = self.detail_cache.get_fresh(item['app_id'], self.detail_groups)
+        if cached is None:
+            self.crawler.stats.inc_value('detail_cache/miss')
+            return False
+        
+        item.update(cached)
+        self.crawler.stats.inc_value('detail_cache/hit')
+        return True
+    
+    def _store_detail(self, item):
+        """保存详情页解析结果到缓存"""
+        if self.detail_cache is not None and item.get('app_id'):
+            self.detail_cache.store(item['app_id'], item, self.detail_groups)
+
+
+class SteamTopSellersSpider(SteamSearchSpider):
+    """Steam畅销游戏爬虫"""
+    name = "steam_top_sellers"
+    allowed_domains = ["steampowered.com"]
+    start_urls = ["https://store.steampowered.com/search/?filter=topsellers&cc=cn"]  # 中国区
+    search_filter = "topsellers"
+    rank_type = "topsellers"  # 热销榜类型
+    list_label = "Steam畅销游戏"
+    detail_groups = ("static", "tags", "reviews")
+    
+    custom_settings = {
+        "DOWNLOAD_DELAY": 3,  # 合规延迟（启用自适应限速时为初始延迟）
+        # 移除Playwright设置，使用标准HTTP下载器
+        # "PLAYWRIGHT_ENABLED": True,
+        # "PLAYWRIGHT_DEFAULT_NAVIGATION_TIMEOUT": 30000,
+    }
 
 
-class SteamPopularSpider(scrapy.Spider):
+class SteamPopularSpider(SteamSearchSpider):
     """Steam热门游戏爬虫"""
     name = "steam_popular"
     allowed_domains = ["steampowered.com"]
     start_urls = ["https://store.steampowered.com/search/?filter=popularnew&cc=cn"]  # 中国区
+    search_filter = "popularnew"
+    rank_type = "popular"  # 热门榜类型
+    list_label = "Steam热门游戏"
+    detail_groups = ("static",)
     
     custom_settings = {
-        "DOWNLOAD_DELAY": 2,
+        "DOWNLOAD_DELAY": 2,  # 启用自适应限速时为初始延迟
         # 移除Playwright设置，使用标准HTTP下载器
         # "PLAYWRIGHT_ENABLED": True,
     }
-
-    def parse(self, response):
-        """解析热门游戏列表"""
-        logger.info(f"开始解析Steam热门游戏页面: {response.url}")
-        
-        # 尝试多种CSS选择器
-        games = response.css('div#search_resultsRows a.search_result_row')
-        if not games:
-            games = response.css('a.search_result_row')
-        if not games:
-            games = response.css('div.search_result_row')
-        
-        logger.info(f"找到 {len(games)} 个游戏")
-        
-        for i, game in enumerate(games):
-            item = SteamGameItem()
-            
-            # 排名信息
-            item['rank'] = i + 1  # 排名从1开始
-            item['rank_type'] = 'popular'  # 热门榜类型
-            
-            # 基本信息
-            item['name'] = game.css('span.title::text').get()
-            if not item['name']:
-                item['name'] = game.css('div.search_name a span::text').get()
-            
-            item['app_id'] = game.attrib.get('data-ds-appid')
-            if not item['app_id']:
-                # 从URL中提取app_id
-                href = game.attrib.get('href', '')
-                app_match = re.search(r'/app/(\d+)/', href)
-                if app_match:
-                    item['app_id'] = app_match.group(1)
-            
-            # 价格信息
-            price_elem = game.css('div.discount_final_price::text')
-            if price_elem:
-                item['price'] = price_elem.get().strip()
-            else:
-                # 尝试其他价格选择器
-                price_elem = game.css('div.search_price::text')
-                if price_elem:
-                    item['price'] = price_elem.get().strip()
-            
-            # 开发商
-            item['developer'] = game.css('div.search_developer::text').get()
-            if not item['developer']:
-                item['developer'] = game.css('div.search_developer span::text').get()
-            
-            # 爬取时间
-            item['crawl_time'] = datetime.now().isoformat()
-            item['crawl_date'] = datetime.now().strftime('%Y-%m-%d')
-            
-            logger.info(f"解析游戏 {i+1}: {item['name']} (ID: {item['app_id']})")
-            
-            # 进入详情页
-            detail_url = game.attrib.get('href')
-            if detail_url:
-                yield response.follow(
-                    detail_url, 
-                    self.parse_detail, 
-                    meta={'item': item}
-                )
-            else:
-                # 如果没有详情页，直接yield当前数据
-                yield item
-
-    def parse_detail(self, response):
-        """解析游戏详情页"""
-        item = response.meta['item']
-        logger.info(f"解析详情页: {item['name']}")
-        
-        # 发行商
-        publisher_elem = response.css('div.dev_row:contains("发行商") a::text')
-        if publisher_elem:
-            item['publisher'] = publisher_elem.get()
-        else:
-            # 尝试其他选择器
-            publisher_elem = response.css('div.dev_row a::text')
-            if publisher_elem:
-                item['publisher'] = publisher_elem.get()
-        
-        # 发行日期
-        release_date_elem = response.css('div.date::text')
-        if release_date_elem:
-            item['release_date'] = release_date_elem.get().strip()
-        
-        # 游戏类型
-        genres = response.css('a.genre::text').getall()
-        if genres:
-            item['genres'] = [genre.strip() for genre in genres]
-        
-        logger.info(f"详情页解析完成: {item['name']}")
-        yield item 
\ No newline at end of file
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Web缓存失效通知
+
+爬虫写入新数据后发布 snapshot_ready 事件，由Web进程 (web.utils.cache_warmer)
+把受影响的看板数据预热到下一代缓存后再切换；没有Web进程订阅时直接递增
+受影响命名空间的代数，并通过Redis发布订阅通知各Web进程丢弃本地缓存。
+键格式和消息格式与 web.utils.database.CacheManager 一致：代数保存在
+'<前缀>:<命名空间>:gen'，缓存键为 '<前缀>:<命名空间>:v<代数>:<名称>'。
+只递增计数器，耗时与缓存键数量无关，Web缓存可以使用较长的TTL。
+"""
+
+import json
+import time
+import uuid
+from loguru import logger
+
+# Steam榜单爬虫写入的数据影响的Web缓存命名空间。Web排行榜的各排序方式都读取整张
+# steam_games 表，任一榜单爬虫写入后全部失效，因此排行榜只使用一个命名空间
+STEAM_CRAWL_NAMESPACES = ('dashboard', 'charts', 'games', 'rankings')
+
+
+def steam_crawl_namespaces():
+    """一次Steam榜单抓取后需要失效的命名空间"""
+    return list(STEAM_CRAWL_NAMESPACES)
+
+
+class WebCacheInvalidator:
+    """使Web缓存的命名空间失效"""
+
+    def __init__(self, redis_url, key_prefix='gamemarket:cache', channel='gamemarket:cache:invalidate',
+                 snapshot_channel='gamemarket:crawl:snapshot_ready'):
+        import redis
+        self.client = redis.from_url(redis_url, socket_connect_timeout=3, socket_timeout=3)
+        self.key_prefix = key_prefix
+        self.channel = channel
+        self.snapshot_channel = snapshot_channel
+        self.origin = f'crawler-{uuid.uuid4().hex}'
+
+    @classmethod
+    def from_settings(cls, settings):
+        """根据设置创建实例，未启用时返回None"""
+        if not settings.getbool('WEB_CACHE_INVALIDATION_ENABLED', True):
+            return None
+        return cls(
+            settings.get('REDIS_URL', 'redis://localhost:6379'),
+            settings.get('WEB_CACHE_KEY_PREFIX', 'gamemarket:cache'),
+            settings.get('WEB_CACHE_INVALIDATION_CHANNEL', 'gamemarket:cache:invalidate'),
+            settings.get('WEB_SNAPSHOT_CHANNEL', 'gamemarket:crawl:snapshot_ready'),
+        )
+
+    def snapshot_ready(self, spider_name, namespaces):
+        """发布快照就绪事件，返回收到事件的Web进程数；没有进程订阅时直接使命名空间失效"""
+        namespaces = list(namespaces)
+        message = {'spider': spider_name, 'namespaces': namespaces, 'finished_at': time.time()}
+        try:
+            receivers = self.client.publish(self.snapshot_channel, json.dumps(message))
+        except Exception as e:
+            logger.warning(f"发布快照就绪事件失败: {e}")
+            return 0
+        if not receivers:
+            self.invalidate(namespaces)
+        else:
+            logger.info(f"快照就绪事件已发布: {spider_name} ({receivers} 个Web进程)")
+        return receivers
+
+    def invalidate(self, namespaces):
+        """递增命名空间代数并发布失效通知，返回是否成功（Redis不可用时不影响爬虫）"""
+        namespaces = list(namespaces)
+        if not namespaces:
+            return False
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for namespace in namespaces:
+                pipe.incr(f'{self.key_prefix}:{namespace}:gen')
+            message = {'origin': self.origin, 'keys': [], 'patterns': [], 'namespaces': namespaces, 'all': False}
+            pipe.publish(self.channel, json.dumps(message))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Web缓存失效通知失败: {e}")
+            return False
+        logger.info(f"Web缓存已失效: {', '.join(namespaces)}")
+        return True
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+详情页数据缓存
+
+按app_id保存详情页解析结果，字段按变化频率分组并分别设置有效期：
+发行商/发行日期/类型几乎不变，评测数据变化较快。缓存仍然新鲜时，
+爬虫直接合并缓存数据并跳过详情页请求。
+"""
+
+import os
+import json
+import time
+import sqlite3
+from loguru import logger
+
+
+# 字段分组 (分组名 -> 字段列表)
+FIELD_GROUPS = {
+    'static': ('publisher', 'release_date', 'genres'),
+    'tags': ('tags',),
+    'reviews': ('positive_rate', 'total_reviews'),
+}
+
+# 各分组的必需字段：缺少任一字段说明详情页没有正常解析（年龄验证、渲染失败、
+# 页面改版等），这样的分组不保存，已保存的也不视为新鲜
+REQUIRED_FIELDS = {
+    'static': ('publisher', 'release_date'),
+    'tags': ('tags',),
+    'reviews': ('positive_rate', 'total_reviews'),
+}
+
+# 默认有效期 (秒)
+DEFAULT_TTLS = {
+    'static': 7 * 24 * 3600,
+    'tags': 3 * 24 * 3600,
+    'reviews': 6 * 3600,
+}
+
+
+def is_complete(group, data):
+    """分组的必需字段都有值（空字符串、空列表视为缺失）"""
+    return all(data.get(field) not in (None, '', []) for field in REQUIRED_FIELDS.get(group, ()))
+
+
+class DetailCache:
+    """详情页数据缓存基类"""
+    
+    def __init__(self, ttls=None):
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+    
+    @classmethod
+    def from_settings(cls, settings):
+        """根据设置创建缓存实例"""
+        ttls = settings.getdict('DETAIL_CACHE_TTL')
+        backend = settings.get('DETAIL_CACHE_BACKEND', 'sqlite')
+        if backend == 'redis':
+            return RedisDetailCache(settings.get('REDIS_URL', 'redis://localhost:6379'), ttls)
+        if backend == 'sqlite':
+            return SQLiteDetailCache(settings.get('DETAIL_CACHE_PATH', 'data/detail_cache.sqlite'), ttls)
+        raise ValueError(f"不支持的详情缓存后端: {backend}")
+    
+    def get_fresh(self, app_id, groups):
+        """所有分组都在有效期内时返回合并后的字段，否则返回None"""
+        entries = self._load(app_id, groups)
+        now = time.time()
+        fields = {}
+        for group in groups:
+            entry = entries.get(group)
+            if entry is None:
+                return None
+            updated_at, data = entry
+            if now - updated_at > self.ttls.get(group, 0) or not is_complete(group, data):
+                return None
+            fields.update(data)
+        return fields
+    
+    def store(self, app_id, item, groups):
+        """按分组保存数据项中的详情字段，跳过缺少必需字段的分组，返回保存的分组数"""
+        now = time.time()
+        entries = {}
+        for group in groups:
+            data = {
+                field: item[field] for field in FIELD_GROUPS[group] if item.get(field) is not None
+            }
+            if is_complete(group, data):
+                entries[group] = data
+        if entries:
+            self._save(app_id, entries, now)
+        return len(entries)
+    
+    def close(self):
+        """关闭缓存"""
+    
+    def _load(self, app_id, groups):
+        """读取分组数据，返回 {分组: (更新时间, 字段字典)}"""
+        raise NotImplementedError
+    
+    def _save(self, app_id, entries, updated_at):
+        """写入分组数据"""
+        raise NotImplementedError
+
+
+class SQLiteDetailCache(DetailCache):
+    """本地磁盘缓存 (SQLite单文件)"""
+    
+    def __init__(self, path, ttls=None):
+        super().__init__(ttls)
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS detail_cache (
+                app_id TEXT NOT NULL,
+                field_group TEXT NOT NULL,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (app_id, field_group)
+            )
+        """)
+        self.connection.commit()
+        logger.info(f"详情缓存已打开: {path}")
+    
+    def _load(self, app_id, groups):
+        placeholders = ','.join('?' * len(groups))
+        rows = self.connection.execute(
+            f"SELECT field_group, data, updated_at FROM detail_cache "
+            f"WHERE app_id = ? AND field_group IN ({placeholders})",
+            (app_id, *groups)
+        ).fetchall()
+        return {group: (updated_at, json.loads(data)) for group, data, updated_at in rows}
+    
+    def _save(self, app_id, entries, updated_at):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO detail_cache (app_id, field_group, data, updated_at) VALUES (?, ?, ?, ?)",
+            [(app_id, group, json.dumps(data, ensure_ascii=False), updated_at) for group, data in entries.items()]
+        )
+        self.connection.commit()
+    
+    def close(self):
+        self.connection.close()
+
+
+class RedisDetailCache(DetailCache):
+    """Redis缓存，多个爬虫节点共享"""
+    
+    key_prefix = 'steam:detail:'
+    
+    def __init__(self, redis_url, ttls=None):
+        super().__init__(ttls)
+        import redis
+        self.client = redis.from_url(redis_url)
+        # 整个哈希的过期时间取最长的分组有效期
+        self.key_ttl = int(max(self.ttls.values()))
+    
+    def _load(self, app_id, groups):
+        values = self.client.hmget(f"{self.key_prefix}{app_id}", list(groups))
+        entries = {}
+        for group, value in zip(groups, values):
+            if value:
+                entry = json.loads(value)
+                entries[group] = (entry['t'], entry['d'])
+        return entries
+    
+    def _save(self, app_id, entries, updated_at):
+        key = f"{self.key_prefix}{app_id}"
+        mapping = {
+            group: json.dumps({'t': updated_at, 'd': data}, ensure_ascii=False)
+            for group, data in entries.items()
+        }
+        pipe = self.client.pipeline()
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, self.key_ttl)
+        pipe.execute()
+    
+    def close(self):
+        self.client.close()
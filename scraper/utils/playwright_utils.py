@@ -2,22 +2,325 @@
 """
 Playwright 工具模块
 提供浏览器自动化、截图、资源管理等功能
+
+BrowserPool 复用长期运行的浏览器，把浏览器上下文中的页面出借给并发任务，
+避免每个URL都启动一次浏览器（数秒）。
+BlockProfile 拦截不需要的资源（图片、字体、视频、统计脚本），
+extract_fragment 只序列化需要解析的DOM片段。
 """
 
 import os
+import re
 import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional, Dict, Any
-from playwright.async_api import async_playwright, Browser, Page
+from typing import Optional, Dict, Any, List
+from loguru import logger
+
+try:
+    from playwright.async_api import async_playwright, Browser, Page
+except ImportError:  # playwright为可选依赖，未安装时浏览器池不可用
+    async_playwright = None
+    Browser = Page = Any
+
+# 各浏览器的启动参数
+LAUNCH_ARGS = {
+    "firefox": ['--no-sandbox', '--disable-dev-shm-usage'],
+    "webkit": [],
+    "chromium": ['--no-sandbox'],
+}
+
+# 资源拦截配置：按资源类型和URL正则拦截
+# Steam商店页面的截图、预告片和统计脚本占页面流量的绝大部分，解析时都用不到
+BLOCK_PROFILES = {
+    "none": {},
+    "light": {
+        "resource_types": ["image", "media", "font"],
+        "url_patterns": [
+            r"google-analytics\.com", r"googletagmanager\.com", r"doubleclick\.net",
+            r"facebook\.(net|com)/tr", r"\.(mp4|webm|m3u8|mpd)(\?|$)",
+            r"steamstatic\.com/steam/apps/\d+/(movie|microtrailer)",
+        ],
+    },
+    "strict": {
+        "resource_types": ["image", "media", "font", "stylesheet", "texttrack", "websocket", "manifest", "other"],
+        "url_patterns": [
+            r"google-analytics\.com", r"googletagmanager\.com", r"doubleclick\.net",
+            r"facebook\.(net|com)/tr", r"\.(mp4|webm|m3u8|mpd)(\?|$)",
+            r"steamstatic\.com/steam/apps/\d+/(movie|microtrailer)",
+            r"steamcommunity\.com/(public/javascript|libraries)",
+        ],
+    },
+}
+
+# 序列化匹配选择器的全部元素（比 page.content() 序列化整个DOM小得多）
+FRAGMENT_SCRIPT = "els => els.map(el => el.outerHTML).join('\\n')"
+
+# Chromium中读取页面JS堆大小（其他浏览器没有performance.memory，返回0）
+JS_HEAP_SCRIPT = "() => (performance.memory ? performance.memory.usedJSHeapSize : 0)"
+
+
+class BlockProfile:
+    """请求拦截配置，对浏览器上下文或页面启用后中止匹配的请求"""
+
+    def __init__(self, name: str = "custom", resource_types=(), url_patterns=()):
+        self.name = name
+        self.resource_types = frozenset(resource_types)
+        self.url_pattern = re.compile("|".join(f"(?:{p})" for p in url_patterns)) if url_patterns else None
+        self.blocked = 0
+        self.allowed = 0
+
+    @classmethod
+    def from_name(cls, name: str) -> "BlockProfile":
+        if name not in BLOCK_PROFILES:
+            raise ValueError(f"未知的资源拦截配置: {name}")
+        return cls(name, **BLOCK_PROFILES[name])
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.resource_types) or self.url_pattern is not None
+
+    def should_block(self, resource_type: str, url: str) -> bool:
+        if resource_type in self.resource_types:
+            return True
+        return self.url_pattern is not None and self.url_pattern.search(url) is not None
+
+    async def handle(self, route):
+        request = route.request
+        if self.should_block(request.resource_type, request.url):
+            self.blocked += 1
+            await route.abort()
+        else:
+            self.allowed += 1
+            await route.continue_()
+
+    async def apply(self, target):
+        """对BrowserContext或Page启用拦截（不拦截任何资源时不注册路由，避免额外开销）"""
+        if self.enabled:
+            await target.route("**/*", self.handle)
+
+
+def get_block_profile(profile) -> Optional[BlockProfile]:
+    """由配置名或BlockProfile得到拦截配置，None/"none"表示不拦截"""
+    if profile is None or isinstance(profile, BlockProfile):
+        return profile
+    return BlockProfile.from_name(profile) if profile != "none" else None
+
+
+async def extract_fragment(page: Page, selector: str) -> Optional[str]:
+    """只序列化匹配选择器的DOM片段，没有匹配元素时返回None"""
+    fragment = await page.eval_on_selector_all(selector, FRAGMENT_SCRIPT)
+    if not fragment:
+        return None
+    return f"<html><body>{fragment}</body></html>"
+
+
+class PooledContext:
+    """池中的浏览器上下文及其复用的页面"""
+    __slots__ = ('browser', 'context', 'page', 'uses')
+
+    def __init__(self, browser, context, page):
+        self.browser = browser
+        self.context = context
+        self.page = page
+        self.uses = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.browser.is_connected() and not self.page.is_closed()
+
+
+class BrowserPool:
+    """浏览器/上下文池
+
+    - 最多 max_browsers 个浏览器共用一个Playwright驱动，每个浏览器最多
+      contexts_per_browser 个同时出借的上下文，超出的任务排队等待
+    - 上下文在使用 max_uses 次、JS堆超过 max_memory_mb 或使用中出错后关闭重建
+    - start() 预先启动浏览器并创建 warm_contexts 个上下文
+    - 浏览器断开（崩溃）时自动重新启动
+    - block_profile 对每个上下文启用资源拦截（配置名或BlockProfile）
+
+    使用方法:
+        async with BrowserPool("chromium") as pool:
+            async with pool.page() as page:
+                await page.goto(url)
+    """
+
+    def __init__(self, browser_type: str = "chromium", headless: bool = True,
+                 max_browsers: int = 1, contexts_per_browser: int = 4,
+                 max_uses: int = 50, max_memory_mb: int = 0, warm_contexts: int = 1,
+                 launch_options: Optional[Dict[str, Any]] = None,
+                 context_options: Optional[Dict[str, Any]] = None,
+                 block_profile=None, playwright=None):
+        browser_type = browser_type.lower()
+        if browser_type not in LAUNCH_ARGS:
+            raise ValueError(f"不支持的浏览器类型: {browser_type}")
+        self.browser_type = browser_type
+        self.headless = headless
+        self.max_browsers = max(1, max_browsers)
+        self.contexts_per_browser = max(1, contexts_per_browser)
+        self.max_uses = max_uses
+        self.max_memory = max_memory_mb * 1024 * 1024
+        self.warm_contexts = warm_contexts
+        self.launch_options = launch_options or {}
+        self.context_options = context_options or {}
+        self.block_profile = get_block_profile(block_profile)
+        self.playwright = playwright
+        self._owns_driver = playwright is None  # 外部传入的驱动由调用方停止
+        self.browsers: List[Browser] = []
+        self._idle: List[PooledContext] = []
+        self._leased = set()
+        self._semaphore = asyncio.Semaphore(self.max_leases)
+        self._lock = asyncio.Lock()
+        self._started = False
+        self._closed = False
+        self.stats = {"leases": 0, "contexts_created": 0, "contexts_recycled": 0, "browsers_launched": 0}
+
+    @property
+    def max_leases(self) -> int:
+        return self.max_browsers * self.contexts_per_browser
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.shutdown()
+
+    async def start(self):
+        """启动驱动和浏览器并预热上下文"""
+        async with self._lock:
+            if self._started:
+                return self
+            if self.playwright is None:
+                if async_playwright is None:
+                    raise RuntimeError("浏览器池需要安装playwright: pip install playwright")
+                self.playwright = await async_playwright().start()
+            for _ in range(self.max_browsers):
+                self.browsers.append(await self._launch())
+            self._started = True
+        for _ in range(min(self.warm_contexts, self.max_leases)):
+            self._idle.append(await self._new_context())
+        logger.info(f"浏览器池已启动: {self.browser_type} x{self.max_browsers}, "
+                    f"最多 {self.max_leases} 个并发页面")
+        return self
+
+    async def _launch(self) -> Browser:
+        options = {"headless": self.headless, **self.launch_options}
+        if LAUNCH_ARGS[self.browser_type]:
+            options.setdefault("args", LAUNCH_ARGS[self.browser_type])
+        browser = await getattr(self.playwright, self.browser_type).launch(**options)
+        self.stats["browsers_launched"] += 1
+        return browser
+
+    async def _pick_browser(self) -> Browser:
+        """选择上下文最少的浏览器，替换已断开的浏览器"""
+        async with self._lock:
+            for index, browser in enumerate(self.browsers):
+                if not browser.is_connected():
+                    logger.warning(f"{self.browser_type} 浏览器已断开，重新启动")
+                    self.browsers[index] = await self._launch()
+            return min(self.browsers, key=lambda browser: len(browser.contexts))
+
+    async def _new_context(self) -> PooledContext:
+        browser = await self._pick_browser()
+        context = await browser.new_context(**self.context_options)
+        if self.block_profile is not None:
+            await self.block_profile.apply(context)
+        page = await context.new_page()
+        self.stats["contexts_created"] += 1
+        return PooledContext(browser, context, page)
+
+    @asynccontextmanager
+    async def page(self):
+        """出借一个页面，退出时归还；使用中抛出异常的上下文会被重建"""
+        if not self._started:
+            await self.start()
+        async with self._semaphore:
+            if self._closed:
+                raise RuntimeError("浏览器池已关闭")
+            pooled = await self._acquire()
+            healthy = False
+            try:
+                yield pooled.page
+                healthy = True
+            finally:
+                await self._release(pooled, healthy)
+
+    async def _acquire(self) -> PooledContext:
+        while self._idle:
+            pooled = self._idle.pop()  # 后进先出，优先使用最近用过的上下文
+            if pooled.alive:
+                break
+            await self._discard(pooled)
+        else:
+            pooled = await self._new_context()
+        self._leased.add(pooled)
+        return pooled
+
+    async def _release(self, pooled: PooledContext, healthy: bool):
+        self._leased.discard(pooled)
+        pooled.uses += 1
+        self.stats["leases"] += 1
+        if self._closed:
+            await self._discard(pooled)
+            return
+        if not healthy or not pooled.alive or pooled.uses >= self.max_uses or await self._over_memory(pooled):
+            self.stats["contexts_recycled"] += 1
+            await self._discard(pooled)
+            return
+        try:
+            await pooled.page.goto("about:blank")  # 释放上一个页面的DOM
+        except Exception:
+            await self._discard(pooled)
+            return
+        self._idle.append(pooled)
+
+    async def _over_memory(self, pooled: PooledContext) -> bool:
+        if self.max_memory <= 0:
+            return False
+        try:
+            return (await pooled.page.evaluate(JS_HEAP_SCRIPT) or 0) > self.max_memory
+        except Exception:
+            return True
+
+    async def _discard(self, pooled: PooledContext):
+        try:
+            await pooled.context.close()
+        except Exception:
+            pass  # 浏览器已断开或关闭
+
+    async def shutdown(self):
+        """关闭所有上下文、浏览器，并停止自己启动的驱动"""
+        if self._closed:
+            return
+        self._closed = True
+        for pooled in self._idle + list(self._leased):
+            await self._discard(pooled)
+        self._idle.clear()
+        for browser in self.browsers:
+            try:
+                await browser.close()
+            except Exception:
+                pass
+        self.browsers.clear()
+        if self._owns_driver and self.playwright is not None:
+            await self.playwright.stop()
+        self.playwright = None
+        logger.info(f"浏览器池已关闭: 出借 {self.stats['leases']} 次, "
+                    f"创建 {self.stats['contexts_created']} 个上下文")
+
 
 class PlaywrightManager:
     """Playwright 管理器"""
     
-    def __init__(self, resources_dir: str = "resources"):
+    def __init__(self, resources_dir: str = "resources", block_profile="light", screenshots: bool = False):
         self.resources_dir = resources_dir
+        self.block_profile = block_profile  # 新页面和浏览器池使用的资源拦截配置
+        self.screenshots = screenshots  # navigate_and_screenshot 默认是否截图
+        self.playwright = None
         self.browser = None
         self.page = None
-        self._ensure_resources_dir()
+        self.pools: Dict[str, BrowserPool] = {}
     
     def _ensure_resources_dir(self):
         """确保资源目录存在"""
@@ -33,66 +336,93 @@ class PlaywrightManager:
     
     async def take_screenshot(self, page: Page, page_name: str, browser_name: str = "firefox") -> str:
         """通用截图函数"""
+        self._ensure_resources_dir()
         screenshot_path = self.get_screenshot_path(page_name, browser_name)
         await page.screenshot(path=screenshot_path)
         print(f"📸 截图已保存: {screenshot_path}")
         return screenshot_path
     
+    async def _ensure_playwright(self):
+        """启动Playwright驱动（整个管理器只启动一次）"""
+        if self.playwright is None:
+            self.playwright = await async_playwright().start()
+        return self.playwright
+    
     async def launch_browser(self, browser_type: str = "firefox", headless: bool = True) -> Browser:
-        """启动浏览器"""
-        playwright = await async_playwright().start()
-        
-        if browser_type.lower() == "firefox":
-            self.browser = await playwright.firefox.launch(
-                headless=headless,
-                args=['--no-sandbox', '--disable-dev-shm-usage']
-            )
-        elif browser_type.lower() == "webkit":
-            self.browser = await playwright.webkit.launch(headless=headless)
-        elif browser_type.lower() == "chromium":
-            self.browser = await playwright.chromium.launch(
-                headless=headless,
-                args=['--no-sandbox']
-            )
-        else:
+        """启动浏览器（复用驱动，并关闭之前启动的浏览器）"""
+        browser_type = browser_type.lower()
+        if browser_type not in LAUNCH_ARGS:
             raise ValueError(f"不支持的浏览器类型: {browser_type}")
         
+        await self._close_browser()
+        playwright = await self._ensure_playwright()
+        options = {"headless": headless}
+        if LAUNCH_ARGS[browser_type]:
+            options["args"] = LAUNCH_ARGS[browser_type]
+        self.browser = await getattr(playwright, browser_type).launch(**options)
         return self.browser
     
-    async def create_page(self) -> Page:
-        """创建新页面"""
+    async def get_pool(self, browser_type: str = "firefox", **options) -> BrowserPool:
+        """获取（首次调用时创建并预热）指定浏览器类型的浏览器池"""
+        browser_type = browser_type.lower()
+        pool = self.pools.get(browser_type)
+        if pool is None:
+            playwright = await self._ensure_playwright()
+            options.setdefault("block_profile", self.block_profile)
+            pool = BrowserPool(browser_type, playwright=playwright, **options)
+            self.pools[browser_type] = pool
+            await pool.start()
+        return pool
+    
+    async def create_page(self, block_profile=None) -> Page:
+        """创建新页面，默认使用管理器的资源拦截配置"""
         if not self.browser:
             raise RuntimeError("请先启动浏览器")
         
         self.page = await self.browser.new_page()
+        profile = get_block_profile(block_profile if block_profile is not None else self.block_profile)
+        if profile is not None:
+            await profile.apply(self.page)
         return self.page
     
     async def navigate_and_screenshot(self, url: str, page_name: str, 
                                     browser_type: str = "firefox", 
-                                    timeout: int = 10000) -> Dict[str, Any]:
-        """导航到页面并截图"""
+                                    timeout: int = 10000,
+                                    screenshot: Optional[bool] = None,
+                                    fragment_selector: Optional[str] = None) -> Dict[str, Any]:
+        """导航到页面并截图（从浏览器池借用页面，浏览器在调用之间保持运行）
+        
+        screenshot 默认取管理器的 screenshots 设置（关闭）；
+        指定 fragment_selector 时返回结果中的 html 只包含匹配的DOM片段。
+        """
+        if screenshot is None:
+            screenshot = self.screenshots
         try:
-            # 启动浏览器
-            await self.launch_browser(browser_type)
-            
-            # 创建页面
-            page = await self.create_page()
-            
-            # 导航到页面
-            print(f"🌐 访问页面: {url}")
-            await page.goto(url, timeout=timeout)
-            
-            # 获取页面信息
-            title = await page.title()
-            print(f"✅ 页面标题: {title}")
+            pool = await self.get_pool(browser_type)
             
-            # 截图
-            screenshot_path = await self.take_screenshot(page, page_name, browser_type)
+            async with pool.page() as page:
+                # 导航到页面
+                print(f"🌐 访问页面: {url}")
+                await page.goto(url, timeout=timeout)
+                
+                # 获取页面信息
+                title = await page.title()
+                print(f"✅ 页面标题: {title}")
+                
+                # 截图
+                screenshot_path = None
+                if screenshot:
+                    screenshot_path = await self.take_screenshot(page, page_name, browser_type)
+                
+                html = None
+                if fragment_selector:
+                    html = await extract_fragment(page, fragment_selector)
             
             return {
                 "success": True,
                 "title": title,
                 "screenshot_path": screenshot_path,
+                "html": html,
                 "url": url
             }
             
@@ -103,16 +433,24 @@ class PlaywrightManager:
                 "error": str(e),
                 "url": url
             }
-        
-        finally:
-            await self.close()
     
-    async def close(self):
-        """关闭浏览器"""
+    async def _close_browser(self):
         if self.page:
             await self.page.close()
+            self.page = None
         if self.browser:
             await self.browser.close()
+            self.browser = None
+    
+    async def close(self):
+        """关闭浏览器、浏览器池并停止驱动"""
+        await self._close_browser()
+        for pool in self.pools.values():
+            await pool.shutdown()
+        self.pools.clear()
+        if self.playwright is not None:
+            await self.playwright.stop()
+            self.playwright = None
 
 async def test_playwright_manager():
     """测试 PlaywrightManager"""
@@ -123,18 +461,23 @@ async def test_playwright_manager():
     # 测试不同浏览器
     browsers = ["firefox", "webkit", "chromium"]
     
-    for browser in browsers:
-        print(f"\n🔄 测试 {browser}...")
-        result = await manager.navigate_and_screenshot(
-            url="https://www.baidu.com",
-            page_name="test",
-            browser_type=browser
-        )
-        
-        if result["success"]:
-            print(f"✅ {browser} 测试成功")
-        else:
-            print(f"❌ {browser} 测试失败: {result.get('error', '未知错误')}")
+    try:
+        for browser in browsers:
+            print(f"\n🔄 测试 {browser}...")
+            result = await manager.navigate_and_screenshot(
+                url="https://www.baidu.com",
+                page_name="test",
+                browser_type=browser,
+                screenshot=True
+            )
+            
+            if result["success"]:
+                print(f"✅ {browser} 测试成功")
+            else:
+                print(f"❌ {browser} 测试失败: {result.get('error', '未知错误')}")
+    finally:
+        # 所有浏览器共用一个驱动，测试结束后统一关闭
+        await manager.close()
 
 if __name__ == "__main__":
     asyncio.run(test_playwright_manager()) 
\ No newline at end of file
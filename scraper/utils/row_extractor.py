@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Steam搜索列表行解析器
+
+所有CSS选择器和正则在模块加载时编译一次，列表容器的备选选择器
+每页只判定一次，每行的字段在一次遍历中全部取出。
+"""
+
+import re
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+
+
+_translator = HTMLTranslator()
+
+
+def _compile(css):
+    """把CSS选择器编译为lxml XPath对象"""
+    return etree.XPath(_translator.css_to_xpath(css))
+
+
+# 列表行容器（按优先级排列的备选选择器）
+ROW_SELECTORS = (
+    _compile('div#search_resultsRows a.search_result_row'),
+    _compile('a.search_result_row'),
+    _compile('div.search_result_row'),
+)
+
+# 行内字段（每个字段按优先级排列的备选选择器）
+FIELD_SELECTORS = {
+    'name': (
+        _compile('span.title::text'),
+        _compile('div.search_name a span::text'),
+    ),
+    'price': (
+        _compile('div.discount_final_price::text'),
+        _compile('div.search_price::text'),
+    ),
+    'original_price': (
+        _compile('div.discount_original_price::text'),
+    ),
+    'discount': (
+        _compile('div.discount_pct::text'),
+    ),
+    'developer': (
+        _compile('div.search_developer::text'),
+        _compile('div.search_developer span::text'),
+    ),
+}
+
+APP_ID_RE = re.compile(r'/app/(\d+)/')
+DISCOUNT_RE = re.compile(r'-(\d+)%')
+
+
+def _first_text(element, selectors):
+    """按顺序尝试备选选择器，返回第一个非空文本"""
+    for selector in selectors:
+        result = selector(element)
+        if result and result[0]:
+            return str(result[0])
+    return None
+
+
+class SearchRowExtractor:
+    """Steam搜索结果行解析器"""
+
+    def select_rows(self, response):
+        """选出列表行元素，备选选择器每页只判定一次"""
+        root = getattr(response, 'selector', response).root
+        for selector in ROW_SELECTORS:
+            rows = selector(root)
+            if rows:
+                return rows
+        return []
+
+    def extract_row(self, row):
+        """一次遍历提取单行的全部字段"""
+        href = row.get('href')
+
+        app_id = row.get('data-ds-appid')
+        if not app_id and href:
+            match = APP_ID_RE.search(href)
+            if match:
+                app_id = match.group(1)
+
+        price = _first_text(row, FIELD_SELECTORS['price'])
+        original_price = _first_text(row, FIELD_SELECTORS['original_price'])
+
+        discount_percent = None
+        discount_text = _first_text(row, FIELD_SELECTORS['discount'])
+        if discount_text:
+            match = DISCOUNT_RE.search(discount_text)
+            if match:
+                discount_percent = match.group(1)
+
+        return {
+            'name': _first_text(row, FIELD_SELECTORS['name']),
+            'app_id': app_id,
+            'price': price.strip() if price else None,
+            'original_price': original_price.strip() if original_price else None,
+            'discount_percent': discount_percent,
+            'developer': _first_text(row, FIELD_SELECTORS['developer']),
+            'detail_url': href,
+        }
+
+    def extract(self, response):
+        """解析整页，返回每行字段字典的列表"""
+        return [self.extract_row(row) for row in self.select_rows(response)]
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求去重基准 - 对比RFPDupeFilter使用的指纹集合与可扩展Bloom过滤器的内存和查询速度
+
+指纹为SHA1摘要，集合中与RFPDupeFilter一样保存40字符的十六进制字符串。
+集合在5000万指纹时约需6GB内存，超过 --set-limit 的规模按每指纹字节数外推。
+内存按对象大小计算（集合为集合本身加全部字符串，Bloom过滤器为位数组）。
+
+使用方法:
+    python tests/benchmark_dupefilter.py [--sizes 1000000 10000000 50000000] [--set-limit 10000000]
+"""
+
+import os
+import sys
+import time
+import hashlib
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scraper.dupefilters import ScalableBloomFilter
+
+LOOKUPS = 200000
+
+
+def fingerprints(start, stop):
+    """生成确定性的请求指纹"""
+    for i in range(start, stop):
+        yield hashlib.sha1(i.to_bytes(8, 'little')).digest()
+
+
+def insert_rate(add, size):
+    """插入size个指纹，返回每秒插入数"""
+    start = time.perf_counter()
+    for fingerprint in fingerprints(0, size):
+        add(fingerprint)
+    return size / (time.perf_counter() - start)
+
+
+def set_nbytes(seen):
+    """集合本身加上全部十六进制指纹字符串的字节数"""
+    return sys.getsizeof(seen) + sum(sys.getsizeof(fingerprint) for fingerprint in seen)
+
+
+def lookup_rate(contains, size):
+    """查询已存在和不存在的指纹各一半，返回(每秒查询数, 新指纹的误判率)"""
+    existing = list(fingerprints(0, LOOKUPS // 2))
+    new = list(fingerprints(size, size + LOOKUPS // 2))
+    start = time.perf_counter()
+    for fingerprint in existing:
+        contains(fingerprint)
+    false_positives = sum(1 for fingerprint in new if contains(fingerprint))
+    elapsed = time.perf_counter() - start
+    return LOOKUPS / elapsed, false_positives / len(new)
+
+
+def report(label, size, nbytes, insert_rate, query_rate, false_positive_rate, estimated=False):
+    mark = '(外推)' if estimated else ''
+    print(f"{label:<6} {size:>10} 个指纹  {nbytes / 1024 / 1024:>9.1f} MB{mark:<4}  "
+          f"{nbytes / size:>6.1f} 字节/个  插入 {insert_rate:>9.0f}/秒  查询 {query_rate:>9.0f}/秒  "
+          f"误判率 {false_positive_rate:.4%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='请求去重基准')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000000, 10000000, 50000000], help='指纹数量')
+    parser.add_argument('--set-limit', type=int, default=10000000, help='超过该规模时集合内存按外推估算')
+    parser.add_argument('--capacity', type=int, default=1000000, help='Bloom首个分片容量')
+    parser.add_argument('--error-rate', type=float, default=0.001, help='Bloom误判率')
+    args = parser.parse_args()
+
+    set_bytes_per_item = None
+    for size in args.sizes:
+        if size <= args.set_limit:
+            seen = set()
+            rate = insert_rate(lambda fp: seen.add(fp.hex()), size)
+            query_rate, _ = lookup_rate(lambda fp: fp.hex() in seen, size)
+            nbytes = set_nbytes(seen)
+            report('set', size, nbytes, rate, query_rate, 0.0)
+            set_bytes_per_item = nbytes / size
+            del seen
+        elif set_bytes_per_item:
+            report('set', size, set_bytes_per_item * size, float('nan'), float('nan'), 0.0, estimated=True)
+
+        bloom = ScalableBloomFilter(args.capacity, args.error_rate)
+        rate = insert_rate(bloom.add, size)
+        query_rate, false_positive_rate = lookup_rate(bloom.__contains__, size)
+        report('bloom', size, bloom.nbytes, rate, query_rate, false_positive_rate)
+        del bloom
+
+
+if __name__ == '__main__':
+    main()
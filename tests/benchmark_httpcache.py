@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP缓存存储基准 - 对比FilesystemCacheStorage与SQLiteCacheStorage的读写速度和磁盘占用
+
+响应体由保存的搜索页样本生成：每 --duplicate-every 个响应中有一个与之前的响应
+内容完全相同（对应重复抓取未变化的页面），其余响应在样本中插入序号以保证内容不同。
+
+使用方法:
+    python tests/benchmark_httpcache.py [--responses 2000] [--duplicate-every 4]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from scrapy.extensions.httpcache import FilesystemCacheStorage
+from scrapy.utils.test import get_crawler
+from scraper.extensions.httpcache import SQLiteCacheStorage
+
+FIXTURE = Path(__file__).parent / 'fixtures' / 'steam_search_topsellers.html'
+
+
+def build_responses(count, duplicate_every):
+    """生成 (请求, 响应) 列表"""
+    template = FIXTURE.read_bytes()
+    pairs = []
+    for i in range(count):
+        variant = i - 1 if duplicate_every and i % duplicate_every == duplicate_every - 1 else i
+        body = template.replace(b'</body>', f'<!-- {variant} --></body>'.encode(), 1)
+        request = Request(f'https://store.steampowered.com/search/?filter=topsellers&page={i}')
+        response = HtmlResponse(request.url, body=body, headers={'Content-Type': 'text/html; charset=utf-8'})
+        pairs.append((request, response))
+    return pairs
+
+
+def disk_usage(path):
+    """返回 (文件数, 字节数)"""
+    files = [p for p in Path(path).rglob('*') if p.is_file()]
+    return len(files), sum(p.stat().st_size for p in files)
+
+
+def run(storage_cls, pairs, cachedir):
+    crawler = get_crawler(settings_dict={'HTTPCACHE_DIR': cachedir, 'HTTPCACHE_EXPIRATION_SECS': 0})
+    spider = mock.Mock(crawler=crawler)
+    spider.name = 'steam_top_sellers'
+    storage = storage_cls(crawler.settings)
+    storage.open_spider(spider)
+
+    start = time.perf_counter()
+    for request, response in pairs:
+        storage.store_response(spider, request, response)
+    write_rate = len(pairs) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for request, response in pairs:
+        cached = storage.retrieve_response(spider, request)
+        assert cached.body == response.body
+    read_rate = len(pairs) / (time.perf_counter() - start)
+
+    storage.close_spider(spider)
+    files, nbytes = disk_usage(cachedir)
+    print(f"{storage_cls.__name__:<24} 写入 {write_rate:>7.0f}/秒  读取 {read_rate:>7.0f}/秒  "
+          f"{files:>6} 个文件  {nbytes / 1024 / 1024:>8.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP缓存存储基准')
+    parser.add_argument('--responses', type=int, default=2000, help='响应数量')
+    parser.add_argument('--duplicate-every', type=int, default=4, help='每N个响应中有一个重复内容，0表示不重复')
+    args = parser.parse_args()
+
+    logger.remove()
+    logger.add(sys.stderr, level='INFO')
+
+    pairs = build_responses(args.responses, args.duplicate_every)
+    raw = sum(len(response.body) for _, response in pairs)
+    print(f"{len(pairs)} 个响应，原始响应体 {raw / 1024 / 1024:.1f} MB")
+    for storage_cls in (FilesystemCacheStorage, SQLiteCacheStorage):
+        cachedir = tempfile.mkdtemp(prefix='httpcache-bench-')
+        try:
+            run(storage_cls, pairs, cachedir)
+        finally:
+            shutil.rmtree(cachedir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+排队详情请求内存基准 - 用tracemalloc对比meta中携带SteamGameItem与SteamGameRecord
+时排队的详情页请求占用的内存
+
+使用方法:
+    python tests/benchmark_item_memory.py [--requests 100000]
+"""
+
+import os
+import gc
+import sys
+import random
+import argparse
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapy import Request
+from scraper.spiders.steam_spider import build_item, build_record
+
+DEVELOPERS = ['Valve', 'CD PROJEKT RED', 'FromSoftware Inc.', 'Larian Studios', 'ConcernedApe']
+PRICES = ['¥ 98.00', '免费开玩', '¥ 1,298.00', '¥ 38.50', None]
+
+
+def make_rows(count, seed=42):
+    """生成合成的列表行（字段与SearchRowExtractor输出一致）"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        app_id = str(1000000 + i)
+        price = rng.choice(PRICES)
+        rows.append({
+            'name': f'游戏 {app_id}',
+            'app_id': app_id,
+            'price': price,
+            'original_price': price and '¥ 198.00',
+            'discount_percent': price and str(rng.randint(0, 90)),
+            # 逐行解析得到的字符串互不相同，模拟真实抓取时的重复字符串
+            'developer': rng.choice(DEVELOPERS).encode('utf-8').decode('utf-8'),
+            'detail_url': f'https://store.steampowered.com/app/{app_id}/',
+        })
+    return rows
+
+
+def measure(label, make, count):
+    """执行构建函数并返回保留的对象占用的字节数"""
+    gc.collect()
+    tracemalloc.start()
+    objects = make()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<16} {count:>8} 个  {current / 1024 / 1024:>8.1f} MB  {current / count:>7.0f} 字节/个")
+    del objects
+    return current
+
+
+def queued_requests(build, rows):
+    """构建携带数据项的排队详情请求"""
+    return [
+        Request(row['detail_url'], meta={'item': build(row, rank=i + 1, rank_type='topsellers')})
+        for i, row in enumerate(rows)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='排队详情请求内存基准')
+    parser.add_argument('--requests', type=int, default=100000, help='排队的详情请求数量')
+    args = parser.parse_args()
+
+    rows = make_rows(args.requests)
+    for target, make in (
+        ('数据项', lambda build: [build(row, rank=i + 1, rank_type='topsellers') for i, row in enumerate(rows)]),
+        ('排队请求', lambda build: queued_requests(build, rows)),
+    ):
+        before = measure(f'item {target}', lambda: make(build_item), len(rows))
+        after = measure(f'record {target}', lambda: make(build_record), len(rows))
+        print(f"{target}内存节省: {(1 - after / before) * 100:.1f}%")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+列表行解析微基准 - 对比旧版逐行CSS解析与预编译行解析器的吞吐量
+
+使用方法:
+    python tests/benchmark_row_extractor.py [--fixture 路径] [--rounds 200]
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapy.http import HtmlResponse
+from scraper.utils.row_extractor import SearchRowExtractor
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+DEFAULT_FIXTURE = os.path.join(FIXTURE_DIR, 'steam_search_topsellers.html')
+
+
+def legacy_extract(response):
+    """旧版解析逻辑（每行多次CSS查询，未编译的正则）"""
+    games = response.css('div#search_resultsRows a.search_result_row')
+    if not games:
+        games = response.css('a.search_result_row')
+    if not games:
+        games = response.css('div.search_result_row')
+
+    rows = []
+    for game in games:
+        row = {}
+        row['name'] = game.css('span.title::text').get()
+        if not row['name']:
+            row['name'] = game.css('div.search_name a span::text').get()
+
+        row['app_id'] = game.attrib.get('data-ds-appid')
+        if not row['app_id']:
+            href = game.attrib.get('href', '')
+            app_match = re.search(r'/app/(\d+)/', href)
+            if app_match:
+                row['app_id'] = app_match.group(1)
+
+        price_elem = game.css('div.discount_final_price::text')
+        if price_elem:
+            row['price'] = price_elem.get().strip()
+        else:
+            price_elem = game.css('div.search_price::text')
+            if price_elem:
+                row['price'] = price_elem.get().strip()
+
+        original_price_elem = game.css('div.discount_original_price::text')
+        if original_price_elem:
+            row['original_price'] = original_price_elem.get().strip()
+
+        discount_elem = game.css('div.discount_pct::text')
+        if discount_elem:
+            discount_text = discount_elem.get()
+            if discount_text:
+                match = re.search(r'-(\d+)%', discount_text)
+                if match:
+                    row['discount_percent'] = match.group(1)
+
+        row['developer'] = game.css('div.search_developer::text').get()
+        if not row['developer']:
+            row['developer'] = game.css('div.search_developer span::text').get()
+
+        row['detail_url'] = game.attrib.get('href')
+        rows.append(row)
+    return rows
+
+
+def run(label, extract, body, rounds):
+    """执行基准并返回每秒行数"""
+    total_rows = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        # 每轮新建响应，包含HTML解析成本
+        response = HtmlResponse(url='https://store.steampowered.com/search/', body=body, encoding='utf-8')
+        total_rows += len(extract(response))
+    elapsed = time.perf_counter() - start
+    rate = total_rows / elapsed
+    print(f"{label:<10} {total_rows:>8} 行  {elapsed:>7.3f} 秒  {rate:>10.0f} 行/秒")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Steam列表行解析微基准')
+    parser.add_argument('--fixture', default=DEFAULT_FIXTURE, help='保存的搜索页HTML')
+    parser.add_argument('--rounds', type=int, default=200, help='每种实现的解析轮数')
+    args = parser.parse_args()
+
+    with open(args.fixture, 'rb') as f:
+        body = f.read()
+
+    extractor = SearchRowExtractor()
+    print(f"样本: {args.fixture} ({len(body)} 字节), 轮数: {args.rounds}")
+    before = run('legacy', legacy_extract, body, args.rounds)
+    after = run('compiled', extractor.extract, body, args.rounds)
+    print(f"加速比: {after / before:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+自适应限速扩展测试
+"""
+
+import os
+import sys
+from unittest import mock
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapy import Request
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+from scraper.extensions.adaptive_rate import AdaptiveRateLimiter
+
+SLOT = 'store.steampowered.com'
+
+
+def make_extension(**settings):
+    settings = {'ADAPTIVE_RATE_ENABLED': True, 'DOWNLOAD_DELAY': 2, **settings}
+    crawler = get_crawler(settings_dict=settings)
+    crawler.stats.open_spider(None)
+    crawler.engine = mock.Mock()
+    slot = mock.Mock(delay=2.0)
+    crawler.engine.downloader.slots = {SLOT: slot}
+    extension = AdaptiveRateLimiter.from_crawler(crawler)
+    extension.spider_opened(mock.Mock(download_delay=2))
+    extension.clock = mock.Mock(return_value=100.0)
+    return extension, slot
+
+
+def downloaded(extension, status=200, body=b'<html>' + b'x' * 70000, latency=0.5, headers=None):
+    request = Request(f'https://{SLOT}/app/10/', meta={'download_slot': SLOT, 'download_latency': latency})
+    response = HtmlResponse(request.url, status=status, body=body, headers=headers, request=request)
+    extension.response_downloaded(response, request, None)
+
+
+def test_disabled_by_setting():
+    with pytest.raises(NotConfigured):
+        AdaptiveRateLimiter.from_crawler(get_crawler(settings_dict={'ADAPTIVE_RATE_ENABLED': False}))
+
+
+def test_healthy_responses_increase_rate_up_to_max():
+    extension, slot = make_extension(ADAPTIVE_RATE_MAX=1.0)
+    downloaded(extension)
+    assert slot.delay == pytest.approx(1 / 0.55)
+    for _ in range(50):
+        downloaded(extension)
+    assert slot.delay == pytest.approx(1.0)
+    assert extension.stats.get_value(f'adaptive_rate/rate/{SLOT}') == 1.0
+
+
+def test_slow_responses_hold_rate():
+    extension, slot = make_extension(ADAPTIVE_RATE_TARGET_LATENCY=3)
+    downloaded(extension, latency=8)
+    assert slot.delay == pytest.approx(2.0)
+
+
+def test_rate_limit_backs_off_once_per_cooldown():
+    extension, slot = make_extension()
+    for _ in range(10):
+        downloaded(extension)
+    downloaded(extension, status=429)
+    downloaded(extension, status=429)
+    assert slot.delay == pytest.approx(1 / 0.5)
+    assert extension.stats.get_value('adaptive_rate/backoffs') == 1
+    assert extension.stats.get_value('adaptive_rate/rate_limited') == 2
+
+
+def test_steam_rate_limit_page_and_retry_after():
+    extension, slot = make_extension()
+    downloaded(extension, body="您最近提出的请求过多，请稍后再试。".encode('utf-8'))
+    assert slot.delay == pytest.approx(1 / 0.25)
+
+    extension.clock.return_value = 200.0
+    downloaded(extension, status=503, headers={'Retry-After': '30'})
+    assert slot.delay == pytest.approx(30)
+
+
+def test_proxy_slots_share_the_domain_ceiling():
+    extension, slot = make_extension(ADAPTIVE_RATE_MAX=1.0, ADAPTIVE_RATE_DOMAIN_MAX=1.0)
+    proxies = {f'proxy{i}': mock.Mock(delay=2.0) for i in range(4)}
+    extension.crawler.engine.downloader.slots = proxies
+
+    def downloaded_via(key):
+        request = Request(f'https://{SLOT}/app/10/', meta={'download_slot': key, 'download_latency': 0.5})
+        response = HtmlResponse(request.url, body=b'<html>' + b'x' * 70000, request=request)
+        extension.response_downloaded(response, request, None)
+
+    for _ in range(50):
+        for key in proxies:
+            downloaded_via(key)
+    # 每个代理各自的速率已达上限，但整个域名合计不超过 1 请求/秒
+    assert extension.stats.get_value('adaptive_rate/rate/proxy0') == 1.0
+    assert all(proxy.delay == pytest.approx(4.0) for proxy in proxies.values())
+
+    # 下载器回收空闲的下载槽后，剩余代理分得更多速率
+    del proxies['proxy2'], proxies['proxy3']
+    downloaded_via('proxy0')
+    assert proxies['proxy0'].delay == pytest.approx(2.0)
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+年龄验证中间件测试
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapy import Request
+from scrapy.downloadermiddlewares.cookies import CookiesMiddleware
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse, Response
+from scrapy.utils.test import get_crawler
+from scraper.middlewares.age_gate import AgeGateMiddleware
+
+APP_URL = 'https://store.steampowered.com/app/292030/'
+AGECHECK_URL = 'https://store.steampowered.com/agecheck/app/292030/'
+
+
+def make_middleware(**settings):
+    crawler = get_crawler(settings_dict={'AGE_GATE_DOMAINS': ['store.steampowered.com'], **settings})
+    crawler.stats.open_spider(None)
+    return AgeGateMiddleware.from_crawler(crawler)
+
+
+def test_cookies_seeded_only_for_configured_domains():
+    middleware = make_middleware()
+    request = Request(APP_URL, cookies={'steamCountry': 'CN'})
+    middleware.process_request(request, None)
+    assert request.cookies['birthtime'] == '631152001'
+    assert request.cookies['wants_mature_content'] == '1'
+    assert request.cookies['steamCountry'] == 'CN'
+
+    other = Request('https://steamcommunity.com/app/292030/reviews/')
+    middleware.process_request(other, None)
+    assert other.cookies == {}
+
+    # 经过CookiesMiddleware后写入Cookie头
+    cookies = CookiesMiddleware()
+    cookies.process_request(request, None)
+    assert b'birthtime=631152001' in request.headers['Cookie']
+
+
+def test_agecheck_redirect_retried_once_with_cookies():
+    middleware = make_middleware()
+    request = Request(APP_URL)
+    redirect = Response(APP_URL, status=302, headers={'Location': AGECHECK_URL}, request=request)
+
+    retry = middleware.process_response(request, redirect, None)
+    assert isinstance(retry, Request)
+    assert retry.url == APP_URL
+    assert retry.dont_filter
+    assert retry.meta['age_gate_retried']
+    assert 'dont_cache' not in retry.meta  # 重试得到的正常页面需要写入HTTP缓存
+    assert retry.cookies['mature_content'] == '1'
+
+    # 重试后仍命中时交给后续中间件，不再重试
+    again = Response(APP_URL, status=302, headers={'Location': AGECHECK_URL}, request=retry)
+    assert middleware.process_response(retry, again, None) is again
+
+    stats = middleware.stats
+    assert stats.get_value('age_gate/detected') == 2
+    assert stats.get_value('age_gate/retried') == 1
+    assert stats.get_value('age_gate/failed') == 1
+
+
+def test_agegate_page_after_redirect_retries_original_url():
+    middleware = make_middleware()
+    request = Request(AGECHECK_URL, meta={'redirect_urls': [APP_URL]})
+    page = HtmlResponse(AGECHECK_URL, body=b'<div id="app_agegate">', request=request)
+
+    retry = middleware.process_response(request, page, None)
+    assert retry.url == APP_URL
+
+
+def test_normal_pages_pass_through():
+    middleware = make_middleware()
+    request = Request(APP_URL)
+    page = HtmlResponse(APP_URL, body=b'<div class="apphub_AppName">Witcher</div>', request=request)
+    assert middleware.process_response(request, page, None) is page
+    assert middleware.stats.get_value('age_gate/detected') is None
+
+
+def test_cookie_header_used_when_cookies_disabled():
+    middleware = make_middleware(COOKIES_ENABLED=False)
+    request = Request(APP_URL, headers={'Cookie': 'steamCountry=CN'})
+    middleware.process_request(request, None)
+    assert request.headers['Cookie'].startswith(b'steamCountry=CN; birthtime=631152001')
+    middleware.process_request(request, None)
+    assert request.headers['Cookie'].count(b'birthtime=') == 1
+
+
+def test_disabled_by_setting():
+    with pytest.raises(NotConfigured):
+        make_middleware(AGE_GATE_ENABLED=False)
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+"""
+浏览器池测试（使用模拟的Playwright驱动，不启动真实浏览器）
+"""
+
+import os
+import sys
+import asyncio
+from unittest import mock
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scraper.utils.playwright_utils import BrowserPool, BlockProfile, PlaywrightManager, extract_fragment
+
+
+class FakePage:
+    def __init__(self, heap=0):
+        self.closed = False
+        self.heap = heap
+        self.visited = []
+
+    def is_closed(self):
+        return self.closed
+
+    async def goto(self, url, **kwargs):
+        self.visited.append(url)
+
+    async def evaluate(self, script):
+        return self.heap
+
+    async def title(self):
+        return "Portal"
+
+    async def eval_on_selector_all(self, selector, script):
+        return '<div id="game_highlights">Portal</div>' if selector == '#game_highlights' else ''
+
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.page = None
+        self.closed = False
+        self.routes = []
+
+    async def route(self, pattern, handler):
+        self.routes.append((pattern, handler))
+
+    async def new_page(self):
+        self.page = FakePage(self.browser.driver.heap)
+        self.page.context = self
+        return self.page
+
+    async def close(self):
+        self.closed = True
+        self.page.closed = True
+        self.browser.contexts.remove(self)
+
+
+class FakeBrowser:
+    def __init__(self, driver, options):
+        self.driver = driver
+        self.options = options
+        self.contexts = []
+        self.connected = True
+
+    def is_connected(self):
+        return self.connected
+
+    async def new_context(self, **options):
+        context = FakeContext(self)
+        self.contexts.append(context)
+        return context
+
+    async def close(self):
+        self.connected = False
+
+
+class FakeBrowserType:
+    def __init__(self, driver):
+        self.driver = driver
+
+    async def launch(self, **options):
+        browser = FakeBrowser(self.driver, options)
+        self.driver.launched.append(browser)
+        return browser
+
+
+class FakeDriver:
+    def __init__(self, heap=0):
+        self.heap = heap
+        self.launched = []
+        self.stopped = False
+        self.chromium = self.firefox = self.webkit = FakeBrowserType(self)
+
+    async def stop(self):
+        self.stopped = True
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_pages_reuse_warm_context():
+    async def scenario():
+        driver = FakeDriver()
+        pool = BrowserPool("chromium", playwright=driver, warm_contexts=1)
+        await pool.start()
+        pages = []
+        for _ in range(3):
+            async with pool.page() as page:
+                pages.append(page)
+        await pool.shutdown()
+        return driver, pool, pages
+
+    driver, pool, pages = run(scenario())
+    assert len(driver.launched) == 1
+    assert driver.launched[0].options["args"] == ['--no-sandbox']
+    assert pages[0] is pages[1] is pages[2]
+    assert pool.stats["contexts_created"] == 1
+    assert pool.stats["leases"] == 3
+    assert pages[0].visited == ["about:blank"] * 3
+    # 外部传入的驱动由调用方停止
+    assert not driver.stopped
+
+
+def test_contexts_recycled_after_max_uses_errors_and_memory():
+    async def scenario():
+        pool = BrowserPool("chromium", playwright=FakeDriver(), max_uses=2, warm_contexts=0)
+        for _ in range(4):
+            async with pool.page():
+                pass
+        with pytest.raises(ValueError):
+            async with pool.page():
+                raise ValueError("navigation failed")
+
+        heavy = BrowserPool("chromium", playwright=FakeDriver(heap=300 * 1024 * 1024), max_memory_mb=200)
+        async with heavy.page():
+            pass
+        return pool, heavy
+
+    pool, heavy = run(scenario())
+    assert pool.stats["contexts_created"] == 3
+    assert pool.stats["contexts_recycled"] == 3
+    assert heavy.stats["contexts_recycled"] == 1
+
+
+def test_concurrent_leases_are_bounded_and_spread_across_browsers():
+    async def scenario():
+        driver = FakeDriver()
+        pool = BrowserPool("firefox", playwright=driver, max_browsers=2, contexts_per_browser=2)
+        active = peak = 0
+
+        async def task():
+            nonlocal active, peak
+            async with pool.page():
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        await asyncio.gather(*(task() for _ in range(10)))
+        contexts = [len(browser.contexts) for browser in driver.launched]
+        await pool.shutdown()
+        return pool, peak, contexts
+
+    pool, peak, contexts = run(scenario())
+    assert peak == 4
+    assert contexts == [2, 2]
+    assert pool.stats["contexts_created"] == 4
+
+
+def test_disconnected_browser_is_relaunched():
+    async def scenario():
+        driver = FakeDriver()
+        pool = BrowserPool("chromium", playwright=driver)
+        await pool.start()
+        driver.launched[0].connected = False
+        async with pool.page():
+            pass
+        return driver, pool
+
+    driver, pool = run(scenario())
+    assert pool.stats["browsers_launched"] == 2
+    assert pool.browsers == [driver.launched[1]]
+
+
+def test_manager_shares_one_driver_and_closes_previous_browser(tmp_path):
+    async def scenario():
+        driver = FakeDriver()
+        manager = PlaywrightManager(resources_dir=str(tmp_path))
+        manager.playwright = driver
+        first = await manager.launch_browser("chromium")
+        second = await manager.launch_browser("firefox")
+        pool = await manager.get_pool("chromium")
+        assert await manager.get_pool("chromium") is pool
+        await manager.close()
+        return driver, first, second, pool
+
+    driver, first, second, pool = run(scenario())
+    assert not first.connected and not second.connected
+    assert pool.playwright is None
+    assert driver.stopped
+
+
+def test_unknown_browser_type_rejected():
+    with pytest.raises(ValueError):
+        BrowserPool("opera")
+
+
+class FakeRoute:
+    def __init__(self, resource_type, url):
+        self.request = mock.Mock(resource_type=resource_type, url=url)
+        self.outcome = None
+
+    async def abort(self):
+        self.outcome = 'abort'
+
+    async def continue_(self):
+        self.outcome = 'continue'
+
+
+def test_block_profile_blocks_media_and_trackers():
+    profile = BlockProfile.from_name("light")
+    routes = [
+        FakeRoute("image", "https://shared.akamai.steamstatic.com/store_item_assets/steam/apps/10/header.jpg"),
+        FakeRoute("xhr", "https://video.akamai.steamstatic.com/store_trailers/10/movie480.webm?t=1"),
+        FakeRoute("script", "https://www.googletagmanager.com/gtag/js?id=UA-1"),
+        FakeRoute("script", "https://store.akamai.steamstatic.com/public/javascript/game.js"),
+        FakeRoute("document", "https://store.steampowered.com/app/10/"),
+    ]
+
+    async def scenario():
+        for route in routes:
+            await profile.handle(route)
+
+    run(scenario())
+    assert [route.outcome for route in routes] == ['abort', 'abort', 'abort', 'continue', 'continue']
+    assert (profile.blocked, profile.allowed) == (3, 2)
+    with pytest.raises(ValueError):
+        BlockProfile.from_name("unknown")
+
+
+def test_pool_applies_block_profile_to_each_context():
+    async def scenario():
+        driver = FakeDriver()
+        pool = BrowserPool("chromium", playwright=driver, block_profile="light", max_uses=1)
+        routes = []
+        for _ in range(2):
+            async with pool.page() as page:
+                routes.append(len(page.context.routes))
+        unblocked = BrowserPool("chromium", playwright=driver, block_profile="none")
+        async with unblocked.page() as page:
+            routes.append(len(page.context.routes))
+        return pool, unblocked, routes
+
+    pool, unblocked, routes = run(scenario())
+    assert pool.block_profile.name == "light"
+    assert pool.stats["contexts_created"] == 2
+    assert unblocked.block_profile is None
+    assert routes == [1, 1, 0]
+
+
+def test_routes_registered_only_for_blocking_profiles():
+    async def scenario():
+        context = FakeContext(FakeBrowser(FakeDriver(), {}))
+        await BlockProfile("empty").apply(context)
+        empty_routes = list(context.routes)
+        await BlockProfile.from_name("strict").apply(context)
+        return empty_routes, context.routes
+
+    empty_routes, routes = run(scenario())
+    assert empty_routes == []
+    assert len(routes) == 1 and routes[0][0] == "**/*"
+
+
+def test_extract_fragment_returns_only_matching_elements():
+    async def scenario():
+        page = FakePage()
+        return await extract_fragment(page, "#game_highlights"), await extract_fragment(page, "#missing")
+
+    fragment, missing = run(scenario())
+    assert fragment == '<html><body><div id="game_highlights">Portal</div></body></html>'
+    assert missing is None
+
+
+def test_manager_screenshots_off_by_default(tmp_path):
+    async def scenario():
+        driver = FakeDriver()
+        manager = PlaywrightManager(resources_dir=str(tmp_path / "shots"))
+        manager.playwright = driver
+        result = await manager.navigate_and_screenshot(
+            "https://store.steampowered.com/app/400/", "portal", browser_type="chromium",
+            fragment_selector="#game_highlights",
+        )
+        await manager.close()
+        return manager, result
+
+    manager, result = run(scenario())
+    assert result["success"]
+    assert result["screenshot_path"] is None
+    assert "game_highlights" in result["html"]
+    assert not (tmp_path / "shots").exists()
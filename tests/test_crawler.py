@@ -16,55 +16,24 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from scraper.spiders.steam_spider import SteamTopSellersSpider
-from scraper.items import SteamGameItem
-import re
+from scraper.spiders.steam_spider import SteamTopSellersSpider, row_extractor, build_record
 
 def limited_parse(self, response, limit=5):
     """限制数据条数的解析函数"""
-    games = response.css('div#search_resultsRows a.search_result_row')
-    if not games:
-        games = response.css('a.search_result_row')
-    if not games:
-        games = response.css('div.search_result_row')
+    rows = row_extractor.extract(response)
     
     logger.info(f"[测试Patch] 只处理前{limit}个游戏")
     
-    for i, game in enumerate(games[:limit]):
-        item = SteamGameItem()
-        item['name'] = game.css('span.title::text').get()
-        if not item['name']:
-            item['name'] = game.css('div.search_name a span::text').get()
-        
-        item['app_id'] = game.attrib.get('data-ds-appid')
-        if not item['app_id']:
-            href = game.attrib.get('href', '')
-            app_match = re.search(r'/app/(\d+)/', href)
-            if app_match:
-                item['app_id'] = app_match.group(1)
-        
-        price_elem = game.css('div.discount_final_price::text')
-        if price_elem:
-            item['price'] = price_elem.get().strip()
-        else:
-            price_elem = game.css('div.search_price::text')
-            if price_elem:
-                item['price'] = price_elem.get().strip()
-        
-        item['developer'] = game.css('div.search_developer::text').get()
-        if not item['developer']:
-            item['developer'] = game.css('div.search_developer span::text').get()
-        
-        item['crawl_time'] = datetime.now().isoformat()
-        item['crawl_date'] = datetime.now().strftime('%Y-%m-%d')
+    for i, row in enumerate(rows[:limit]):
+        item = build_record(row, rank=i + 1, rank_type='topsellers')
         
         logger.info(f"[测试Patch] 解析游戏 {i+1}: {item['name']} (ID: {item['app_id']})")
         
-        detail_url = game.attrib.get('href')
+        detail_url = row['detail_url']
         if detail_url:
             yield response.follow(detail_url, self.parse_detail, meta={'item': item})
         else:
-            yield item
+            yield item.to_item()
 
 # 注释掉原有的静态patch，现在使用动态设置
 # SteamTopSellersSpider.parse = limited_parse
@@ -81,8 +50,7 @@ def configure_test_settings(settings, test_limit=5):
         'scrapy.downloadermiddlewares.useragent.UserAgentMiddleware': None,
     })
     settings.set('ITEM_PIPELINES', {
-        'scraper.pipelines.DataValidationPipeline': 300,
-        'scraper.pipelines.DataCleaningPipeline': 400,
+        'scraper.pipelines.DataNormalizationPipeline': 300,
         'scraper.pipelines.MongoDBPipeline': 500,
         'scraper.pipelines.MySQLPipeline': 600,
     })
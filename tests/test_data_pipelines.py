@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+数据清洗/验证管道测试
+"""
+
+import os
+import sys
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapy.exceptions import DropItem
+from scraper.items import SteamGameItem
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.test import get_crawler
+from scraper.pipelines.data_cleaning import DataCleaningPipeline, clean_text, clean_date
+from scraper.pipelines.data_validation import DataValidationPipeline, VALIDATORS
+from scraper.pipelines.data_normalization import DataNormalizationPipeline, to_date
+from benchmark_data_cleaning import LegacyDataCleaningPipeline, DummySpider, make_items
+
+# 声明为不需要清洗的字段（旧版会错误地去掉crawl_time中的冒号）
+SKIPPED_FIELDS = {'app_id', 'crawl_time', 'crawl_date', 'rank', 'rank_type'}
+
+
+def test_cleaning_matches_legacy_for_cleaned_fields():
+    spider = DummySpider()
+    legacy_items = [LegacyDataCleaningPipeline().process_item(item, spider) for item in make_items(500)]
+    items = [DataCleaningPipeline().process_item(item, spider) for item in make_items(500)]
+    for item, legacy_item in zip(items, legacy_items):
+        for field in item:
+            if field not in SKIPPED_FIELDS:
+                assert item[field] == legacy_item[field], field
+
+
+def test_skipped_fields_are_untouched():
+    item = make_items(1)[0]
+    DataCleaningPipeline().process_item(item, DummySpider())
+    assert item['crawl_time'] == '2024-01-01T12:00:00.000000'
+
+
+def test_clean_helpers():
+    assert clean_text('  Stardew\tValley ™ ') == 'Stardew Valley '
+    assert clean_text('Hollow Knight') == 'Hollow Knight'
+    assert clean_date('发行日期：2023年9月5日') == '2023-09-05'
+    assert clean_date('2020-1-2') == '2020-01-02'
+
+
+def test_missing_required_field_is_dropped():
+    item = SteamGameItem(name='', crawl_time='2024-01-01T00:00:00', crawl_date='2024-01-01')
+    with pytest.raises(DropItem):
+        DataCleaningPipeline().process_item(item, DummySpider())
+
+
+def test_plain_dict_items_are_cleaned_as_text():
+    item = {'name': ' A  B ', 'crawl_time': 't', 'crawl_date': 'd'}
+    assert DataCleaningPipeline().process_item(item, DummySpider())['name'] == 'A B'
+
+
+def make_validation_pipeline():
+    return DataValidationPipeline(MemoryStatsCollector(get_crawler()))
+
+
+@pytest.mark.parametrize('validator, value, expected', [
+    ('price', '¥ 98.00', True),
+    ('price', '$19.99', True),
+    ('price', '免费', True),
+    ('price', '98 元', True),
+    ('price', '免费开玩', False),
+    ('price', '¥ 98.5', False),
+    ('app_id', '730', True),
+    ('app_id', '73a', False),
+    ('percent', '100', True),
+    ('percent', '101', False),
+    ('count', '1,234', True),
+    ('count', '-1', False),
+    ('datetime', '2024-01-01T12:00:00.123456', True),
+    ('datetime', '2024-01-01 12:00:00+08:00', True),
+    ('datetime', 'yesterday', False),
+    ('date', '2024-02-29', True),
+    ('date', '2023-02-29', False),
+    ('date', '2024/01/01', False),
+])
+def test_validators(validator, value, expected):
+    assert VALIDATORS[validator](value) is expected
+
+
+def test_invalid_optional_field_is_counted_not_dropped():
+    pipeline = make_validation_pipeline()
+    spider = DummySpider()
+    item = make_items(1)[0]
+    item['price'] = '免费开玩'
+    assert pipeline.process_item(item, spider) is item
+    assert pipeline.stats.get_value('validation/invalid/price', spider=spider) == 1
+
+
+def test_missing_or_invalid_required_field_is_dropped():
+    pipeline = make_validation_pipeline()
+    spider = DummySpider()
+    item = make_items(1)[0]
+    del item['app_id']
+    with pytest.raises(DropItem):
+        pipeline.process_item(item, spider)
+
+    item = make_items(1)[0]
+    item['crawl_date'] = '2024-13-01'
+    with pytest.raises(DropItem):
+        pipeline.process_item(item, spider)
+    assert pipeline.stats.get_value('validation/missing/app_id', spider=spider) == 1
+    assert pipeline.stats.get_value('validation/invalid/crawl_date', spider=spider) == 1
+
+
+def test_validator_compiled_once_per_spider():
+    pipeline = make_validation_pipeline()
+    spider = DummySpider()
+    for item in make_items(10):
+        pipeline.process_item(item, spider)
+    assert list(pipeline._validators) == [(spider.name, SteamGameItem)]
+
+
+def make_normalization_pipeline():
+    return DataNormalizationPipeline(MemoryStatsCollector(get_crawler()))
+
+
+def test_normalization_outputs_typed_values():
+    pipeline = make_normalization_pipeline()
+    item = make_items(1)[0]
+    item.update({
+        'price': '¥ 1,298.00', 'original_price': '免费开玩', 'discount_percent': '50',
+        'total_reviews': '12,345', 'release_date': '2023年9月5日',
+    })
+    pipeline.process_item(item, DummySpider())
+    assert item['price'] == Decimal('1298.00')
+    assert item['original_price'] == Decimal('0')
+    assert item['discount_percent'] == 50
+    assert item['total_reviews'] == 12345
+    assert item['release_date'] == date(2023, 9, 5)
+    assert item['crawl_time'] == '2024-01-01T12:00:00.000000'
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('2023年9月5日', date(2023, 9, 5)),
+    ('2023-09-05', date(2023, 9, 5)),
+    ('5 Sep, 2023', date(2023, 9, 5)),
+    ('Sep 5, 2023', date(2023, 9, 5)),
+])
+def test_to_date(text, expected):
+    assert to_date(text) == expected
+
+
+def test_unparseable_optional_field_is_removed_and_counted():
+    pipeline = make_normalization_pipeline()
+    spider = DummySpider()
+    item = make_items(1)[0]
+    item['release_date'] = '即将推出'
+    assert pipeline.process_item(item, spider) is item
+    assert 'release_date' not in item
+    assert pipeline.stats.get_value('validation/invalid/release_date', spider=spider) == 1
+
+
+def test_normalization_drops_missing_required_field():
+    pipeline = make_normalization_pipeline()
+    item = make_items(1)[0]
+    item['name'] = '  \n '
+    with pytest.raises(DropItem):
+        pipeline.process_item(item, DummySpider())
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+分布式爬取测试（scrapy-redis，不连接Redis）
+"""
+
+import os
+import sys
+import json
+from unittest import mock
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip('scrapy_redis')
+
+from scrapy import Request
+from scrapy.utils.request import request_from_dict
+from scrapy.utils.test import get_crawler
+from scrapy_redis import picklecompat
+from scraper.distributed import DISTRIBUTED_SPIDERS, seed_search_pages
+from scraper.items import SteamGameRecord
+
+
+def make_spider(name='steam_top_sellers', **settings):
+    spider_cls = DISTRIBUTED_SPIDERS[name]
+    crawler = get_crawler(spider_cls, settings)
+    return spider_cls.from_crawler(crawler)
+
+
+def test_seed_resets_previous_crawl_and_pushes_pages():
+    server = mock.Mock()
+    server.scan_iter.return_value = iter([b'steam_top_sellers:dupefilter:0'])
+    assert seed_search_pages(server, 'steam_top_sellers', 3) == 3
+    server.delete.assert_called_once_with(
+        'steam_top_sellers:start_urls', 'steam_top_sellers:requests', 'steam_top_sellers:dupefilter',
+        b'steam_top_sellers:dupefilter:0')
+    key, *seeds = server.rpush.call_args[0]
+    assert key == 'steam_top_sellers:start_urls'
+    assert [json.loads(seed)['page'] for seed in seeds] == [0, 1, 2]
+
+
+def test_redis_spider_keeps_storage_name_and_scheduler_settings():
+    spider = make_spider(SEARCH_PAGE_SIZE=25)
+    assert spider.name == 'steam_top_sellers'
+    assert spider.redis_key == 'steam_top_sellers:start_urls'
+    assert spider.settings.get('SCHEDULER') == 'scrapy_redis.scheduler.Scheduler'
+    assert spider.settings.getbool('SCHEDULER_PERSIST')
+
+
+def test_seed_data_becomes_search_page_request():
+    spider = make_spider(SEARCH_PAGE_SIZE=25, MAX_PAGES_PER_SPIDER=10)
+    request = spider.make_request_from_data(b'{"page": 2}')
+    assert 'start=50' in request.url and request.cb_kwargs == {'page': 2}
+    assert spider.make_request_from_data(b'{"page": 10}') is None
+    assert spider.make_request_from_data(b'https://store.steampowered.com/') is None
+
+
+def test_detail_request_with_record_survives_redis_serialization():
+    spider = make_spider()
+    record = SteamGameRecord(app_id='10', name='Counter-Strike', rank=1, tags=['射击'])
+    request = Request('https://store.steampowered.com/app/10/', callback=spider.parse_detail, meta={'item': record})
+    restored = request_from_dict(picklecompat.loads(picklecompat.dumps(request.to_dict(spider=spider))), spider=spider)
+    assert restored.callback == spider.parse_detail
+    assert restored.meta['item'].to_item() == record.to_item()
+
+
+def test_bloom_dupefilter_setting_switches_shared_dupefilter():
+    spider = make_spider(BLOOM_DUPEFILTER_ENABLED=True)
+    assert spider.settings.get('DUPEFILTER_CLASS') == 'scraper.dupefilters.RedisBloomDupeFilter'
+
+
+def test_worker_settings_do_not_use_trial_run_limits():
+    from scraper import settings as project_settings
+    from run_distributed import worker_settings
+
+    with mock.patch('run_crawler.os.makedirs'):
+        settings = worker_settings('steam_top_sellers', 'csv', max_idle=300)
+
+    assert settings.getint('CLOSESPIDER_ITEMCOUNT') == 0
+    assert settings.getfloat('DOWNLOAD_DELAY') == project_settings.DOWNLOAD_DELAY
+    assert settings.getbool('ROBOTSTXT_OBEY') is True
+    assert settings.getint('MAX_IDLE_TIME_BEFORE_CLOSE') == 300
+    assert settings.getdict('DOWNLOADER_MIDDLEWARES')['scraper.middlewares.AgeGateMiddleware'] == 650
+    assert 'scraper.pipelines.MySQLPipeline' in settings.getdict('ITEM_PIPELINES')
+    assert any(path.endswith('.csv') for path in settings.getdict('FEEDS'))
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Bloom过滤器请求去重测试
+"""
+
+import os
+import sys
+import hashlib
+from collections import defaultdict
+from unittest import mock
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapy import Request
+from scrapy.utils.test import get_crawler
+from scraper.dupefilters import (
+    BloomFilter, ScalableBloomFilter, BloomDupeFilter, RedisBloomDupeFilter, BLOOM_CHECK_AND_SET_SCRIPT,
+)
+
+
+def fingerprint(i):
+    return hashlib.sha1(str(i).encode()).digest()
+
+
+class FakeRedis:
+    """只实现去重过滤器用到的位图/哈希命令"""
+
+    def __init__(self):
+        self.bits = defaultdict(set)
+        self.hashes = defaultdict(dict)
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def getbit(self, key, offset):
+        return int(offset in self.bits[key])
+
+    def setbit(self, key, offset, value):
+        old = self.getbit(key, offset)
+        self.bits[key].add(offset)
+        return old
+
+    def hget(self, key, field):
+        return self.hashes[key].get(str(field))
+
+    def hincrby(self, key, field, amount):
+        self.hashes[key][str(field)] = int(self.hashes[key].get(str(field), 0)) + amount
+
+    def hlen(self, key):
+        return len(self.hashes[key])
+
+    def eval(self, script, numkeys, *keys_and_args):
+        """按BLOOM_CHECK_AND_SET_SCRIPT的逻辑执行（单线程，天然原子）"""
+        assert script == BLOOM_CHECK_AND_SET_SCRIPT
+        keys, args = keys_and_args[:numkeys], list(keys_and_args[numkeys:])
+        *slices, meta = keys
+        current = len(slices) - 1
+        for index, key in enumerate(slices):
+            hashes, args = args[0], args[1:]
+            offsets, args = args[:hashes], args[hashes:]
+            if index < current:
+                seen = all(self.getbit(key, offset) for offset in offsets)
+            else:
+                seen = all([self.setbit(key, offset, 1) for offset in offsets])
+            if seen:
+                return [1, int(self.hget(meta, current) or 0), self.hlen(meta)]
+        self.hincrby(meta, current, 1)
+        return [0, int(self.hget(meta, current)), self.hlen(meta)]
+
+    def delete(self, *keys):
+        for key in keys:
+            self.bits.pop(key, None)
+            self.hashes.pop(key, None)
+
+
+class FakePipeline:
+    def __init__(self, server):
+        self.server = server
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name, args))
+
+    def execute(self):
+        return [getattr(self.server, name)(*args) for name, args in self.commands]
+
+
+def test_bloom_filter_has_no_false_negatives_and_bounded_false_positives():
+    bloom = BloomFilter(10000, 0.01)
+    assert sum(bloom.add(fingerprint(i)) for i in range(10000)) < 100
+    assert all(fingerprint(i) in bloom for i in range(10000))
+    false_positives = sum(fingerprint(i) in bloom for i in range(10000, 30000))
+    assert false_positives / 20000 < 0.02
+
+
+def test_scalable_bloom_filter_grows():
+    bloom = ScalableBloomFilter(initial_capacity=1000, error_rate=0.01)
+    for i in range(5000):
+        bloom.add(fingerprint(i))
+    assert len(bloom.filters) == 3
+    assert all(fingerprint(i) in bloom for i in range(5000))
+
+
+def test_bloom_dupefilter_and_jobdir_persistence(tmp_path):
+    crawler = get_crawler(settings_dict={'JOBDIR': str(tmp_path), 'BLOOMFILTER_CAPACITY': 100})
+    dupefilter = BloomDupeFilter.from_crawler(crawler)
+    assert not dupefilter.request_seen(Request('https://store.steampowered.com/app/10/'))
+    assert dupefilter.request_seen(Request('https://store.steampowered.com/app/10/'))
+    dupefilter.close('finished')
+
+    resumed = BloomDupeFilter.from_crawler(crawler)
+    assert resumed.request_seen(Request('https://store.steampowered.com/app/10/'))
+    assert not resumed.request_seen(Request('https://store.steampowered.com/app/20/'))
+
+
+def test_redis_bloom_dupefilter_shared_between_nodes():
+    server = FakeRedis()
+    crawler = get_crawler()
+    nodes = [RedisBloomDupeFilter(server, 'steam_top_sellers:dupefilter', capacity=50,
+                                  fingerprinter=crawler.request_fingerprinter) for _ in range(2)]
+    urls = [f'https://store.steampowered.com/app/{i}/' for i in range(120)]
+    assert not any(nodes[i % 2].request_seen(Request(url)) for i, url in enumerate(urls))
+    assert all(nodes[(i + 1) % 2].request_seen(Request(url)) for i, url in enumerate(urls))
+    assert server.hlen('steam_top_sellers:dupefilter:meta') == 2
+
+    nodes[0].clear()
+    assert 'steam_top_sellers:dupefilter:0' not in server.bits
+
+
+def test_redis_bloom_dupefilter_removes_generated_key_on_close():
+    server = FakeRedis()
+    request = Request('https://store.steampowered.com/app/730/')
+    with mock.patch('scraper.dupefilters.redis.Redis.from_url', return_value=server):
+        temporary = RedisBloomDupeFilter.from_crawler(get_crawler())
+        named = RedisBloomDupeFilter.from_crawler(get_crawler(settings_dict={'BLOOMFILTER_REDIS_KEY': 'steam:bloom'}))
+    temporary.request_seen(request)
+    named.request_seen(request)
+    temporary.close('finished')
+    named.close('finished')
+
+    assert temporary.key.startswith('dupefilter:bloom:') and not temporary.persist
+    assert f'{temporary.key}:0' not in server.bits and f'{temporary.key}:meta' not in server.hashes
+    assert server.hlen('steam:bloom:meta') == 1  # 指定的键跨运行保留
+
+
+def test_redis_bloom_dupefilter_same_request_on_two_nodes():
+    server = FakeRedis()
+    crawler = get_crawler()
+    nodes = [RedisBloomDupeFilter(server, 'steam_popular:dupefilter',
+                                  fingerprinter=crawler.request_fingerprinter) for _ in range(2)]
+    request = Request('https://store.steampowered.com/app/730/')
+    assert [node.request_seen(request) for node in nodes] == [False, True]
+    assert server.hget('steam_popular:dupefilter:meta', 0) == 1
+
+
+def test_redis_bloom_dupefilter_follows_growth_by_other_nodes():
+    server = FakeRedis()
+    crawler = get_crawler()
+    key = 'steam_top_sellers:dupefilter'
+    grown = RedisBloomDupeFilter(server, key, capacity=10, fingerprinter=crawler.request_fingerprinter)
+    lagging = RedisBloomDupeFilter(server, key, capacity=10, fingerprinter=crawler.request_fingerprinter)
+    for i in range(15):
+        grown.request_seen(Request(f'https://store.steampowered.com/app/{i}/'))
+    assert len(grown.slices) == 2 and len(lagging.slices) == 1
+
+    lagging.request_seen(Request('https://store.steampowered.com/app/100/'))
+    assert len(lagging.slices) == 2
+    assert lagging.request_seen(Request('https://store.steampowered.com/app/14/'))
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+按需动态渲染中间件测试（使用模拟的浏览器池）
+"""
+
+import os
+import sys
+from contextlib import asynccontextmanager
+from unittest import mock
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapy import Request
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse, TextResponse
+from scrapy.utils.test import get_crawler
+from scraper import settings as project_settings
+from scraper.middlewares.dynamic_render import DynamicRenderMiddleware, RenderRule
+
+APP_URL = 'https://store.steampowered.com/app/10/'
+RENDERED = '<html><span class="game_review_summary">Very Positive</span></html>'
+REVIEW_COUNT = '<meta itemprop="reviewCount" content="1520">'
+
+
+class FakePage:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.url = None
+        self.headers = None
+
+    async def set_extra_http_headers(self, headers):
+        self.headers = headers
+
+    async def goto(self, url, **kwargs):
+        if self.fail:
+            raise TimeoutError('navigation timeout')
+        self.url = url
+        return mock.Mock(status=200)
+
+    async def wait_for_selector(self, selector, **kwargs):
+        pass
+
+    async def content(self):
+        return RENDERED
+
+    async def eval_on_selector_all(self, selector, script):
+        return '<span class="game_review_summary">Very Positive</span>' if selector == 'span.game_review_summary' else ''
+
+
+class FakePool:
+    def __init__(self, fail=False):
+        self.pages = []
+        self.fail = fail
+
+    @asynccontextmanager
+    async def page(self):
+        page = FakePage(self.fail)
+        self.pages.append(page)
+        yield page
+
+
+def make_middleware(fail=False, rules=None):
+    if rules is None:
+        rules = [RenderRule.from_setting(rule) for rule in project_settings.DYNAMIC_RENDER_RULES]
+    crawler = get_crawler()
+    crawler.stats.open_spider(None)
+    return DynamicRenderMiddleware(FakePool(fail), rules, stats=crawler.stats)
+
+
+def resolve(result):
+    """模拟的浏览器池不会挂起，Deferred同步完成"""
+    values = []
+    result.addCallback(values.append)
+    return values[0]
+
+
+def html(url, body, status=200, request=None):
+    return HtmlResponse(url, status=status, body=body.encode(), encoding='utf-8', request=request)
+
+
+def test_complete_pages_are_not_rendered():
+    middleware = make_middleware()
+    request = Request(APP_URL)
+    response = html(APP_URL, '<span class="game_review_summary">Mostly Positive</span>')
+
+    assert middleware.process_request(request, None) is None
+    assert middleware.process_response(request, response, None) is response
+    assert middleware.pool.pages == []
+
+
+def test_missing_review_summary_is_rendered():
+    middleware = make_middleware()
+    request = Request(APP_URL, headers={'Accept-Language': 'zh-CN', 'Cookie': 'birthtime=1'})
+    response = html(APP_URL, REVIEW_COUNT + '<span class="game_review_summary"> </span>')
+
+    rendered = resolve(middleware.process_response(request, response, None))
+
+    assert rendered.css('span.game_review_summary::text').get() == 'Very Positive'
+    assert 'rendered' in rendered.flags
+    assert middleware.pool.pages[0].headers == {'Accept-Language': 'zh-CN', 'Cookie': 'birthtime=1'}
+    assert middleware.stats.get_value('dynamic_render/reason/review_summary') == 1
+    # 渲染后的响应不会再次触发渲染，从HTTP缓存读取（不再带有rendered标记）时也不会
+    assert middleware.process_response(request, rendered, None) is rendered
+    cached = rendered.replace(flags=['cached'])
+    assert middleware.process_response(request, cached, None) is cached
+    assert len(middleware.pool.pages) == 1
+
+
+def test_apps_without_reviews_are_not_rendered():
+    middleware = make_middleware()
+    request = Request(APP_URL)
+    response = html(APP_URL, '<div class="summary column">No user reviews</div>')
+
+    assert middleware.process_response(request, response, None) is response
+    assert middleware.pool.pages == []
+
+
+def test_redirected_request_renders_original_url():
+    middleware = make_middleware(rules=[RenderRule('login', r'store\.steampowered\.com/', markers=['/login/'])])
+    login = 'https://store.steampowered.com/login/?redir=app/10/'
+    request = Request(login, meta={'redirect_urls': [APP_URL]})
+
+    redirect = html(APP_URL, '', status=302, request=request)
+    assert middleware.process_response(request, redirect, None) is redirect
+
+    rendered = resolve(middleware.process_response(request, html(login, '<form></form>'), None))
+    assert middleware.pool.pages[0].url == APP_URL
+    assert rendered.url == APP_URL
+    assert middleware.stats.get_value('dynamic_render/reason/login') == 1
+
+
+def test_age_gate_pages_are_left_to_age_gate_middleware():
+    middleware = make_middleware()
+    agecheck = 'https://store.steampowered.com/agecheck/app/10/'
+    request = Request(agecheck, meta={'redirect_urls': [APP_URL]})
+    response = html(agecheck, '<div id="app_agegate"></div>')
+
+    assert middleware.process_response(request, response, None) is response
+    assert middleware.pool.pages == []
+
+
+def test_meta_flag_controls_rendering():
+    middleware = make_middleware()
+    opt_in = Request('https://store.steampowered.com/search/', meta={'render': True})
+    assert resolve(middleware.process_request(opt_in, None)).body == RENDERED.encode()
+
+    opt_out = Request(APP_URL, meta={'render': False})
+    empty = html(APP_URL, '<div></div>')
+    assert middleware.process_response(opt_out, empty, None) is empty
+
+    json_response = TextResponse(APP_URL, body=b'{}')
+    assert middleware.process_response(Request(APP_URL), json_response, None) is json_response
+    assert len(middleware.pool.pages) == 1
+
+
+def test_render_failure_falls_back_to_plain_response():
+    middleware = make_middleware(fail=True)
+    request = Request(APP_URL)
+    response = html(APP_URL, REVIEW_COUNT + '<div></div>')
+
+    assert resolve(middleware.process_response(request, response, None)) is response
+    assert resolve(middleware.process_request(Request(APP_URL, meta={'render': True}), None)) is None
+    assert middleware.stats.get_value('dynamic_render/failed') == 2
+
+
+def test_requires_setting_and_asyncio_reactor():
+    with pytest.raises(NotConfigured):
+        DynamicRenderMiddleware.from_crawler(get_crawler(settings_dict={'DYNAMIC_RENDER_ENABLED': False}))
+    with mock.patch('scraper.middlewares.dynamic_render.is_asyncio_reactor_installed', return_value=False):
+        with pytest.raises(NotConfigured):
+            DynamicRenderMiddleware.from_crawler(get_crawler(settings_dict={'DYNAMIC_RENDER_ENABLED': True}))
+
+
+def test_fragment_mode_returns_only_parsed_elements():
+    middleware = make_middleware()
+    request = Request(APP_URL, meta={'render': True, 'render_fragment': 'span.game_review_summary'})
+    rendered = resolve(middleware.process_request(request, None))
+    assert rendered.text == '<html><body><span class="game_review_summary">Very Positive</span></body></html>'
+
+    # 没有匹配元素时使用完整页面
+    request = Request(APP_URL, meta={'render': True, 'render_fragment': '#missing'})
+    assert resolve(middleware.process_request(request, None)).body == RENDERED.encode()
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite HTTP缓存存储和条件重新验证测试
+"""
+
+import os
+import sys
+import sqlite3
+from unittest import mock
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+from scraper.extensions.httpcache import SQLiteCacheStorage
+from scraper.middlewares.age_gate import AgeGateMiddleware
+from scraper.middlewares.httpcache import RevalidatingHttpCacheMiddleware
+
+BODY = b'<html><body>' + b'<div class="row">Steam</div>' * 2000 + b'</body></html>'
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage, spider = open_storage(tmp_path)
+    yield storage, spider
+    if storage.db is not None:
+        storage.close_spider(spider)
+
+
+def open_storage(tmp_path, **settings):
+    settings = {'HTTPCACHE_DIR': str(tmp_path), 'HTTPCACHE_EXPIRATION_SECS': 0, **settings}
+    crawler = get_crawler(settings_dict=settings)
+    spider = mock.Mock(crawler=crawler)
+    spider.name = 'steam_top_sellers'
+    storage = SQLiteCacheStorage(crawler.settings)
+    storage.open_spider(spider)
+    return storage, spider
+
+
+def make_response(url, body=BODY, status=200):
+    return HtmlResponse(url, status=status, body=body, headers={'Content-Type': 'text/html; charset=utf-8'})
+
+
+def test_store_and_retrieve_roundtrip(storage):
+    storage, spider = storage
+    request = Request('https://store.steampowered.com/app/10/')
+    assert storage.retrieve_response(spider, request) is None
+
+    storage.store_response(spider, request, make_response(request.url, status=203))
+    cached = storage.retrieve_response(spider, request)
+
+    assert isinstance(cached, HtmlResponse)
+    assert cached.body == BODY
+    assert cached.status == 203
+    assert cached.headers[b'Content-Type'] == b'text/html; charset=utf-8'
+
+
+def test_identical_bodies_are_stored_once_and_compressed(storage):
+    storage, spider = storage
+    for app_id in range(5):
+        request = Request(f'https://store.steampowered.com/app/{app_id}/')
+        storage.store_response(spider, request, make_response(request.url))
+
+    assert storage.db.execute('SELECT COUNT(*) FROM responses').fetchone()[0] == 5
+    assert storage.db.execute('SELECT COUNT(*) FROM bodies').fetchone()[0] == 1
+    assert storage._body_bytes() < len(BODY) / 10
+
+
+def test_expired_entries_are_not_returned(tmp_path):
+    storage, spider = open_storage(tmp_path, HTTPCACHE_EXPIRATION_SECS=60)
+    request = Request('https://store.steampowered.com/app/10/')
+    storage.store_response(spider, request, make_response(request.url))
+
+    with mock.patch('scraper.extensions.httpcache.time.time', return_value=10 ** 10):
+        assert storage.retrieve_response(spider, request) is None
+    storage.close_spider(spider)
+
+
+def test_evicts_least_recently_used_over_size_limit(tmp_path):
+    storage, spider = open_storage(tmp_path, HTTPCACHE_SQLITE_MAX_BYTES=1, HTTPCACHE_SQLITE_MAX_AGE=0)
+    requests = [Request(f'https://store.steampowered.com/app/{i}/') for i in range(3)]
+    for i, request in enumerate(requests):
+        with mock.patch('scraper.extensions.httpcache.time.time', return_value=1000.0 + i):
+            storage.store_response(spider, request, make_response(request.url, body=os.urandom(2000)))
+    storage.max_bytes = 3000
+
+    assert storage.evict() == 2
+    assert storage.retrieve_response(spider, requests[2]) is not None
+    assert storage.retrieve_response(spider, requests[0]) is None
+    assert storage.db.execute('SELECT COUNT(*) FROM bodies').fetchone()[0] == 1
+    storage.close_spider(spider)
+
+
+def test_reads_do_not_write_and_access_times_are_flushed_in_batches(tmp_path):
+    storage, spider = open_storage(tmp_path, HTTPCACHE_SQLITE_ACCESS_FLUSH_SIZE=3)
+    requests = [Request(f'https://store.steampowered.com/app/{i}/') for i in range(3)]
+    with mock.patch('scraper.extensions.httpcache.time.time', return_value=1000.0):
+        for request in requests:
+            storage.store_response(spider, request, make_response(request.url))
+
+    changes = storage.db.total_changes
+    with mock.patch('scraper.extensions.httpcache.time.time', return_value=2000.0):
+        for request in requests[:2]:
+            assert storage.retrieve_response(spider, request) is not None
+    assert storage.db.total_changes == changes
+
+    with mock.patch('scraper.extensions.httpcache.time.time', return_value=2000.0):
+        assert storage.retrieve_response(spider, requests[2]) is not None
+    accessed = [row[0] for row in storage.db.execute('SELECT accessed_at FROM responses')]
+    assert accessed == [2000.0] * 3
+    storage.close_spider(spider)
+
+
+def test_body_refcounts_and_size_total_track_writes_and_evictions(tmp_path):
+    storage, spider = open_storage(tmp_path, HTTPCACHE_SQLITE_MAX_AGE=0, HTTPCACHE_SQLITE_EVICT_BATCH=2)
+    requests = [Request(f'https://store.steampowered.com/app/{i}/') for i in range(5)]
+    for i, request in enumerate(requests):
+        with mock.patch('scraper.extensions.httpcache.time.time', return_value=1000.0 + i):
+            storage.store_response(spider, request, make_response(request.url))
+    # 重新保存为不同的内容，旧响应体仍被其他响应引用
+    with mock.patch('scraper.extensions.httpcache.time.time', return_value=1010.0):
+        storage.store_response(spider, requests[4], make_response(requests[4].url, body=os.urandom(2000)))
+
+    def check_totals():
+        total = storage.db.execute('SELECT COALESCE(SUM(LENGTH(data)), 0) FROM bodies').fetchone()[0]
+        assert storage._body_bytes() == total
+        refs = dict(storage.db.execute('SELECT hash, refs FROM bodies'))
+        counts = dict(storage.db.execute('SELECT body_hash, COUNT(*) FROM responses GROUP BY body_hash'))
+        assert refs == counts
+
+    check_totals()
+    assert sorted(dict(storage.db.execute('SELECT hash, refs FROM bodies')).values()) == [1, 4]
+
+    # 分批淘汰：共享的响应体在最后一个引用删除后才释放
+    storage.max_bytes = storage._body_bytes() - 1
+    assert storage.evict() == 4
+    check_totals()
+    assert storage.retrieve_response(spider, requests[4]) is not None
+    storage.close_spider(spider)
+
+
+def test_cache_file_from_older_version_is_rebuilt(tmp_path):
+    db = sqlite3.connect(os.path.join(str(tmp_path), 'httpcache.sqlite'))
+    db.execute('CREATE TABLE bodies (hash BLOB PRIMARY KEY, codec TEXT NOT NULL, data BLOB NOT NULL)')
+    db.execute("INSERT INTO bodies VALUES (x'00', 'zlib', x'00')")
+    db.commit()
+    db.close()
+
+    storage, spider = open_storage(tmp_path)
+    request = Request('https://store.steampowered.com/app/10/')
+    storage.store_response(spider, request, make_response(request.url))
+    assert storage.retrieve_response(spider, request).body == BODY
+    assert storage.db.execute('SELECT COUNT(*) FROM bodies').fetchone()[0] == 1
+    storage.close_spider(spider)
+
+
+def test_evicts_periodically_while_writing(tmp_path):
+    storage, spider = open_storage(tmp_path, HTTPCACHE_SQLITE_MAX_BYTES=3000, HTTPCACHE_SQLITE_MAX_AGE=0,
+                                   HTTPCACHE_SQLITE_EVICT_EVERY=4)
+    for i in range(4):
+        request = Request(f'https://store.steampowered.com/app/{i}/')
+        with mock.patch('scraper.extensions.httpcache.time.time', return_value=1000.0 + i):
+            storage.store_response(spider, request, make_response(request.url, body=os.urandom(2000)))
+
+    assert storage._body_bytes() <= 3000
+    assert storage.db.execute('SELECT COUNT(*) FROM responses').fetchone()[0] == 1
+    storage.close_spider(spider)
+
+
+def test_processes_sharing_cache_file_do_not_lock_each_other(tmp_path):
+    first, spider = open_storage(tmp_path, HTTPCACHE_SQLITE_BUSY_TIMEOUT=0.1)
+    second, _ = open_storage(tmp_path, HTTPCACHE_SQLITE_BUSY_TIMEOUT=0.1)
+    requests = [Request(f'https://store.steampowered.com/app/{i}/') for i in range(4)]
+    for i, request in enumerate(requests):
+        (first, second)[i % 2].store_response(spider, request, make_response(request.url))
+
+    # 每次写入都已提交，另一个进程立即可以读到
+    assert all(storage.retrieve_response(spider, request) is not None
+               for storage in (first, second) for request in requests)
+    first.close_spider(spider)
+    second.close_spider(spider)
+
+
+def test_evicts_by_age_and_persists_between_runs(tmp_path):
+    storage, spider = open_storage(tmp_path)
+    request = Request('https://store.steampowered.com/app/10/')
+    storage.store_response(spider, request, make_response(request.url))
+    storage.close_spider(spider)
+
+    # 新一轮抓取读取同一个缓存文件
+    storage, spider = open_storage(tmp_path)
+    assert storage.retrieve_response(spider, request).body == BODY
+    storage.close_spider(spider)
+
+    with mock.patch('scraper.extensions.httpcache.time.time', return_value=10 ** 10):
+        storage, spider = open_storage(tmp_path)
+    assert storage.retrieve_response(spider, request) is None
+    storage.close_spider(spider)
+
+    db = sqlite3.connect(os.path.join(str(tmp_path), 'httpcache.sqlite'))
+    assert db.execute('SELECT COUNT(*) FROM bodies').fetchone()[0] == 0
+    db.close()
+
+
+def make_middleware(tmp_path, **settings):
+    settings = {
+        'HTTPCACHE_ENABLED': True,
+        'HTTPCACHE_DIR': str(tmp_path),
+        'HTTPCACHE_EXPIRATION_SECS': 0,
+        'HTTPCACHE_STORAGE': 'scraper.extensions.httpcache.SQLiteCacheStorage',
+        'HTTPCACHE_POLICY': 'scraper.extensions.httpcache.RevalidatingCachePolicy',
+        'HTTPCACHE_REVALIDATE_AFTER_SECS': 3600,
+        **settings,
+    }
+    crawler = get_crawler(settings_dict=settings)
+    spider = mock.Mock(crawler=crawler)
+    spider.name = 'steam_top_sellers'
+    crawler.stats.open_spider(spider)
+    middleware = RevalidatingHttpCacheMiddleware.from_crawler(crawler)
+    middleware.spider_opened(spider)
+    return middleware, spider
+
+
+def download(middleware, spider, request, response):
+    """模拟经过缓存中间件的一次下载"""
+    cached = middleware.process_request(request, spider)
+    if cached is not None:
+        return cached
+    return middleware.process_response(request, response, spider)
+
+
+def test_fresh_entries_are_served_without_revalidation(tmp_path):
+    middleware, spider = make_middleware(tmp_path)
+    url = 'https://store.steampowered.com/app/10/'
+    download(middleware, spider, Request(url), make_response(url))
+
+    request = Request(url)
+    assert middleware.process_request(request, spider).body == BODY
+    assert b'If-None-Match' not in request.headers
+    middleware.spider_closed(spider)
+
+
+def test_not_modified_refreshes_cached_entry_and_counts_ratio(tmp_path):
+    middleware, spider = make_middleware(tmp_path)
+    url = 'https://store.steampowered.com/app/10/'
+    first = make_response(url)
+    first.headers[b'ETag'] = b'"v1"'
+    first.headers[b'Date'] = b'Thu, 01 Jan 2015 00:00:00 GMT'
+    download(middleware, spider, Request(url), first)
+
+    request = Request(url)
+    assert middleware.process_request(request, spider) is None
+    assert request.headers[b'If-None-Match'] == b'"v1"'
+
+    not_modified = HtmlResponse(url, status=304, body=b'', headers={'ETag': '"v1"', 'Cache-Control': 'max-age=60'})
+    response = middleware.process_response(request, not_modified, spider)
+    assert response.status == 200
+    assert response.body == BODY
+    assert response.headers[b'Cache-Control'] == b'max-age=60'
+
+    # 刷新后的条目重新开始计算缓存年龄
+    assert middleware.process_request(Request(url), spider).body == BODY
+
+    # 内容变化时返回并缓存新响应
+    with mock.patch('scraper.extensions.httpcache.time.time', return_value=10 ** 10):
+        request = Request(url)
+        assert middleware.process_request(request, spider) is None
+    changed = make_response(url, body=b'<html>new</html>')
+    assert middleware.process_response(request, changed, spider) is changed
+
+    middleware.spider_closed(spider)
+    stats = middleware.stats
+    assert stats.get_value('httpcache/conditional') == 2
+    assert stats.get_value('httpcache/not_modified') == 1
+    assert stats.get_value('httpcache/not_modified_ratio') == 0.5
+    assert stats.get_value('httpcache/not_modified_bytes') == len(BODY)
+
+
+def test_age_gate_responses_are_not_cached_but_retry_is(tmp_path):
+    middleware, spider = make_middleware(tmp_path)
+    age_gate = AgeGateMiddleware(['store.steampowered.com'])
+    url = 'https://store.steampowered.com/app/292030/'
+    gate = HtmlResponse(url, status=302, headers={'Location': 'https://store.steampowered.com/agecheck/app/292030/'})
+
+    # 响应先经过HTTP缓存中间件 (900) 再到年龄验证中间件 (650)
+    request = Request(url)
+    response = download(middleware, spider, request, gate)
+    retry = age_gate.process_response(request, response, spider)
+    assert isinstance(retry, Request)
+    assert middleware.storage.retrieve_response(spider, request) is None
+
+    page = download(middleware, spider, retry, make_response(url))
+    assert age_gate.process_response(retry, page, spider) is page
+    assert middleware.process_request(Request(url), spider).body == BODY
+    middleware.spider_closed(spider)
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+列表行解析器测试 - 与旧版逐行解析逻辑的结果保持一致
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapy.http import HtmlResponse
+from scraper.utils.row_extractor import SearchRowExtractor
+from benchmark_row_extractor import DEFAULT_FIXTURE, legacy_extract
+
+
+def load_fixture_response():
+    with open(DEFAULT_FIXTURE, 'rb') as f:
+        body = f.read()
+    return HtmlResponse(url='https://store.steampowered.com/search/', body=body, encoding='utf-8')
+
+
+def test_extractor_matches_legacy_parse():
+    response = load_fixture_response()
+    legacy_rows = legacy_extract(response)
+    rows = SearchRowExtractor().extract(response)
+
+    assert len(rows) == len(legacy_rows) == 50
+    for row, legacy_row in zip(rows, legacy_rows):
+        for field, value in row.items():
+            assert legacy_row.get(field) == value, field
+
+
+def test_app_id_falls_back_to_href():
+    rows = SearchRowExtractor().extract(load_fixture_response())
+    # 样本中第8行没有data-ds-appid属性
+    assert rows[7]['app_id'] == str(1000000 + 7 * 37)
+
+
+def test_no_rows_on_unrelated_page():
+    response = HtmlResponse(url='https://store.steampowered.com/', body=b'<html><body></body></html>')
+    assert SearchRowExtractor().extract(response) == []
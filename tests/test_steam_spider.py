@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Steam爬虫分页模式和详情记录测试（使用保存的搜索页样本，不访问网络）
+"""
+
+import os
+import sys
+import json
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapy import Request
+from scrapy.http import HtmlResponse, TextResponse
+from scrapy.selector import Selector
+from scrapy.utils.test import get_crawler
+from scraper.items import SteamGameItem, SteamGameRecord
+from scraper.spiders.steam_spider import SteamPopularSpider, SteamTopSellersSpider
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'steam_search_topsellers.html')
+
+
+def make_spider(**settings):
+    settings.setdefault('SEARCH_PAGINATION_ENABLED', True)
+    crawler = get_crawler(SteamTopSellersSpider, settings)
+    return SteamTopSellersSpider.from_crawler(crawler)
+
+
+def fragment_response(request, rows_html, start, total_count=1000):
+    body = json.dumps({
+        'success': 1,
+        'results_html': rows_html,
+        'total_count': total_count,
+        'start': start,
+    }).encode('utf-8')
+    return TextResponse(url=request.url, body=body, encoding='utf-8', request=request)
+
+
+def fixture_rows_html():
+    with open(FIXTURE, 'rb') as f:
+        selector = Selector(text=f.read().decode('utf-8'))
+    return ''.join(selector.css('a.search_result_row').getall())
+
+
+def test_start_requests_schedule_page_window():
+    spider = make_spider(SEARCH_PAGE_CONCURRENCY=3, MAX_PAGES_PER_SPIDER=10)
+    requests = list(spider.start_requests())
+    assert len(requests) == 3
+    assert 'start=100' in requests[2].url and 'infinite=1' in requests[2].url
+
+
+def test_html_mode_when_pagination_disabled():
+    spider = make_spider(SEARCH_PAGINATION_ENABLED=False)
+    requests = list(spider.start_requests())
+    assert [r.url for r in requests] == spider.start_urls
+
+
+def test_search_page_yields_details_and_next_page():
+    spider = make_spider(SEARCH_PAGE_CONCURRENCY=2, MAX_PAGES_PER_SPIDER=10)
+    first = list(spider.start_requests())[0]
+    results = list(spider.parse_search_page(fragment_response(first, fixture_rows_html(), 0), page=0))
+
+    details = [r for r in results if isinstance(r, Request) and r.callback == spider.parse_detail]
+    pages = [r for r in results if isinstance(r, Request) and r.callback == spider.parse_search_page]
+    assert len(details) == 50
+    assert details[0].meta['item']['rank'] == 1
+    assert [r.cb_kwargs['page'] for r in pages] == [2]
+
+
+def test_stops_when_page_has_no_new_app_ids():
+    spider = make_spider(SEARCH_PAGE_CONCURRENCY=2, MAX_PAGES_PER_SPIDER=10)
+    first, second = list(spider.start_requests())
+    rows_html = fixture_rows_html()
+    list(spider.parse_search_page(fragment_response(first, rows_html, 0), page=0))
+
+    # 第二页返回相同的app_id时不再调度任何请求
+    assert list(spider.parse_search_page(fragment_response(second, rows_html, 50), page=1)) == []
+
+
+def test_duplicate_rows_keep_page_positions_as_ranks():
+    spider = make_spider(SEARCH_PAGE_CONCURRENCY=2, MAX_PAGES_PER_SPIDER=10)
+    first, second = list(spider.start_requests())
+    rows = Selector(text=fixture_rows_html()).css('a.search_result_row').getall()
+    list(spider.parse_search_page(fragment_response(first, ''.join(rows[:2]), 0), page=0))
+
+    # Steam分页偏移时，第二页开头出现上一页已有的app_id
+    results = list(spider.parse_search_page(fragment_response(second, ''.join(rows[1:4]), 50), page=1))
+    ranks = [r.meta['item']['rank'] for r in results if isinstance(r, Request) and r.callback == spider.parse_detail]
+    assert ranks == [52, 53]
+
+
+def test_non_json_search_page_is_skipped():
+    spider = make_spider()
+    first = list(spider.start_requests())[0]
+    response = HtmlResponse(url=first.url, body=b'<html>Access Denied</html>', request=first)
+    assert list(spider.parse_search_page(response, page=0)) == []
+    assert spider.crawler.stats.get_value('search/invalid_json') == 1
+
+
+def test_respects_max_pages_and_total_count():
+    spider = make_spider(SEARCH_PAGE_CONCURRENCY=2, MAX_PAGES_PER_SPIDER=2)
+    first = list(spider.start_requests())[0]
+    results = list(spider.parse_search_page(fragment_response(first, fixture_rows_html(), 0), page=0))
+    assert not [r for r in results if isinstance(r, Request) and r.callback == spider.parse_search_page]
+
+
+def test_fresh_detail_cache_skips_detail_request(tmp_path):
+    spider = make_spider(
+        SEARCH_PAGE_CONCURRENCY=1,
+        DETAIL_CACHE_ENABLED=True,
+        DETAIL_CACHE_PATH=str(tmp_path / 'detail.sqlite'),
+    )
+    first = list(spider.start_requests())[0]
+    rows_html = fixture_rows_html()
+    results = list(spider.parse_search_page(fragment_response(first, rows_html, 0), page=0))
+    detail = [r for r in results if isinstance(r, Request) and r.callback == spider.parse_detail][0]
+
+    item = detail.meta['item']
+    item.update({'publisher': 'Valve', 'release_date': '2023年1月1日', 'genres': ['动作'],
+                 'tags': ['射击'], 'positive_rate': '90', 'total_reviews': '1000'})
+    spider._store_detail(item)
+
+    # 新一轮抓取时，命中缓存的游戏直接产出数据项
+    spider.seen_app_ids.clear()
+    results = list(spider.parse_search_page(fragment_response(first, rows_html, 0), page=0))
+    cached = [r for r in results if not isinstance(r, Request)]
+    assert len(cached) == 1
+    assert cached[0]['publisher'] == 'Valve' and cached[0]['tags'] == ['射击']
+    assert spider.crawler.stats.get_value('detail_cache/hit') == 1
+
+
+def test_stale_detail_group_forces_refetch(tmp_path):
+    spider = make_spider(
+        DETAIL_CACHE_ENABLED=True,
+        DETAIL_CACHE_PATH=str(tmp_path / 'detail.sqlite'),
+        DETAIL_CACHE_TTL={'reviews': 0},
+    )
+    cache = spider.detail_cache
+    static = {'publisher': 'Valve', 'release_date': '2007年10月10日'}
+    cache._save('10', {'static': static, 'tags': {}, 'reviews': {}}, 0)
+    assert cache.get_fresh('10', ('static',)) is None
+    cache._save('10', {'static': static}, time.time())
+    assert cache.get_fresh('10', ('static',)) == static
+    assert cache.get_fresh('10', ('static', 'reviews')) is None
+
+
+def test_empty_detail_page_is_not_cached(tmp_path):
+    spider = make_spider(DETAIL_CACHE_ENABLED=True, DETAIL_CACHE_PATH=str(tmp_path / 'detail.sqlite'))
+    cache = spider.detail_cache
+    # 详情页什么都没有解析出来（年龄验证页、渲染失败等）
+    assert cache.store('20', {'app_id': '20', 'tags': []}, ('static', 'tags', 'reviews')) == 0
+    assert cache.get_fresh('20', ('static',)) is None
+
+    # 只保存完整的分组；旧版本保存的空分组不视为新鲜
+    item = {'publisher': 'Valve', 'release_date': '2007年10月10日', 'genres': ['动作']}
+    assert cache.store('20', item, ('static', 'reviews')) == 1
+    assert cache.get_fresh('20', ('static',))['publisher'] == 'Valve'
+    cache._save('20', {'reviews': {}}, time.time())
+    assert cache.get_fresh('20', ('reviews',)) is None
+
+
+def test_record_round_trip_and_interning():
+    item = SteamGameItem(app_id='10', name='Counter-Strike', rank=1, genres=['动作', '射击'])
+    record = SteamGameRecord.from_item(item)
+    other = SteamGameRecord(genres=['动作'.encode('utf-8').decode('utf-8')])
+    assert record['genres'] == ('动作', '射击')
+    assert record['genres'][0] is other['genres'][0]
+    assert 'price' not in record and record.get('price') is None
+    assert record.to_item() == item and isinstance(record.to_item(), SteamGameItem)
+
+
+def test_detail_requests_carry_records_and_yield_items():
+    spider = make_spider(SEARCH_PAGE_CONCURRENCY=1)
+    first = list(spider.start_requests())[0]
+    results = list(spider.parse_search_page(fragment_response(first, fixture_rows_html(), 0), page=0))
+    detail = [r for r in results if isinstance(r, Request) and r.callback == spider.parse_detail][0]
+    assert isinstance(detail.meta['item'], SteamGameRecord)
+
+    body = '<div class="date">2023年1月1日</div><a class="genre">动作</a><a class="app_tag"> 射击 </a>'
+    response = HtmlResponse(url='https://store.steampowered.com/app/10/', body=body.encode('utf-8'),
+                            encoding='utf-8', request=detail)
+    item = next(spider.parse_detail(response))
+    assert isinstance(item, SteamGameItem)
+    assert item['tags'] == ['射击'] and item['release_date'] == '2023年1月1日'
+
+
+def test_detail_page_parses_only_the_spider_detail_groups():
+    body = ('<div class="date">2023年1月1日</div><a class="genre">动作</a><a class="app_tag"> 射击 </a>'
+            '<span class="game_review_summary">特别好评 (92%)</span>')
+    items = {}
+    for spider_cls in (SteamTopSellersSpider, SteamPopularSpider):
+        spider = spider_cls.from_crawler(get_crawler(spider_cls))
+        record = SteamGameRecord()
+        record.update({'name': '游戏', 'app_id': '10'})
+        request = Request('https://store.steampowered.com/app/10/', meta={'item': record})
+        response = HtmlResponse(url=request.url, body=body.encode('utf-8'), encoding='utf-8', request=request)
+        items[spider.name] = next(spider.parse_detail(response))
+    assert items['steam_top_sellers']['tags'] == ['射击'] and items['steam_top_sellers']['positive_rate'] == '92'
+    assert items['steam_popular']['genres'] == ['动作']
+    assert 'tags' not in items['steam_popular'] and 'positive_rate' not in items['steam_popular']
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+存储管道测试（使用模拟的数据库对象，不需要真实的MongoDB/MySQL）
+"""
+
+import os
+import sys
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson.decimal128 import Decimal128
+from pymongo import UpdateOne
+from pymysql.err import DataError, OperationalError
+from twisted.internet import defer
+from twisted.trial.unittest import TestCase
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.test import get_crawler
+from scraper.items import SteamGameItem
+from scraper.pipelines.mongodb_pipeline import MongoDBPipeline
+from scraper.pipelines.mysql_pipeline import MySQLPipeline, STEAM_GAME_COLUMNS
+from scraper.pipelines.threaded_writer import ThreadedWriter, WriteQueueFullError
+
+
+class DummySpider:
+    name = 'steam_top_sellers'
+
+
+def make_item(app_id):
+    item = SteamGameItem()
+    item['app_id'] = str(app_id)
+    item['name'] = f'游戏{app_id}'
+    item['price'] = '98.00'
+    item['crawl_time'] = '2024-01-01T00:00:00'
+    item['crawl_date'] = '2024-01-01'
+    return item
+
+
+def make_mongodb_pipeline(batch_size):
+    stats = MemoryStatsCollector(get_crawler())
+    pipeline = MongoDBPipeline('mongodb://localhost:27017', 'gamemarket', batch_size=batch_size, stats=stats)
+    collection = mock.MagicMock()
+    collection.bulk_write.return_value = mock.Mock(upserted_count=0, modified_count=0, inserted_count=0)
+    pipeline.collections[DummySpider.name] = collection
+    return pipeline, collection
+
+
+def test_mongodb_buffers_until_batch_size():
+    pipeline, collection = make_mongodb_pipeline(batch_size=3)
+    spider = DummySpider()
+    for app_id in range(2):
+        pipeline.process_item(make_item(app_id), spider)
+    collection.bulk_write.assert_not_called()
+
+    pipeline.process_item(make_item(2), spider)
+    operations = collection.bulk_write.call_args[0][0]
+    assert len(operations) == 3 and all(isinstance(op, UpdateOne) for op in operations)
+    assert collection.bulk_write.call_args[1] == {'ordered': False}
+    collection.insert_one.assert_not_called()
+    assert pipeline.stats.get_value('mongodb/batches', spider=spider) == 1
+
+
+def test_mongodb_close_spider_flushes_remaining_items():
+    pipeline, collection = make_mongodb_pipeline(batch_size=10)
+    spider = DummySpider()
+    pipeline.process_item(make_item(1), spider)
+    pipeline.close_spider(spider)
+    assert len(collection.bulk_write.call_args[0][0]) == 1
+
+
+def test_mongodb_single_item_mode_keeps_insert_one():
+    pipeline, collection = make_mongodb_pipeline(batch_size=1)
+    pipeline.process_item(make_item(1), DummySpider())
+    collection.insert_one.assert_called_once()
+    collection.bulk_write.assert_not_called()
+
+
+def test_mongodb_converts_typed_values_to_bson():
+    pipeline, _ = make_mongodb_pipeline(batch_size=10)
+    item = make_item(1)
+    item['price'] = Decimal('98.00')
+    item['release_date'] = date(2023, 9, 5)
+    data = pipeline._prepare_document(item, DummySpider())
+    assert data['price'] == Decimal128('98.00')
+    assert data['release_date'] == datetime(2023, 9, 5)
+
+
+def make_mysql_pipeline(batch_size):
+    stats = MemoryStatsCollector(get_crawler())
+    pipeline = MySQLPipeline('localhost', 3306, 'root', '', 'gamemarket', batch_size=batch_size, stats=stats)
+    pipeline.connection = mock.MagicMock()
+    pipeline.cursor = mock.MagicMock()
+    pipeline.tables[DummySpider.name] = 'steam_games_2024W01'
+    return pipeline
+
+
+def test_mysql_batches_with_single_executemany_and_commit():
+    pipeline = make_mysql_pipeline(batch_size=2)
+    spider = DummySpider()
+    pipeline.process_item(make_item(1), spider)
+    pipeline.cursor.executemany.assert_not_called()
+
+    pipeline.process_item(make_item(2), spider)
+    sql, rows = pipeline.cursor.executemany.call_args[0]
+    assert 'ON DUPLICATE KEY UPDATE' in sql and '`rank` = VALUES(`rank`)' in sql
+    assert '`created_at` = VALUES' not in sql
+    assert len(rows) == 2 and len(rows[0]) == len(STEAM_GAME_COLUMNS)
+    pipeline.cursor.execute.assert_not_called()
+    pipeline.connection.commit.assert_called_once()
+    assert pipeline.stats.get_value('mysql/items_written', spider=spider) == 2
+
+
+def test_mysql_reads_typed_values_directly():
+    pipeline = make_mysql_pipeline(batch_size=1000)
+    item = make_item(1)
+    item.update({'price': Decimal('1298.00'), 'total_reviews': 12345, 'release_date': date(2023, 9, 5)})
+    row = pipeline._build_steam_row(item)
+    assert row['price'] == Decimal('1298.00')
+    assert row['total_reviews'] == 12345
+    assert row['release_date'] == date(2023, 9, 5)
+
+
+def test_mysql_failed_batch_rolls_back():
+    pipeline = make_mysql_pipeline(batch_size=1000)
+    spider = DummySpider()
+    pipeline.cursor.executemany.side_effect = Exception('lock wait timeout')
+    pipeline.process_item(make_item(1), spider)
+    pipeline._flush(spider)
+    pipeline.connection.rollback.assert_called_once()
+    assert pipeline.stats.get_value('mysql/batch_errors', spider=spider) == 1
+
+
+def test_mysql_failed_batch_is_split_to_isolate_bad_rows():
+    pipeline = make_mysql_pipeline(batch_size=1000)
+    spider = DummySpider()
+    attempts = []
+
+    def executemany(sql, rows):
+        attempts.append(len(rows))
+        if any(row[0] == '3' for row in rows):
+            raise DataError(1264, "Out of range value for column 'rank'")
+
+    pipeline.cursor.executemany.side_effect = executemany
+    for app_id in range(1, 9):
+        pipeline.process_item(make_item(app_id), spider)
+    pipeline._flush(spider)
+    assert attempts == [8, 4, 2, 2, 1, 1, 4]
+    assert pipeline.stats.get_value('mysql/items_written', spider=spider) == 7
+    assert pipeline.stats.get_value('mysql/batch_errors', spider=spider) == 1
+
+    # 连接/锁错误对整批相同，不拆分重试
+    attempts.clear()
+    pipeline.cursor.executemany.side_effect = OperationalError(1205, 'Lock wait timeout exceeded')
+    for app_id in range(1, 5):
+        pipeline.process_item(make_item(app_id), spider)
+    pipeline._flush(spider)
+    assert pipeline.cursor.executemany.call_count == 8
+    assert pipeline.stats.get_value('mysql/batch_errors', spider=spider) == 5
+
+
+def test_threaded_writer_rejects_unbounded_waiting():
+    writer = ThreadedWriter('test-writer', max_pending=1, max_waiting=2)
+    for _ in range(3):
+        writer.submit(lambda: None)  # 线程池未启动，1个在途、2个等待
+    assert writer.waiting == 2
+    with pytest.raises(WriteQueueFullError):
+        writer.submit(lambda: None)
+
+    pipeline = make_mysql_pipeline(batch_size=1000)
+    pipeline.writer = writer
+    spider = DummySpider()
+    pipeline.process_item(make_item(1), spider)
+    pipeline._flush(spider)
+    assert len(pipeline.buffers[spider.name]) == 1  # 数据留在缓冲区
+
+
+def test_mysql_close_spider_publishes_snapshot_after_writes():
+    pipeline = make_mysql_pipeline(batch_size=1000)
+    pipeline.cache_invalidator = mock.Mock()
+    pipeline.cache_invalidator.snapshot_ready.return_value = 2
+    spider = DummySpider()
+    item = make_item(1)
+    item['rank_type'] = 'topsellers'
+    pipeline.process_item(item, spider)
+    pipeline.close_spider(spider)
+    pipeline.cache_invalidator.snapshot_ready.assert_called_once_with(
+        'steam_top_sellers', ['dashboard', 'charts', 'games', 'rankings'])
+    assert pipeline.stats.get_value('mysql/snapshot_ready_receivers', spider=spider) == 2
+
+    # 没有写入数据时不发布
+    idle = make_mysql_pipeline(batch_size=1000)
+    idle.cache_invalidator = mock.Mock()
+    idle.close_spider(spider)
+    idle.cache_invalidator.snapshot_ready.assert_not_called()
+
+
+class ThreadedWriteTest(TestCase):
+    """后台写入线程池：写入在线程中执行，process_item返回Deferred"""
+
+    @defer.inlineCallbacks
+    def test_mongodb_batch_written_off_reactor_thread(self):
+        pipeline, collection = make_mongodb_pipeline(batch_size=2)
+        pipeline.writer = ThreadedWriter('test-writer', max_threads=2, max_pending=1)
+        pipeline.writer.start()
+        self.addCleanup(lambda: pipeline.writer.pool.started and pipeline.writer.pool.stop())
+        write_threads = []
+        collection.bulk_write.side_effect = lambda *args, **kwargs: (
+            write_threads.append(threading.current_thread()) or
+            mock.Mock(upserted_count=2, modified_count=0, inserted_count=0)
+        )
+        spider = DummySpider()
+
+        assert isinstance(pipeline.process_item(make_item(1), spider), SteamGameItem)
+        result = pipeline.process_item(make_item(2), spider)
+        assert isinstance(result, defer.Deferred)
+        item = yield result
+
+        assert item['app_id'] == '2'
+        assert write_threads and write_threads[0] is not threading.main_thread()
+        assert pipeline.stats.get_value('mongodb/items_written', spider=spider) == 2
+        yield pipeline.close_spider(spider)
+        assert not pipeline.writer.pool.started
@@ -0,0 +1,638 @@
+# -*- coding: utf-8 -*-
+"""
+Web数据库连接池、读穿缓存与缓存预热测试（使用模拟的MySQL连接和Redis）
+"""
+
+import os
+import sys
+import json
+import fnmatch
+import time
+import threading
+from unittest import mock
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scraper.utils.cache_invalidation import WebCacheInvalidator, steam_crawl_namespaces
+from web.utils.cache_warmer import CacheWarmer
+from web.utils.database import (
+    CacheManager, DataUnavailableError, DatabaseManager, LocalCache, MySQLConnectionPool, PoolExhaustedError,
+    SteamDataQuery,
+)
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConnection:
+    def __init__(self, alive=True):
+        self.open = True
+        self.alive = alive
+        self.pings = 0
+
+    def cursor(self):
+        return FakeCursor([{'Tables_in_gamemarket': 'steam_games'}])
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+        if not self.alive:
+            raise ConnectionError('server has gone away')
+
+    def close(self):
+        self.open = False
+
+
+class FakeCreator:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.created = []
+
+    def __call__(self, **kwargs):
+        if self.fail:
+            raise ConnectionError("Can't connect to MySQL server")
+        conn = FakeConnection()
+        self.created.append(conn)
+        return conn
+
+
+def test_connections_reused_and_bounded():
+    creator = FakeCreator()
+    pool = MySQLConnectionPool(max_size=2, timeout=0.05, creator=creator)
+    first = pool.acquire()
+    second = pool.acquire()
+    with pytest.raises(PoolExhaustedError):
+        pool.acquire()
+
+    pool.release(second)
+    assert pool.acquire() is second
+    assert len(creator.created) == 2 and pool.size == 2
+
+
+def test_waiting_thread_gets_released_connection():
+    pool = MySQLConnectionPool(max_size=1, timeout=2, creator=FakeCreator())
+    conn = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    pool.release(conn)
+    waiter.join(2)
+    assert got == [conn]
+
+
+def test_stale_and_closed_connections_are_replaced():
+    creator = FakeCreator()
+    pool = MySQLConnectionPool(max_size=1, ping_interval=0, creator=creator)
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.alive = False
+    fresh = pool.acquire()
+    assert fresh is not conn and not conn.open and conn.pings == 1
+
+    fresh.close()
+    pool.release(fresh)
+    assert pool.size == 0 and pool.idle_count == 0
+    assert pool.acquire() is creator.created[-1]
+
+
+def test_failed_connect_frees_slot():
+    creator = FakeCreator(fail=True)
+    pool = MySQLConnectionPool(max_size=1, creator=creator)
+    with pytest.raises(ConnectionError):
+        pool.acquire()
+    creator.fail = False
+    assert pool.acquire() is creator.created[0]
+
+
+def make_manager(creator, **config):
+    config = {'MYSQL_POOL_SIZE': 2, 'REDIS_URL': 'redis://127.0.0.1:1', **config}
+    with mock.patch('web.utils.database.pymysql.connect', creator), \
+            mock.patch('web.utils.database.pymongo.MongoClient'):
+        manager = DatabaseManager(config)
+    manager.mysql_pool.creator = creator
+    return manager
+
+
+def test_manager_checks_out_one_connection_per_thread():
+    creator = FakeCreator()
+    manager = make_manager(creator)
+    conn = manager.get_mysql_connection()
+    assert manager.get_mysql_connection() is conn
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(manager.get_mysql_connection()))
+    thread.start()
+    thread.join(2)
+    assert other[0] is not conn
+
+    # 请求结束时归还而不是关闭
+    manager.release_connections()
+    assert conn.open and manager.mysql_pool.idle_count == 1
+    assert manager.get_mysql_connection() is conn
+
+    manager.close_connections()
+    assert not conn.open
+
+
+def test_query_scope_returns_connection_from_any_thread():
+    creator = FakeCreator()
+    manager = make_manager(creator)
+    query = SteamDataQuery(manager)
+
+    # 后台线程没有请求结束时的teardown，查询结束时也要归还连接
+    tables = []
+    thread = threading.Thread(target=lambda: tables.append(query.get_available_tables()))
+    thread.start()
+    thread.join(2)
+    assert tables == [['steam_games']]
+    assert manager.mysql_pool.size == 1 and manager.mysql_pool.idle_count == 1
+
+    with manager.mysql_connection() as conn:
+        with manager.mysql_connection() as inner:
+            assert inner is conn
+        assert manager.mysql_pool.idle_count == 0
+    assert manager.mysql_pool.idle_count == 1
+    manager.close_connections()
+
+
+def test_manager_backs_off_when_mysql_unavailable():
+    creator = FakeCreator(fail=True)
+    manager = make_manager(creator, MYSQL_RETRY_INTERVAL=60)
+    assert manager.get_mysql_connection() is None
+    creator.fail = False
+    # 重试间隔内直接返回None，不再等待连接超时
+    assert manager.get_mysql_connection() is None
+    assert creator.created == []
+
+
+class FakePubSub:
+    def __init__(self, redis):
+        self.redis = redis
+
+    def subscribe(self, **handlers):
+        for channel, handler in handlers.items():
+            self.redis.subscribers.setdefault(channel, []).append(handler)
+
+    def run_in_thread(self, **kwargs):
+        return mock.Mock()
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args) for name, args in self.calls]
+
+
+class FakeRedis:
+    """只实现CacheManager用到的命令，过期时间由测试手动控制；多个实例可共享数据模拟多个工作进程"""
+
+    def __init__(self, data=None, subscribers=None):
+        self.data = {} if data is None else data
+        self.subscribers = {} if subscribers is None else subscribers
+        self.gets = 0
+        self.published = []
+
+    def worker(self):
+        """连接同一Redis的另一个进程"""
+        return FakeRedis(self.data, self.subscribers)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+    def publish(self, channel, message):
+        self.published.append(json.loads(message))
+        handlers = self.subscribers.get(channel, [])
+        for handler in handlers:
+            handler({'type': 'message', 'channel': channel, 'data': message.encode()})
+        return len(handlers)
+
+    def get(self, key):
+        self.gets += 1
+        return self.data.get(key)
+
+    def setex(self, key, timeout, value):
+        self.data[key] = value.encode()
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value).encode()
+        return True
+
+    def incr(self, key):
+        value = int(self.data.get(key, 0)) + 1
+        self.data[key] = str(value).encode()
+        return value
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def scan_iter(self, match='*', count=None):
+        return iter([key for key in list(self.data) if fnmatch.fnmatchcase(key, match)])
+
+    def unlink(self, *keys):
+        return self.delete(*keys)
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def eval(self, script, numkeys, key, token):
+        if self.data.get(key) == token.encode():
+            del self.data[key]
+            return 1
+        return 0
+
+
+def make_cache(redis_client=None, **kwargs):
+    db_manager = mock.Mock()
+    db_manager.get_redis_client.return_value = redis_client or FakeRedis()
+    return CacheManager(db_manager, **kwargs)
+
+
+def test_cached_decorator_computes_once_per_key():
+    cache = make_cache()
+    calls = []
+
+    @cache.cached('rankings_{0}_{1}', ttl=60)
+    def load(rank_type, limit):
+        calls.append((rank_type, limit))
+        return [rank_type] * limit
+
+    assert load('topsellers', 2) == ['topsellers', 'topsellers']
+    assert load('topsellers', 2) == ['topsellers', 'topsellers']
+    load('new', 1)
+    assert calls == [('topsellers', 2), ('new', 1)]
+    assert 'gamemarket:cache:rankings_topsellers_2' in cache.redis_client.data
+    assert cache.stats['hits'] == 1 and cache.stats['misses'] == 2
+
+
+def test_stale_entry_served_while_one_thread_refreshes():
+    cache = make_cache()
+    cache.get_or_compute('summary', lambda: 'old', ttl=60)
+    with mock.patch('web.utils.database.time.time', return_value=time.time() + 120):
+        release = threading.Event()
+        refreshed = []
+
+        def slow_compute():
+            release.wait(2)
+            refreshed.append(1)
+            return 'new'
+
+        # 后台刷新进行中，其他请求继续拿到旧数据且不再触发刷新
+        assert cache.get_or_compute('summary', slow_compute, ttl=60) == 'old'
+        assert cache.get_or_compute('summary', slow_compute, ttl=60) == 'old'
+        release.set()
+        for _ in range(100):
+            if 'gamemarket:cache:summary:lock' not in cache.redis_client.data:
+                break
+            time.sleep(0.01)
+    assert refreshed == [1]
+    assert cache.get_or_compute('summary', lambda: 'unused', ttl=60) == 'new'
+    assert cache.stats['stale_hits'] == 2
+
+
+def test_background_refresh_returns_mysql_connection():
+    manager = make_manager(FakeCreator())
+    manager.redis_client = FakeRedis()
+    cache = CacheManager(manager)
+    cache.get_or_compute('summary', lambda: 'old', ttl=60)
+
+    def compute():
+        # 未使用mysql_connection作用域的查询
+        assert manager.get_mysql_connection() is not None
+        return 'new'
+
+    with mock.patch('web.utils.database.time.time', return_value=time.time() + 120):
+        assert cache.get_or_compute('summary', compute, ttl=60) == 'old'
+        assert wait_for(lambda: 'gamemarket:cache:summary:lock' not in manager.redis_client.data)
+    assert manager.mysql_pool.size == 1 and manager.mysql_pool.idle_count == 1
+    manager.mysql_pool.close()
+
+
+def test_concurrent_misses_run_query_once():
+    cache = make_cache()
+    started = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return {'total_games': 10}
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(cache.get_or_compute('summary', compute)))
+    first.start()
+    started.wait(2)
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('summary', compute)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in [first, *threads]:
+        thread.join(5)
+    assert calls == [1]
+    assert results == [{'total_games': 10}] * 5
+
+
+def test_local_cache_is_bounded_lru_with_ttl():
+    local = LocalCache(max_entries=2, ttl=10)
+    local.set('a', 1)
+    local.set('b', 2)
+    assert local.get('a') == 1
+    local.set('c', 3)  # 淘汰最久未使用的b
+    assert local.get('b') is None and local.get('a') == 1 and len(local) == 2
+    local.set('short', 'x', ttl=0)
+    assert local.get('short') is None
+    assert local.stats['evictions'] == 2
+
+
+def test_hot_reads_served_locally_and_invalidated_across_workers():
+    redis_client = FakeRedis()
+    worker_a = make_cache(redis_client)
+    worker_b = make_cache(redis_client.worker())
+
+    worker_a.set_cached_data('api_stats_summary', {'total_games': 1})
+    assert worker_b.get_cached_data('api_stats_summary') == {'total_games': 1}
+    gets = (worker_a.redis_client.gets, worker_b.redis_client.gets)
+    for _ in range(5):
+        assert worker_a.get_cached_data('api_stats_summary') == {'total_games': 1}
+        assert worker_b.get_cached_data('api_stats_summary') == {'total_games': 1}
+    assert (worker_a.redis_client.gets, worker_b.redis_client.gets) == gets  # 没有访问Redis
+
+    # 一个进程写入后，其他进程丢弃本地副本并重新读取Redis
+    worker_a.set_cached_data('api_stats_summary', {'total_games': 2})
+    assert worker_b.get_cached_data('api_stats_summary') == {'total_games': 2}
+    worker_b.delete_cached_data('api_stats_summary')
+    assert worker_a.get_cached_data('api_stats_summary') is None
+
+
+def test_local_cache_disabled_without_invalidation():
+    redis_client = FakeRedis()
+    redis_client.pubsub = mock.Mock(side_effect=ConnectionError('pubsub unavailable'))
+    assert make_cache(redis_client).local is None
+    assert make_cache(FakeRedis(), local_max_entries=0).local is None
+
+
+def test_namespace_generation_invalidates_whole_family():
+    cache = make_cache()
+    calls = []
+
+    @cache.cached('top_{1}', namespace='rankings:{0}', ttl=3600)
+    def load(rank_type, limit):
+        calls.append(rank_type)
+        return [rank_type] * limit
+
+    load('topsellers', 2)
+    load('popular', 2)
+    assert 'gamemarket:cache:rankings:topsellers:v0:top_2' in cache.redis_client.data
+
+    assert cache.invalidate_namespace('rankings:topsellers')
+    load('topsellers', 2)
+    load('popular', 2)
+    assert calls == ['topsellers', 'popular', 'topsellers']
+    assert cache.make_key('rankings:topsellers', 'top_2') == 'rankings:topsellers:v1:top_2'
+
+
+def test_delete_cache_scans_only_prefixed_keys():
+    redis_client = FakeRedis()
+    redis_client.data['steam_top_sellers:requests'] = b'queue'  # 爬虫队列
+    cache = make_cache(redis_client, scan_count=2)
+    for name in ('price_distribution', 'genre_distribution', 'discount_analysis'):
+        cache.set_cached_data(f'charts:v0:{name}', {'labels': []})
+    cache.set_cached_data('dashboard:v0:summary', {})
+
+    assert cache.delete_cache('charts:*') == 3
+    assert cache.get_cached_data('charts:v0:price_distribution') is None
+    assert cache.get_cached_data('dashboard:v0:summary') == {}
+    assert redis_client.published[-1]['patterns'] == ['charts:*']
+
+    assert cache.clear_all_cache()
+    assert list(redis_client.data) == ['steam_top_sellers:requests']
+
+
+def test_crawler_invalidation_reaches_web_workers():
+    redis_client = FakeRedis()
+    cache = make_cache(redis_client)
+    cache.get_or_compute('summary', lambda: 'before crawl', ttl=3600, namespace='dashboard')
+
+    invalidator = WebCacheInvalidator('redis://localhost:6379')
+    invalidator.client = redis_client.worker()
+    assert invalidator.invalidate(steam_crawl_namespaces())
+
+    assert cache.get_or_compute('summary', lambda: 'after crawl', ttl=3600, namespace='dashboard') == 'after crawl'
+    assert redis_client.data['gamemarket:cache:rankings:gen'] == b'1'
+
+
+def test_popular_crawl_invalidates_every_rankings_view():
+    redis_client = FakeRedis()
+    cache = make_cache(redis_client)
+    version = ['before crawl']
+
+    @cache.cached('{0}_top_{1}', namespace='rankings', ttl=3600)
+    def load_rankings(rank_type, limit):
+        return version[0]
+
+    # Web排行榜按排序方式缓存，与爬虫的榜单类型无关
+    assert load_rankings('topsellers', 50) == 'before crawl'
+    assert load_rankings('newreleases', 50) == 'before crawl'
+    version[0] = 'after crawl'
+
+    invalidator = WebCacheInvalidator('redis://localhost:6379')
+    invalidator.client = redis_client.worker()
+    assert invalidator.snapshot_ready('steam_popular', steam_crawl_namespaces()) == 0
+    assert load_rankings('topsellers', 50) == 'after crawl'
+    assert load_rankings('newreleases', 50) == 'after crawl'
+
+
+def test_compute_directly_without_redis():
+    db_manager = mock.Mock()
+    db_manager.get_redis_client.return_value = None
+    cache = CacheManager(db_manager)
+    assert cache.get_or_compute('summary', lambda: 42) == 42
+
+
+def wait_for(condition):
+    for _ in range(200):
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_warmer_fills_next_generation_before_swapping():
+    cache = make_cache()
+    version = ['old']
+    seen_during_warm = []
+
+    @cache.cached('summary', namespace='dashboard', ttl=3600)
+    def load_summary():
+        # 预热期间的读取仍然命中旧一代
+        seen_during_warm.append(cache.get_or_compute('summary', lambda: 'miss', ttl=3600, namespace='dashboard'))
+        return version[0]
+
+    cache.get_or_compute('summary', lambda: 'old', ttl=3600, namespace='dashboard')
+    warmer = CacheWarmer(cache)
+    warmer.register(load_summary)
+
+    version[0] = 'new'
+    assert warmer.warm(['dashboard', 'rankings']) == 1
+    assert seen_during_warm == ['old']
+    computes = cache.stats['computes']
+    assert load_summary() == 'new'
+    assert cache.stats['computes'] == computes  # 切换后直接命中预热的数据
+    assert cache.get_generation('rankings') == 1
+
+
+def test_strict_query_raises_instead_of_mock_data():
+    db_manager = mock.MagicMock()
+    db_manager.mysql_connection.return_value.__enter__.return_value = None
+    query = SteamDataQuery(db_manager)
+
+    assert query.get_statistics_summary()['total_games'] > 0  # 看板请求仍然降级为模拟数据
+    with query.strict():
+        with pytest.raises(DataUnavailableError):
+            query.get_statistics_summary()
+        # 其他线程不受影响
+        result = []
+        thread = threading.Thread(target=lambda: result.append(query.get_top_games_by_rank('topsellers', 5)))
+        thread.start()
+        thread.join(2)
+        assert len(result[0]) == 5
+
+    broken = mock.MagicMock()
+    broken.mysql_connection.return_value.__enter__.return_value.cursor.side_effect = RuntimeError('gone')
+    query = SteamDataQuery(broken)
+    with query.strict(), pytest.raises(DataUnavailableError):
+        query.get_price_distribution()
+
+
+def test_failed_loader_skips_swap_and_invalidates():
+    cache = make_cache()
+    query = SteamDataQuery(mock.MagicMock())
+    query.db_manager.mysql_connection.return_value.__enter__.return_value = None
+    version = ['old']
+
+    @cache.cached('summary', namespace='dashboard', ttl=3600)
+    def load_summary():
+        return query.get_statistics_summary()
+
+    @cache.cached('tables', namespace='dashboard', ttl=3600)
+    def load_tables():
+        return version[0]
+
+    cache.get_or_compute('summary', lambda: 'old', ttl=3600, namespace='dashboard')
+    cache.get_or_compute('tables', lambda: 'old', ttl=3600, namespace='dashboard')
+    warmer = CacheWarmer(cache, compute_scope=query.strict)
+    warmer.register(load_summary)
+    warmer.register(load_tables)
+
+    version[0] = 'new'
+    assert warmer.warm(['dashboard']) == 1
+    assert warmer.stats['errors'] == 1 and warmer.stats['fallbacks'] == 1 and warmer.stats['runs'] == 0
+    # 旧数据已失效，模拟数据没有写入缓存
+    assert cache.get_generation('dashboard') == 1
+    assert load_tables() == 'new'
+    assert not any(b'total_games' in value for value in cache.redis_client.data.values() if isinstance(value, bytes))
+
+
+def test_warmer_requeues_namespaces_when_lock_is_held():
+    redis_client = FakeRedis()
+    cache = make_cache(redis_client)
+    other = make_cache(redis_client.worker())
+    calls = []
+
+    @cache.cached('price_distribution', namespace='charts', ttl=3600)
+    def load_prices():
+        calls.append(1)
+        return len(calls)
+
+    warmer = CacheWarmer(cache, retry_interval=0.01)
+    warmer.register(load_prices)
+    with other.single_flight('cache-warmer', 60) as acquired:
+        assert acquired
+        warmer.notify(['charts'])
+        time.sleep(0.05)
+        assert calls == [] and warmer._worker is not None
+    assert wait_for(lambda: warmer.stats['runs'] == 1 and warmer._worker is None)
+    assert calls == [1]
+
+
+def test_warm_returns_mysql_connections_to_pool():
+    manager = make_manager(FakeCreator())
+    manager.redis_client = FakeRedis()
+    cache = CacheManager(manager)
+    query = SteamDataQuery(manager)
+
+    @cache.cached('tables', namespace='dashboard', ttl=3600)
+    def load_tables():
+        return query.get_available_tables()
+
+    @cache.cached('summary', namespace='dashboard', ttl=3600)
+    def load_summary():
+        # 未使用mysql_connection作用域的查询
+        return manager.get_mysql_connection() is not None
+
+    warmer = CacheWarmer(cache)
+    warmer.register(load_tables)
+    warmer.register(load_summary)
+    thread = threading.Thread(target=warmer.warm, args=(['dashboard'],))
+    thread.start()
+    thread.join(2)
+
+    assert warmer.stats['entries_warmed'] == 2
+    assert manager.mysql_pool.idle_count == manager.mysql_pool.size
+    manager.mysql_pool.close()
+
+
+def test_snapshot_event_from_crawler_triggers_warm():
+    redis_client = FakeRedis()
+    cache = make_cache(redis_client)
+    calls = []
+
+    @cache.cached('price_distribution', namespace='charts', ttl=3600)
+    def load_prices():
+        calls.append(1)
+        return {'labels': ['免费'], 'values': [len(calls)]}
+
+    load_prices()
+    warmer = CacheWarmer(cache)
+    warmer.register(load_prices)
+    assert warmer.start()
+
+    invalidator = WebCacheInvalidator('redis://localhost:6379')
+    invalidator.client = redis_client.worker()
+    assert invalidator.snapshot_ready('steam_top_sellers', steam_crawl_namespaces()) == 1
+    assert wait_for(lambda: warmer.stats['runs'] == 1 and warmer._worker is None)
+    assert load_prices() == {'labels': ['免费'], 'values': [2]}
+    assert len(calls) == 2
+    assert 'gamemarket:cache:cache-warmer:lock' not in redis_client.data
+
+
+def test_snapshot_without_web_subscribers_invalidates_directly():
+    redis_client = FakeRedis()
+    invalidator = WebCacheInvalidator('redis://localhost:6379')
+    invalidator.client = redis_client
+    assert invalidator.snapshot_ready('steam_popular', steam_crawl_namespaces()) == 0
+    assert redis_client.data['gamemarket:cache:rankings:gen'] == b'1'
+    assert redis_client.data['gamemarket:cache:dashboard:gen'] == b'1'
@@ -5,6 +5,7 @@ Flask Web应用主文件
 
 import os
 import json
+import atexit
 from datetime import datetime
 from flask import Flask, render_template, request, jsonify, flash, redirect, url_for
 from flask_caching import Cache
@@ -12,6 +13,7 @@ from loguru import logger
 
 from web.config import config
 from web.utils.database import DatabaseManager, SteamDataQuery, CacheManager
+from web.utils.cache_warmer import CacheWarmer
 
 
 def create_app(config_name=None):
@@ -28,26 +30,95 @@ def create_app(config_name=None):
     # 初始化数据库管理器
     db_manager = DatabaseManager(app.config)
     steam_query = SteamDataQuery(db_manager)
-    cache_manager = CacheManager(db_manager)
+    cache_manager = CacheManager(
+        db_manager,
+        stale_ttl=app.config['CACHE_STALE_TTL'],
+        lock_timeout=app.config['CACHE_LOCK_TIMEOUT'],
+        lock_wait=app.config['CACHE_LOCK_WAIT'],
+        local_max_entries=app.config['CACHE_LOCAL_MAX_ENTRIES'],
+        local_ttl=app.config['CACHE_LOCAL_TTL'],
+        invalidation_channel=app.config['CACHE_INVALIDATION_CHANNEL'],
+        key_prefix=app.config['CACHE_KEY_PREFIX'],
+    )
+    atexit.register(db_manager.close_connections)
+    atexit.register(cache_manager.close)
+    
+    # 带缓存的数据查询：过期后返回旧数据并由一个线程在后台刷新，缓存缺失时只查询一次。
+    # 命名空间与爬虫结束时失效的命名空间一致 (scraper.utils.cache_invalidation)
+    @cache_manager.cached('summary', namespace='dashboard', ttl=300)
+    def load_summary():
+        return steam_query.get_statistics_summary()
+    
+    @cache_manager.cached('{0}_top_{1}', namespace='rankings', ttl=180)
+    def load_rankings(rank_type, limit):
+        return steam_query.get_top_games_by_rank(rank_type, limit)
+    
+    def chart_data(distribution):
+        return {
+            'labels': list(distribution.keys()),
+            'values': list(distribution.values()),
+            'colors': app.config['CHART_COLORS'][:len(distribution)]
+        }
+    
+    @cache_manager.cached('price_distribution', namespace='charts', ttl=600)
+    def load_price_distribution():
+        return chart_data(steam_query.get_price_distribution())
+    
+    @cache_manager.cached('genre_distribution', namespace='charts', ttl=600)
+    def load_genre_distribution():
+        return chart_data(steam_query.get_genre_distribution())
+    
+    @cache_manager.cached('discount_analysis', namespace='charts', ttl=600)
+    def load_discount_analysis():
+        discount_data = steam_query.get_discount_analysis()
+        return {
+            'labels': list(discount_data.keys()),
+            'values': [v['count'] for v in discount_data.values()],
+            'avg_discounts': [v['avg_discount'] for v in discount_data.values()],
+            'colors': app.config['CHART_COLORS'][:len(discount_data)]
+        }
+    
+    @cache_manager.cached('trending_{0}', namespace='charts', ttl=600)
+    def load_trending(days):
+        return steam_query.get_trending_data(days)
+    
+    @cache_manager.cached('latest_{0}_{1}', namespace='games', ttl=180)
+    def load_latest_games(limit, rank_type):
+        return steam_query.get_latest_data(limit, rank_type)
+    
+    # 爬虫结束后预热默认参数下的看板数据，避免抓取后的第一批访问触发全部聚合查询
+    if app.config['CACHE_WARMER_ENABLED']:
+        cache_warmer = CacheWarmer(cache_manager, app.config['SNAPSHOT_CHANNEL'], compute_scope=steam_query.strict)
+        cache_warmer.register(load_summary)
+        for rank_type in app.config['CACHE_WARM_RANK_TYPES']:
+            if rank_type in app.config['RANK_TYPES']:
+                cache_warmer.register(load_rankings, rank_type, 50)
+        cache_warmer.register(load_price_distribution)
+        cache_warmer.register(load_genre_distribution)
+        cache_warmer.register(load_discount_analysis)
+        cache_warmer.register(load_trending, 7)
+        cache_warmer.register(load_latest_games, 20, None)
+        if cache_warmer.start():
+            atexit.register(cache_warmer.stop)
+    
+    def request_limit(default):
+        """请求中的条数限制，限制在 1 到 MAX_ITEMS_PER_PAGE 之间"""
+        try:
+            limit = int(request.args.get('limit', default))
+        except ValueError:
+            limit = default
+        return max(1, min(limit, app.config['MAX_ITEMS_PER_PAGE']))
     
     @app.teardown_appcontext
     def close_db(error):
-        """关闭数据库连接"""
-        db_manager.close_connections()
+        """兜底归还本次请求中没有归还的数据库连接（查询在mysql_connection作用域内已归还）"""
+        db_manager.release_connections()
     
     @app.route('/')
     def index():
         """首页 - 数据概览"""
         try:
-            # 尝试从缓存获取数据
-            cache_key = 'dashboard_summary'
-            summary = cache_manager.get_cached_data(cache_key)
-            
-            if not summary:
-                summary = steam_query.get_statistics_summary()
-                # 缓存5分钟
-                cache_manager.set_cached_data(cache_key, summary, 300)
-            
+            summary = load_summary()
             return render_template('index.html', summary=summary)
         except Exception as e:
             logger.error(f"首页加载失败: {e}")
@@ -58,16 +129,12 @@ def create_app(config_name=None):
     def rankings():
         """排行榜页面"""
         rank_type = request.args.get('type', 'topsellers')
-        limit = min(int(request.args.get('limit', 50)), app.config['MAX_ITEMS_PER_PAGE'])
+        if rank_type not in app.config['RANK_TYPES']:
+            rank_type = 'topsellers'
+        limit = request_limit(50)
         
         try:
-            cache_key = f'rankings_{rank_type}_{limit}'
-            games = cache_manager.get_cached_data(cache_key)
-            
-            if not games:
-                games = steam_query.get_top_games_by_rank(rank_type, limit)
-                cache_manager.set_cached_data(cache_key, games, 180)  # 缓存3分钟
-            
+            games = load_rankings(rank_type, limit)
             return render_template('rankings.html', 
                                    games=games, 
                                    rank_type=rank_type,
@@ -97,13 +164,7 @@ def create_app(config_name=None):
     def api_stats_summary():
         """API: 获取统计摘要"""
         try:
-            cache_key = 'api_stats_summary'
-            summary = cache_manager.get_cached_data(cache_key)
-            
-            if not summary:
-                summary = steam_query.get_statistics_summary()
-                cache_manager.set_cached_data(cache_key, summary, 300)
-            
+            summary = load_summary()
             return jsonify({
                 'success': True,
                 'data': summary,
@@ -121,18 +182,7 @@ def create_app(config_name=None):
     def api_price_distribution():
         """API: 价格分布图表数据"""
         try:
-            cache_key = 'chart_price_distribution'
-            data = cache_manager.get_cached_data(cache_key)
-            
-            if not data:
-                price_dist = steam_query.get_price_distribution()
-                data = {
-                    'labels': list(price_dist.keys()),
-                    'values': list(price_dist.values()),
-                    'colors': app.config['CHART_COLORS'][:len(price_dist)]
-                }
-                cache_manager.set_cached_data(cache_key, data, 600)  # 缓存10分钟
-            
+            data = load_price_distribution()
             return jsonify({
                 'success': True,
                 'data': data,
@@ -149,18 +199,7 @@ def create_app(config_name=None):
     def api_genre_distribution():
         """API: 游戏类型分布图表数据"""
         try:
-            cache_key = 'chart_genre_distribution'
-            data = cache_manager.get_cached_data(cache_key)
-            
-            if not data:
-                genre_dist = steam_query.get_genre_distribution()
-                data = {
-                    'labels': list(genre_dist.keys()),
-                    'values': list(genre_dist.values()),
-                    'colors': app.config['CHART_COLORS'][:len(genre_dist)]
-                }
-                cache_manager.set_cached_data(cache_key, data, 600)
-            
+            data = load_genre_distribution()
             return jsonify({
                 'success': True,
                 'data': data,
@@ -177,19 +216,7 @@ def create_app(config_name=None):
     def api_discount_analysis():
         """API: 折扣分析图表数据"""
         try:
-            cache_key = 'chart_discount_analysis'
-            data = cache_manager.get_cached_data(cache_key)
-            
-            if not data:
-                discount_data = steam_query.get_discount_analysis()
-                data = {
-                    'labels': list(discount_data.keys()),
-                    'values': [v['count'] for v in discount_data.values()],
-                    'avg_discounts': [v['avg_discount'] for v in discount_data.values()],
-                    'colors': app.config['CHART_COLORS'][:len(discount_data)]
-                }
-                cache_manager.set_cached_data(cache_key, data, 600)
-            
+            data = load_discount_analysis()
             return jsonify({
                 'success': True,
                 'data': data,
@@ -206,14 +233,8 @@ def create_app(config_name=None):
     def api_trending_data():
         """API: 趋势数据"""
         try:
-            days = int(request.args.get('days', 7))
-            cache_key = f'chart_trending_{days}'
-            data = cache_manager.get_cached_data(cache_key)
-            
-            if not data:
-                data = steam_query.get_trending_data(days)
-                cache_manager.set_cached_data(cache_key, data, 600)
-            
+            days = max(1, min(int(request.args.get('days', 7)), 90))  # 天数也是缓存键的一部分
+            data = load_trending(days)
             return jsonify({
                 'success': True,
                 'data': data,
@@ -230,16 +251,11 @@ def create_app(config_name=None):
     def api_latest_games():
         """API: 获取最新游戏数据"""
         try:
-            limit = min(int(request.args.get('limit', 20)), app.config['MAX_ITEMS_PER_PAGE'])
+            limit = request_limit(20)
             rank_type = request.args.get('rank_type', None)
-            
-            cache_key = f'latest_games_{limit}_{rank_type or "all"}'
-            games = cache_manager.get_cached_data(cache_key)
-            
-            if not games:
-                games = steam_query.get_latest_data(limit, rank_type)
-                cache_manager.set_cached_data(cache_key, games, 180)
-            
+            if rank_type is not None and rank_type not in app.config['RANK_TYPES']:
+                return jsonify({'success': False, 'error': f'不支持的榜单类型: {rank_type}'}), 400
+            games = load_latest_games(limit, rank_type)
             return jsonify({
                 'success': True,
                 'data': games,
@@ -255,14 +271,20 @@ def create_app(config_name=None):
     
     @app.route('/api/cache/clear')
     def api_clear_cache():
-        """API: 清除缓存"""
+        """API: 清除缓存（namespace参数使整个命名空间失效，否则按pattern删除）"""
         try:
-            pattern = request.args.get('pattern', 'chart_*')
-            cache_manager.delete_cache(pattern)
+            namespace = request.args.get('namespace')
+            if namespace:
+                cache_manager.invalidate_namespace(namespace)
+                message = f'缓存已失效 (namespace: {namespace})'
+            else:
+                pattern = request.args.get('pattern', 'charts:*')
+                deleted = cache_manager.delete_cache(pattern)
+                message = f'缓存已清除 (pattern: {pattern}, {deleted} 个键)'
             
             return jsonify({
                 'success': True,
-                'message': f'缓存已清除 (pattern: {pattern})',
+                'message': message,
                 'timestamp': datetime.now().isoformat()
             })
         except Exception as e:
@@ -23,16 +23,39 @@ class Config:
     MYSQL_PASSWORD = os.environ.get('MYSQL_PASSWORD', '')
     MYSQL_DATABASE = os.environ.get('MYSQL_DATABASE', 'gamemarket')
     
+    # MySQL连接池：每个工作进程最多 MYSQL_POOL_SIZE 个连接，用尽时最多等待 MYSQL_POOL_TIMEOUT 秒
+    MYSQL_POOL_SIZE = int(os.environ.get('MYSQL_POOL_SIZE', 10))
+    MYSQL_POOL_TIMEOUT = float(os.environ.get('MYSQL_POOL_TIMEOUT', 5))
+    MYSQL_POOL_PING_INTERVAL = float(os.environ.get('MYSQL_POOL_PING_INTERVAL', 30))  # 空闲超过该秒数的连接使用前先ping
+    MYSQL_RETRY_INTERVAL = float(os.environ.get('MYSQL_RETRY_INTERVAL', 30))  # MySQL不可用时的重试间隔
+    
     MONGODB_URI = os.environ.get('MONGODB_URI', 'mongodb://localhost:27017')
     MONGODB_DATABASE = os.environ.get('MONGODB_DATABASE', 'gamemarket')
+    MONGODB_MAX_POOL_SIZE = int(os.environ.get('MONGODB_MAX_POOL_SIZE', 50))
     
     # Redis配置
     REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379')
+    REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 50))
     
     # 缓存配置
     CACHE_TYPE = 'redis'
     CACHE_REDIS_URL = REDIS_URL
     CACHE_DEFAULT_TIMEOUT = 300  # 5分钟
+    CACHE_STALE_TTL = int(os.environ.get('CACHE_STALE_TTL', 600))  # 过期后继续返回旧数据并后台刷新的秒数
+    CACHE_LOCK_TIMEOUT = int(os.environ.get('CACHE_LOCK_TIMEOUT', 30))  # 缓存刷新锁的过期时间
+    CACHE_LOCK_WAIT = float(os.environ.get('CACHE_LOCK_WAIT', 5))  # 缓存缺失时等待其他请求计算结果的秒数
+    # 进程内本地缓存（Redis前的一级缓存），CACHE_LOCAL_MAX_ENTRIES=0 时停用
+    CACHE_LOCAL_MAX_ENTRIES = int(os.environ.get('CACHE_LOCAL_MAX_ENTRIES', 512))
+    CACHE_LOCAL_TTL = float(os.environ.get('CACHE_LOCAL_TTL', 10))  # 丢失失效通知时的最长不一致时间
+    CACHE_INVALIDATION_CHANNEL = os.environ.get('CACHE_INVALIDATION_CHANNEL', 'gamemarket:cache:invalidate')
+    # 缓存键前缀，清除缓存时只删除该前缀下的键（与爬虫的 WEB_CACHE_KEY_PREFIX 一致）
+    CACHE_KEY_PREFIX = os.environ.get('CACHE_KEY_PREFIX', 'gamemarket:cache')
+    # 缓存预热：订阅爬虫的快照就绪事件，预热后再切换缓存代数
+    CACHE_WARMER_ENABLED = os.environ.get('CACHE_WARMER_ENABLED', 'True').lower() == 'true'
+    SNAPSHOT_CHANNEL = os.environ.get('SNAPSHOT_CHANNEL', 'gamemarket:crawl:snapshot_ready')
+    CACHE_WARM_RANK_TYPES = os.environ.get('CACHE_WARM_RANK_TYPES', 'topsellers,popular').split(',')
+    # 支持的榜单类型，请求参数不在其中时使用默认值，避免任意参数生成大量缓存键
+    RANK_TYPES = ('topsellers', 'popular', 'newreleases')
     
     # 分页配置
     ITEMS_PER_PAGE = 20
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+看板缓存预热
+
+爬虫结束时发布 snapshot_ready 事件（见 scraper.utils.cache_invalidation）。
+收到事件后由获得锁的一个Web进程在后台线程中把注册的看板数据计算到受影响
+命名空间的下一代，全部写入后在一个事务中切换代数。切换前请求继续读取旧一代
+的缓存，切换后直接命中预热好的数据，抓取刚结束时看板不会出现查询高峰。
+
+预热在 compute_scope（如 SteamDataQuery.strict）中计算数据，查询失败时抛出异常
+而不是返回模拟数据；任一数据预热失败时不切换代数，改为直接使命名空间失效，
+由请求按需计算。未获得预热锁的进程保留命名空间，等锁释放后再预热一次。
+"""
+
+import json
+import time
+import threading
+from contextlib import nullcontext
+from loguru import logger
+
+
+class CacheWarmer:
+    """订阅快照就绪事件并预热缓存"""
+
+    def __init__(self, cache_manager, channel: str = 'gamemarket:crawl:snapshot_ready', lock_timeout: int = 300,
+                 compute_scope=nullcontext, retry_interval: float = 5):
+        self.cache_manager = cache_manager
+        self.channel = channel
+        self.lock_timeout = lock_timeout  # 预热锁的过期时间，应大于一次预热的耗时
+        self.compute_scope = compute_scope  # 计算数据时进入的上下文，查询失败时应抛出异常
+        self.retry_interval = retry_interval  # 预热锁被其他进程持有时的重试间隔（秒）
+        self.targets = []  # [(CacheManager.cached装饰的函数, 参数)]
+        self.stats = {'events': 0, 'runs': 0, 'entries_warmed': 0, 'errors': 0, 'fallbacks': 0}
+        self._pending = set()  # 等待预热的命名空间
+        self._lock = threading.Lock()
+        self._worker = None
+        self._listener = None
+
+    def register(self, loader, *args):
+        """注册需要预热的数据，loader为CacheManager.cached装饰的函数，args为调用参数"""
+        self.targets.append((loader, args))
+
+    def start(self) -> bool:
+        """在后台线程中订阅快照就绪事件"""
+        redis_client = self.cache_manager.redis_client
+        if not redis_client:
+            return False
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: self._handle_event})
+            self._listener = pubsub.run_in_thread(
+                sleep_time=1, daemon=True, exception_handler=self._handle_listener_error
+            )
+        except Exception as e:
+            logger.warning(f"订阅快照就绪事件失败，缓存不会预热: {e}")
+            return False
+        logger.info(f"缓存预热已启动，订阅 {self.channel}")
+        return True
+
+    def stop(self):
+        """停止订阅"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def notify(self, namespaces):
+        """登记需要预热的命名空间，没有预热线程在运行时启动一个"""
+        with self._lock:
+            self._pending.update(namespaces)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='cache-warmer', daemon=True)
+                self._worker.start()
+
+    def warm(self, namespaces) -> int:
+        """把注册数据计算到命名空间的下一代并切换，返回预热的条目数
+
+        任一数据计算失败时不切换代数，使命名空间失效（已预热的数据在新一代中可见，
+        其余按需计算），不会把模拟数据或旧数据换入缓存。
+        """
+        try:
+            generations = self.cache_manager.next_generations(namespaces)
+            warmed = 0
+            failed = 0
+            for loader, args in self.targets:
+                name, namespace = loader.cache_location(*args)
+                if namespace not in generations:
+                    continue
+                try:
+                    with self.compute_scope():
+                        self.cache_manager.warm(
+                            namespace, name, lambda: loader.uncached(*args),
+                            loader.ttl, generations[namespace], loader.stale_ttl,
+                        )
+                    warmed += 1
+                except Exception as e:
+                    failed += 1
+                    self.stats['errors'] += 1
+                    logger.error(f"预热缓存失败 {namespace}:{name}: {e}")
+
+            if failed:
+                self._fallback(generations)
+                return warmed
+            self.cache_manager.swap_generations(generations)
+            self.stats['runs'] += 1
+            self.stats['entries_warmed'] += warmed
+            logger.info(f"缓存预热完成: {warmed} 条, 命名空间 {', '.join(sorted(generations))}")
+            return warmed
+        finally:
+            # 预热在后台线程中运行，没有请求teardown，归还加载数据时借出的MySQL连接
+            self.cache_manager.db_manager.release_connections()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                namespaces, self._pending = self._pending, set()
+                if not namespaces:
+                    self._worker = None
+                    return
+            try:
+                with self.cache_manager.single_flight('cache-warmer', self.lock_timeout) as acquired:
+                    if acquired:
+                        self.warm(namespaces)
+            except Exception as e:
+                self.stats['errors'] += 1
+                logger.error(f"缓存预热失败: {e}")
+                self._fallback(namespaces)
+                continue
+            if not acquired:
+                # 其他进程正在预热，可能在本次数据写入之前就已开始；锁释放后再预热一次
+                with self._lock:
+                    self._pending.update(namespaces)
+                time.sleep(self.retry_interval)
+
+    def _fallback(self, namespaces):
+        """预热失败时直接使命名空间失效，不继续提供旧数据"""
+        self.stats['fallbacks'] += 1
+        if self.cache_manager.invalidate_namespace(*namespaces):
+            logger.warning(f"缓存预热未完成，已使命名空间失效: {', '.join(sorted(namespaces))}")
+
+    def _handle_event(self, message):
+        try:
+            payload = json.loads(message['data'])
+        except (TypeError, ValueError):
+            return
+        namespaces = payload.get('namespaces') or []
+        if not namespaces:
+            return
+        self.stats['events'] += 1
+        logger.info(f"收到快照就绪事件: {payload.get('spider')}")
+        self.notify(namespaces)
+
+    def _handle_listener_error(self, error, pubsub, thread):
+        # 下次循环时pubsub自动重连并重新订阅
+        logger.warning(f"快照就绪事件连接异常: {error}")
+        time.sleep(1)
@@ -5,86 +5,278 @@
 
 import json
 import os
+import time
+import uuid
+import fnmatch
+import functools
+import threading
 import redis
 import pymongo
 import pymysql
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from loguru import logger
 from typing import Dict, List, Any, Optional
 
 
+class PoolExhaustedError(Exception):
+    """连接池在超时时间内没有可用连接"""
+
+
+class DataUnavailableError(Exception):
+    """数据库不可用或查询失败（strict作用域内代替模拟数据抛出）"""
+
+
+class MySQLConnectionPool:
+    """MySQL连接池
+    
+    - 空闲连接后进先出复用，最近用过的连接最可能仍然有效
+    - 空闲超过 ping_interval 秒的连接取出时先ping，失效的连接丢弃重建
+    - 连接总数不超过 max_size，用尽时等待 timeout 秒后抛出PoolExhaustedError
+    - 使用threading.Condition，gevent猴子补丁后同样适用于协程
+    """
+    
+    def __init__(self, max_size: int = 10, timeout: float = 5, ping_interval: float = 30,
+                 creator=pymysql.connect, **connect_kwargs):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.creator = creator
+        self.connect_kwargs = connect_kwargs
+        self._idle = []  # [(连接, 归还时间)]
+        self._size = 0  # 已创建且未关闭的连接数（空闲+借出）
+        self._cond = threading.Condition()
+        self._closed = False
+    
+    def acquire(self):
+        """借出一个连接"""
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError('连接池已关闭')
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = released_at = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhaustedError(f'MySQL连接池已满 ({self.max_size})')
+                self._cond.wait(remaining)
+        
+        # 建立连接和ping在锁外进行，不阻塞其他线程
+        if conn is None:
+            return self._create()
+        if time.monotonic() - released_at > self.ping_interval and not self._ping(conn):
+            self._close(conn)
+            return self._create()
+        return conn
+    
+    def release(self, conn):
+        """归还连接，已断开的连接直接丢弃"""
+        if not conn.open or self._closed:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+    
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+    
+    def close(self):
+        """关闭所有空闲连接，借出的连接归还时关闭"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._discard(conn)
+    
+    @property
+    def size(self) -> int:
+        return self._size
+    
+    @property
+    def idle_count(self) -> int:
+        return len(self._idle)
+    
+    def _create(self):
+        try:
+            return self.creator(**self.connect_kwargs)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+    
+    def _discard(self, conn):
+        self._close(conn)
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+    
+    @staticmethod
+    def _ping(conn) -> bool:
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+    
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass  # 连接已断开
+
+
 class DatabaseManager:
-    """数据库管理器"""
+    """数据库管理器
+    
+    连接在进程内长期复用：MySQL使用连接池，查询在 mysql_connection() 作用域内
+    借出连接，退出作用域时归还，请求线程和后台线程（缓存刷新、预热）都不会占用
+    连接不还；作用域嵌套时复用同一个连接。请求结束时的 release_connections()
+    只是兜底。MongoDB和Redis客户端自带连接池，整个进程共用一个客户端。
+    """
     
     def __init__(self, config):
         self.config = config
-        self.mysql_conn = None
+        self.mysql_pool = None
         self.mongodb_client = None
+        self.mongodb_db = None
         self.redis_client = None
+        self._local = threading.local()
+        self._mysql_lock = threading.Lock()
+        self._mysql_retry_at = 0.0  # MySQL不可用时，在该时间之前不再尝试连接
         self._init_connections()
     
+    def _get_config(self, name, default):
+        """读取配置，兼容Flask配置字典、配置类和环境变量"""
+        if isinstance(self.config, dict):
+            value = self.config.get(name)
+        else:
+            value = getattr(self.config, name, None)
+        if value is None or value == '':
+            value = os.getenv(name, default)
+        return type(default)(value) if default is not None else value
+    
     def _init_connections(self):
-        """初始化数据库连接"""
-        try:
-            # 从环境变量获取配置，如果config对象没有属性则使用环境变量
-            mysql_host = getattr(self.config, 'MYSQL_HOST', None) or os.getenv('MYSQL_HOST', 'localhost')
-            mysql_port = getattr(self.config, 'MYSQL_PORT', None) or int(os.getenv('MYSQL_PORT', 3306))
-            mysql_user = getattr(self.config, 'MYSQL_USER', None) or os.getenv('MYSQL_USER', 'root')
-            mysql_password = getattr(self.config, 'MYSQL_PASSWORD', None) or os.getenv('MYSQL_PASSWORD', '')
-            mysql_database = getattr(self.config, 'MYSQL_DATABASE', None) or os.getenv('MYSQL_DATABASE', 'gamemarket')
-            
-            # MySQL连接
-            self.mysql_conn = pymysql.connect(
-                host=mysql_host,
-                port=mysql_port,
-                user=mysql_user,
-                password=mysql_password,
-                database=mysql_database,
-                charset='utf8mb4',
-                cursorclass=pymysql.cursors.DictCursor
-            )
-            logger.info("MySQL连接成功")
-        except Exception as e:
-            logger.warning(f"MySQL连接失败: {e}")
-            self.mysql_conn = None
+        """初始化数据库连接池"""
+        self.mysql_pool = MySQLConnectionPool(
+            max_size=self._get_config('MYSQL_POOL_SIZE', 10),
+            timeout=self._get_config('MYSQL_POOL_TIMEOUT', 5.0),
+            ping_interval=self._get_config('MYSQL_POOL_PING_INTERVAL', 30.0),
+            host=self._get_config('MYSQL_HOST', 'localhost'),
+            port=self._get_config('MYSQL_PORT', 3306),
+            user=self._get_config('MYSQL_USER', 'root'),
+            password=self._get_config('MYSQL_PASSWORD', ''),
+            database=self._get_config('MYSQL_DATABASE', 'gamemarket'),
+            charset='utf8mb4',
+            cursorclass=pymysql.cursors.DictCursor,
+            autocommit=True,  # 只读查询，归还连接时没有未结束的事务
+            connect_timeout=self._get_config('MYSQL_CONNECT_TIMEOUT', 5),
+        )
         
         try:
-            # MongoDB连接
-            mongodb_uri = getattr(self.config, 'MONGODB_URI', None) or os.getenv('MONGODB_URI', 'mongodb://localhost:27017')
-            mongodb_database = getattr(self.config, 'MONGODB_DATABASE', None) or os.getenv('MONGODB_DATABASE', 'gamemarket')
+            # MongoDB连接（客户端自带连接池并在后台监控服务器状态）
+            mongodb_uri = self._get_config('MONGODB_URI', 'mongodb://localhost:27017')
+            mongodb_database = self._get_config('MONGODB_DATABASE', 'gamemarket')
             
-            self.mongodb_client = pymongo.MongoClient(mongodb_uri)
+            self.mongodb_client = pymongo.MongoClient(
+                mongodb_uri,
+                maxPoolSize=self._get_config('MONGODB_MAX_POOL_SIZE', 50),
+                serverSelectionTimeoutMS=self._get_config('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 3000),
+                connect=False,  # 第一次查询时连接，gunicorn预加载后fork也安全
+            )
             self.mongodb_db = self.mongodb_client[mongodb_database]
-            logger.info("MongoDB连接成功")
+            logger.info("MongoDB客户端已创建")
         except Exception as e:
             logger.warning(f"MongoDB连接失败: {e}")
             self.mongodb_client = None
         
         try:
-            # Redis连接
-            redis_url = getattr(self.config, 'REDIS_URL', None) or os.getenv('REDIS_URL', 'redis://localhost:6379')
-            
-            self.redis_client = redis.from_url(redis_url)
+            # Redis连接池
+            redis_url = self._get_config('REDIS_URL', 'redis://localhost:6379')
+            pool = redis.ConnectionPool.from_url(
+                redis_url,
+                max_connections=self._get_config('REDIS_MAX_CONNECTIONS', 50),
+                health_check_interval=self._get_config('REDIS_HEALTH_CHECK_INTERVAL', 30),
+                socket_connect_timeout=3,
+                socket_timeout=3,
+            )
+            self.redis_client = redis.Redis(connection_pool=pool)
             self.redis_client.ping()
             logger.info("Redis连接成功")
         except Exception as e:
             logger.warning(f"Redis连接失败: {e}")
             self.redis_client = None
     
+    @contextmanager
+    def mysql_connection(self):
+        """借出MySQL连接的作用域，退出时归还；MySQL不可用时得到None"""
+        if getattr(self._local, 'mysql_conn', None) is not None:
+            # 外层作用域（或get_mysql_connection）已借出连接，由外层归还
+            yield self._local.mysql_conn
+            return
+        conn = self.get_mysql_connection()
+        try:
+            yield conn
+        finally:
+            if conn is not None:
+                self.release_connections()
+    
+    def release_connections(self):
+        """归还当前线程借出的连接（请求结束时兜底调用）"""
+        conn = getattr(self._local, 'mysql_conn', None)
+        if conn is not None:
+            self._local.mysql_conn = None
+            self.mysql_pool.release(conn)
+    
     def close_connections(self):
-        """关闭数据库连接"""
-        if self.mysql_conn:
-            self.mysql_conn.close()
+        """关闭所有连接池（进程退出时调用）"""
+        self.release_connections()
+        if self.mysql_pool:
+            self.mysql_pool.close()
         if self.mongodb_client:
             self.mongodb_client.close()
         if self.redis_client:
-            self.redis_client.close()
+            self.redis_client.connection_pool.disconnect()
     
     def get_mysql_connection(self):
-        """获取MySQL连接"""
-        if not self.mysql_conn or not self.mysql_conn.open:
-            self._init_connections()
-        return self.mysql_conn
+        """获取当前线程的MySQL连接，首次调用时从连接池借出；MySQL不可用时返回None
+        
+        借出的连接需要由 release_connections() 归还，一般使用 mysql_connection() 作用域。
+        """
+        conn = getattr(self._local, 'mysql_conn', None)
+        if conn is not None:
+            return conn
+        if time.monotonic() < self._mysql_retry_at:
+            return None
+        
+        try:
+            conn = self.mysql_pool.acquire()
+        except PoolExhaustedError as e:
+            logger.warning(str(e))
+            return None
+        except Exception as e:
+            logger.warning(f"MySQL连接失败: {e}")
+            with self._mysql_lock:
+                # 短时间内不再重试，避免每个请求都等待连接超时
+                self._mysql_retry_at = time.monotonic() + self._get_config('MYSQL_RETRY_INTERVAL', 30)
+            return None
+        self._local.mysql_conn = conn
+        return conn
     
     def get_mongodb_collection(self, collection_name):
         """获取MongoDB集合"""
@@ -98,148 +290,169 @@ class DatabaseManager:
 
 
 class SteamDataQuery:
-    """Steam数据查询类"""
+    """Steam数据查询类
+    
+    数据库不可用或查询失败时返回模拟数据，页面仍可显示；缓存预热在 strict()
+    作用域内查询，失败时抛出异常，模拟数据不会被预热进缓存。
+    """
     
     def __init__(self, db_manager: DatabaseManager):
         self.db_manager = db_manager
+        self._local = threading.local()
+    
+    @contextmanager
+    def strict(self):
+        """作用域内（当前线程）查询失败时抛出DataUnavailableError，不返回模拟数据"""
+        previous = getattr(self._local, 'strict', False)
+        self._local.strict = True
+        try:
+            yield
+        finally:
+            self._local.strict = previous
+    
+    def _mock(self, factory, *args):
+        """查询失败时的模拟数据"""
+        if getattr(self._local, 'strict', False):
+            raise DataUnavailableError('数据库不可用，未返回模拟数据')
+        return factory(*args)
     
     def get_statistics_summary(self) -> Dict[str, Any]:
         """获取统计摘要"""
         try:
-            mysql_conn = self.db_manager.get_mysql_connection()
-            if not mysql_conn:
-                return self._get_mock_summary()
-            
-            with mysql_conn.cursor() as cursor:
-                # 获取基础统计
-                cursor.execute("""
-                    SELECT 
-                        COUNT(*) as total_games,
-                        COUNT(CASE WHEN price > 0 THEN 1 END) as paid_games,
-                        COUNT(CASE WHEN price = 0 THEN 1 END) as free_games,
-                        AVG(price) as avg_price,
-                        AVG(discount_percent) as avg_discount
-                    FROM steam_games 
-                    WHERE price IS NOT NULL
-                """)
-                stats = cursor.fetchone()
+            with self.db_manager.mysql_connection() as mysql_conn:
+                if not mysql_conn:
+                    return self._mock(self._get_mock_summary)
                 
-                # 获取最新更新时间
-                cursor.execute("""
-                    SELECT MAX(updated_at) as last_update 
-                    FROM steam_games
-                """)
-                last_update = cursor.fetchone()
-                
-                return {
-                    'total_games': stats['total_games'] or 0,
-                    'paid_games': stats['paid_games'] or 0,
-                    'free_games': stats['free_games'] or 0,
-                    'avg_price': float(stats['avg_price'] or 0),
-                    'avg_discount': float(stats['avg_discount'] or 0),
-                    'last_update': last_update['last_update'].isoformat() if last_update['last_update'] else None
-                }
+                with mysql_conn.cursor() as cursor:
+                    # 获取基础统计
+                    cursor.execute("""
+                        SELECT 
+                            COUNT(*) as total_games,
+                            COUNT(CASE WHEN price > 0 THEN 1 END) as paid_games,
+                            COUNT(CASE WHEN price = 0 THEN 1 END) as free_games,
+                            AVG(price) as avg_price,
+                            AVG(discount_percent) as avg_discount
+                        FROM steam_games 
+                        WHERE price IS NOT NULL
+                    """)
+                    stats = cursor.fetchone()
+                    
+                    # 获取最新更新时间
+                    cursor.execute("""
+                        SELECT MAX(updated_at) as last_update 
+                        FROM steam_games
+                    """)
+                    last_update = cursor.fetchone()
+                    
+                    return {
+                        'total_games': stats['total_games'] or 0,
+                        'paid_games': stats['paid_games'] or 0,
+                        'free_games': stats['free_games'] or 0,
+                        'avg_price': float(stats['avg_price'] or 0),
+                        'avg_discount': float(stats['avg_discount'] or 0),
+                        'last_update': last_update['last_update'].isoformat() if last_update['last_update'] else None
+                    }
         except Exception as e:
             logger.error(f"获取统计摘要失败: {e}")
-            return self._get_mock_summary()
+            return self._mock(self._get_mock_summary)
     
     def get_top_games_by_rank(self, rank_type: str, limit: int = 50) -> List[Dict[str, Any]]:
         """获取排行榜游戏"""
         try:
-            mysql_conn = self.db_manager.get_mysql_connection()
-            if not mysql_conn:
-                return self._get_mock_games(limit)
-            
-            with mysql_conn.cursor() as cursor:
-                if rank_type == 'topsellers':
-                    query = """
-                        SELECT app_id, name, price, discount_percent, 
-                               positive_ratio, user_reviews, release_date
-                        FROM steam_games 
-                        WHERE price > 0 
-                        ORDER BY user_reviews DESC 
-                        LIMIT %s
-                    """
-                elif rank_type == 'newreleases':
-                    query = """
-                        SELECT app_id, name, price, discount_percent, 
-                               positive_ratio, user_reviews, release_date
-                        FROM steam_games 
-                        WHERE release_date >= DATE_SUB(NOW(), INTERVAL 30 DAY)
-                        ORDER BY release_date DESC 
-                        LIMIT %s
-                    """
-                else:  # 默认按价格排序
-                    query = """
-                        SELECT app_id, name, price, discount_percent, 
-                               positive_ratio, user_reviews, release_date
-                        FROM steam_games 
-                        WHERE price > 0 
-                        ORDER BY price DESC 
-                        LIMIT %s
-                    """
-                
-                cursor.execute(query, (limit,))
-                games = cursor.fetchall()
-                
-                # 转换数据类型
-                for game in games:
-                    game['price'] = float(game['price'] or 0)
-                    game['discount_percent'] = float(game['discount_percent'] or 0)
-                    game['positive_ratio'] = float(game['positive_ratio'] or 0)
-                    game['user_reviews'] = int(game['user_reviews'] or 0)
-                    if game['release_date']:
-                        game['release_date'] = game['release_date'].isoformat()
+            with self.db_manager.mysql_connection() as mysql_conn:
+                if not mysql_conn:
+                    return self._mock(self._get_mock_games, limit)
                 
-                return games
+                with mysql_conn.cursor() as cursor:
+                    if rank_type == 'topsellers':
+                        query = """
+                            SELECT app_id, name, price, discount_percent, 
+                                   positive_ratio, user_reviews, release_date
+                            FROM steam_games 
+                            WHERE price > 0 
+                            ORDER BY user_reviews DESC 
+                            LIMIT %s
+                        """
+                    elif rank_type == 'newreleases':
+                        query = """
+                            SELECT app_id, name, price, discount_percent, 
+                                   positive_ratio, user_reviews, release_date
+                            FROM steam_games 
+                            WHERE release_date >= DATE_SUB(NOW(), INTERVAL 30 DAY)
+                            ORDER BY release_date DESC 
+                            LIMIT %s
+                        """
+                    else:  # 默认按价格排序
+                        query = """
+                            SELECT app_id, name, price, discount_percent, 
+                                   positive_ratio, user_reviews, release_date
+                            FROM steam_games 
+                            WHERE price > 0 
+                            ORDER BY price DESC 
+                            LIMIT %s
+                        """
+                    
+                    cursor.execute(query, (limit,))
+                    games = cursor.fetchall()
+                    
+                    # 转换数据类型
+                    for game in games:
+                        game['price'] = float(game['price'] or 0)
+                        game['discount_percent'] = float(game['discount_percent'] or 0)
+                        game['positive_ratio'] = float(game['positive_ratio'] or 0)
+                        game['user_reviews'] = int(game['user_reviews'] or 0)
+                        if game['release_date']:
+                            game['release_date'] = game['release_date'].isoformat()
+                    
+                    return games
         except Exception as e:
             logger.error(f"获取排行榜失败: {e}")
-            return self._get_mock_games(limit)
+            return self._mock(self._get_mock_games, limit)
     
     def get_price_distribution(self) -> Dict[str, int]:
         """获取价格分布"""
         try:
-            mysql_conn = self.db_manager.get_mysql_connection()
-            if not mysql_conn:
-                return self._get_mock_price_distribution()
-            
-            with mysql_conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT 
-                        CASE 
-                            WHEN price = 0 THEN '免费'
-                            WHEN price <= 10 THEN '0-10元'
-                            WHEN price <= 50 THEN '10-50元'
-                            WHEN price <= 100 THEN '50-100元'
-                            WHEN price <= 200 THEN '100-200元'
-                            ELSE '200元以上'
-                        END as price_range,
-                        COUNT(*) as count
-                    FROM steam_games 
-                    WHERE price IS NOT NULL
-                    GROUP BY price_range
-                    ORDER BY 
-                        CASE price_range
-                            WHEN '免费' THEN 1
-                            WHEN '0-10元' THEN 2
-                            WHEN '10-50元' THEN 3
-                            WHEN '50-100元' THEN 4
-                            WHEN '100-200元' THEN 5
-                            ELSE 6
-                        END
-                """)
-                results = cursor.fetchall()
-                return {row['price_range']: row['count'] for row in results}
+            with self.db_manager.mysql_connection() as mysql_conn:
+                if not mysql_conn:
+                    return self._mock(self._get_mock_price_distribution)
+                
+                with mysql_conn.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT 
+                            CASE 
+                                WHEN price = 0 THEN '免费'
+                                WHEN price <= 10 THEN '0-10元'
+                                WHEN price <= 50 THEN '10-50元'
+                                WHEN price <= 100 THEN '50-100元'
+                                WHEN price <= 200 THEN '100-200元'
+                                ELSE '200元以上'
+                            END as price_range,
+                            COUNT(*) as count
+                        FROM steam_games 
+                        WHERE price IS NOT NULL
+                        GROUP BY price_range
+                        ORDER BY 
+                            CASE price_range
+                                WHEN '免费' THEN 1
+                                WHEN '0-10元' THEN 2
+                                WHEN '10-50元' THEN 3
+                                WHEN '50-100元' THEN 4
+                                WHEN '100-200元' THEN 5
+                                ELSE 6
+                            END
+                    """)
+                    results = cursor.fetchall()
+                    return {row['price_range']: row['count'] for row in results}
         except Exception as e:
             logger.error(f"获取价格分布失败: {e}")
-            return self._get_mock_price_distribution()
+            return self._mock(self._get_mock_price_distribution)
     
     def get_genre_distribution(self) -> Dict[str, int]:
         """获取游戏类型分布"""
         try:
             # 尝试从MongoDB获取
             collection = self.db_manager.get_mongodb_collection('steam_games')
-            if collection:
+            if collection is not None:  # pymongo的集合对象不支持真值判断
                 pipeline = [
                     {"$unwind": "$genres"},
                     {"$group": {"_id": "$genres", "count": {"$sum": 1}}},
@@ -249,103 +462,134 @@ class SteamDataQuery:
                 results = list(collection.aggregate(pipeline))
                 return {item['_id']: item['count'] for item in results}
             else:
-                return self._get_mock_genre_distribution()
+                return self._mock(self._get_mock_genre_distribution)
         except Exception as e:
             logger.error(f"获取游戏类型分布失败: {e}")
-            return self._get_mock_genre_distribution()
+            return self._mock(self._get_mock_genre_distribution)
     
     def get_discount_analysis(self) -> Dict[str, Dict[str, Any]]:
         """获取折扣分析"""
         try:
-            mysql_conn = self.db_manager.get_mysql_connection()
-            if not mysql_conn:
-                return self._get_mock_discount_analysis()
-            
-            with mysql_conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT 
-                        CASE 
-                            WHEN discount_percent = 0 THEN '无折扣'
-                            WHEN discount_percent <= 25 THEN '1-25%'
-                            WHEN discount_percent <= 50 THEN '26-50%'
-                            WHEN discount_percent <= 75 THEN '51-75%'
-                            ELSE '76-100%'
-                        END as discount_range,
-                        COUNT(*) as count,
-                        AVG(discount_percent) as avg_discount
-                    FROM steam_games 
-                    WHERE discount_percent IS NOT NULL
-                    GROUP BY discount_range
-                    ORDER BY 
-                        CASE discount_range
-                            WHEN '无折扣' THEN 1
-                            WHEN '1-25%' THEN 2
-                            WHEN '26-50%' THEN 3
-                            WHEN '51-75%' THEN 4
-                            ELSE 5
-                        END
-                """)
-                results = cursor.fetchall()
-                return {
-                    row['discount_range']: {
-                        'count': row['count'],
-                        'avg_discount': float(row['avg_discount'] or 0)
+            with self.db_manager.mysql_connection() as mysql_conn:
+                if not mysql_conn:
+                    return self._mock(self._get_mock_discount_analysis)
+                
+                with mysql_conn.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT 
+                            CASE 
+                                WHEN discount_percent = 0 THEN '无折扣'
+                                WHEN discount_percent <= 25 THEN '1-25%'
+                                WHEN discount_percent <= 50 THEN '26-50%'
+                                WHEN discount_percent <= 75 THEN '51-75%'
+                                ELSE '76-100%'
+                            END as discount_range,
+                            COUNT(*) as count,
+                            AVG(discount_percent) as avg_discount
+                        FROM steam_games 
+                        WHERE discount_percent IS NOT NULL
+                        GROUP BY discount_range
+                        ORDER BY 
+                            CASE discount_range
+                                WHEN '无折扣' THEN 1
+                                WHEN '1-25%' THEN 2
+                                WHEN '26-50%' THEN 3
+                                WHEN '51-75%' THEN 4
+                                ELSE 5
+                            END
+                    """)
+                    results = cursor.fetchall()
+                    return {
+                        row['discount_range']: {
+                            'count': row['count'],
+                            'avg_discount': float(row['avg_discount'] or 0)
+                        }
+                        for row in results
                     }
-                    for row in results
-                }
         except Exception as e:
             logger.error(f"获取折扣分析失败: {e}")
-            return self._get_mock_discount_analysis()
+            return self._mock(self._get_mock_discount_analysis)
     
     def get_available_tables(self) -> List[str]:
         """获取可用的数据表"""
         try:
-            mysql_conn = self.db_manager.get_mysql_connection()
-            if not mysql_conn:
-                return ['steam_games', 'steam_reviews', 'steam_tags']
-            
-            with mysql_conn.cursor() as cursor:
-                cursor.execute("SHOW TABLES")
-                tables = [row[f'Tables_in_{self.db_manager.config.MYSQL_DATABASE}'] 
-                         for row in cursor.fetchall()]
-                return tables
+            with self.db_manager.mysql_connection() as mysql_conn:
+                if not mysql_conn:
+                    return ['steam_games', 'steam_reviews', 'steam_tags']
+                
+                with mysql_conn.cursor() as cursor:
+                    cursor.execute("SHOW TABLES")
+                    tables = [list(row.values())[0] for row in cursor.fetchall()]
+                    return tables
         except Exception as e:
             logger.error(f"获取数据表失败: {e}")
             return ['steam_games', 'steam_reviews', 'steam_tags']
     
-    def get_latest_data(self, limit: int = 10) -> List[Dict[str, Any]]:
-        """获取最新数据"""
+    def get_latest_data(self, limit: int = 10, rank_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """获取最新数据，可按榜单类型过滤"""
         try:
-            mysql_conn = self.db_manager.get_mysql_connection()
-            if not mysql_conn:
-                return self._get_mock_games(limit)
-            
-            with mysql_conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT app_id, name, price, discount_percent, 
-                           positive_ratio, user_reviews, release_date, updated_at
-                    FROM steam_games 
-                    WHERE updated_at IS NOT NULL
-                    ORDER BY updated_at DESC 
-                    LIMIT %s
-                """, (limit,))
-                games = cursor.fetchall()
-                
-                # 转换数据类型
-                for game in games:
-                    game['price'] = float(game['price'] or 0)
-                    game['discount_percent'] = float(game['discount_percent'] or 0)
-                    game['positive_ratio'] = float(game['positive_ratio'] or 0)
-                    game['user_reviews'] = int(game['user_reviews'] or 0)
-                    if game['release_date']:
-                        game['release_date'] = game['release_date'].isoformat()
-                    if game['updated_at']:
-                        game['updated_at'] = game['updated_at'].isoformat()
+            with self.db_manager.mysql_connection() as mysql_conn:
+                if not mysql_conn:
+                    return self._mock(self._get_mock_games, limit)
                 
-                return games
+                with mysql_conn.cursor() as cursor:
+                    rank_filter = "AND rank_type = %s" if rank_type else ""
+                    params = (rank_type, limit) if rank_type else (limit,)
+                    cursor.execute(f"""
+                        SELECT app_id, name, price, discount_percent, 
+                               positive_ratio, user_reviews, release_date, updated_at
+                        FROM steam_games 
+                        WHERE updated_at IS NOT NULL {rank_filter}
+                        ORDER BY updated_at DESC 
+                        LIMIT %s
+                    """, params)
+                    games = cursor.fetchall()
+                    
+                    # 转换数据类型
+                    for game in games:
+                        game['price'] = float(game['price'] or 0)
+                        game['discount_percent'] = float(game['discount_percent'] or 0)
+                        game['positive_ratio'] = float(game['positive_ratio'] or 0)
+                        game['user_reviews'] = int(game['user_reviews'] or 0)
+                        if game['release_date']:
+                            game['release_date'] = game['release_date'].isoformat()
+                        if game['updated_at']:
+                            game['updated_at'] = game['updated_at'].isoformat()
+                    
+                    return games
         except Exception as e:
             logger.error(f"获取最新数据失败: {e}")
-            return self._get_mock_games(limit)
+            return self._mock(self._get_mock_games, limit)
+    
+    def get_trending_data(self, days: int = 7) -> Dict[str, List[Any]]:
+        """获取最近几天每天更新的游戏数、平均价格和平均折扣"""
+        try:
+            with self.db_manager.mysql_connection() as mysql_conn:
+                if not mysql_conn:
+                    return self._mock(self._get_mock_trending_data, days)
+                
+                with mysql_conn.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT 
+                            DATE(updated_at) as day,
+                            COUNT(*) as count,
+                            AVG(price) as avg_price,
+                            AVG(discount_percent) as avg_discount
+                        FROM steam_games 
+                        WHERE updated_at >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
+                        GROUP BY day
+                        ORDER BY day
+                    """, (days,))
+                    results = cursor.fetchall()
+                    return {
+                        'labels': [row['day'].isoformat() for row in results],
+                        'values': [row['count'] for row in results],
+                        'avg_prices': [float(row['avg_price'] or 0) for row in results],
+                        'avg_discounts': [float(row['avg_discount'] or 0) for row in results]
+                    }
+        except Exception as e:
+            logger.error(f"获取趋势数据失败: {e}")
+            return self._mock(self._get_mock_trending_data, days)
     
     def _get_mock_summary(self) -> Dict[str, Any]:
         """获取模拟统计摘要"""
@@ -373,6 +617,17 @@ class SteamDataQuery:
             })
         return games
     
+    def _get_mock_trending_data(self, days: int) -> Dict[str, List[Any]]:
+        """获取模拟趋势数据"""
+        today = datetime.now().date()
+        dates = [today - timedelta(days=i) for i in range(days - 1, -1, -1)]
+        return {
+            'labels': [day.isoformat() for day in dates],
+            'values': [1000 + i * 50 for i in range(days)],
+            'avg_prices': [25.5 + i * 0.5 for i in range(days)],
+            'avg_discounts': [15.0 + i for i in range(days)]
+        }
+    
     def _get_mock_price_distribution(self) -> Dict[str, int]:
         """获取模拟价格分布"""
         return {
@@ -410,22 +665,341 @@ class SteamDataQuery:
         }
 
 
+# 仅当锁仍属于自己时才删除，避免释放其他进程在锁超时后获得的锁
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LocalCache:
+    """进程内LRU缓存，条目数有上限并在 ttl 秒后过期
+    
+    保存的是反序列化后的对象，所有请求共享同一对象，调用方不应修改返回值。
+    """
+    
+    def __init__(self, max_entries: int = 512, ttl: float = 10):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (过期时间, 值)
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+    
+    def get(self, key: str, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.stats['misses'] += 1
+                return default
+            self._data.move_to_end(key)
+            self.stats['hits'] += 1
+            return item[1]
+    
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else min(ttl, self.ttl))
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.stats['evictions'] += 1
+    
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def delete_matching(self, pattern: str):
+        """删除匹配通配符（与Redis的glob语法一致）的键"""
+        with self._lock:
+            for key in [key for key in self._data if fnmatch.fnmatchcase(key, pattern)]:
+                del self._data[key]
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self):
+        return len(self._data)
+
+
 class CacheManager:
-    """缓存管理器"""
+    """缓存管理器
     
-    def __init__(self, db_manager: DatabaseManager):
+    两级缓存：进程内LocalCache在前，Redis在后。热点数据在本进程内命中时
+    不访问Redis也不反序列化；任一进程写入或删除缓存时通过Redis发布订阅
+    通知其他进程丢弃本地副本，本地TTL限制丢失通知时的最长不一致时间。
+    
+    get_or_compute() / cached() 是防击穿的读穿缓存：
+    - ttl 秒内直接返回缓存
+    - 过期后的 stale_ttl 秒内仍返回旧数据，同时由获得Redis锁的一个线程在后台刷新
+    - 缓存缺失时只有获得锁的请求执行查询，其他请求等待其结果
+    
+    所有键都存放在 key_prefix 下，清除缓存不会影响同一Redis中的爬虫队列等数据。
+    指定命名空间时键为 '<namespace>:v<代数>:<name>'，invalidate_namespace() 递增
+    代数即可让整个命名空间失效（旧键按TTL自然过期）；爬虫结束时
+    scraper.utils.cache_invalidation 以同样的方式使受影响的命名空间失效。
+    """
+    
+    def __init__(self, db_manager: DatabaseManager, stale_ttl: int = 600,
+                 lock_timeout: int = 30, lock_wait: float = 5,
+                 local_max_entries: int = 512, local_ttl: float = 10,
+                 invalidation_channel: str = 'gamemarket:cache:invalidate',
+                 key_prefix: str = 'gamemarket:cache', scan_count: int = 500):
         self.db_manager = db_manager
         self.redis_client = db_manager.get_redis_client()
+        self.key_prefix = key_prefix
+        self.scan_count = scan_count  # SCAN每次遍历、UNLINK每批删除的键数
+        self.stale_ttl = stale_ttl
+        self.lock_timeout = lock_timeout  # 锁的过期时间，应大于最慢的查询
+        self.lock_wait = lock_wait  # 缓存缺失且锁被占用时等待结果的最长时间
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'computes': 0, 'refresh_errors': 0}
+        
+        self.local = LocalCache(local_max_entries, local_ttl) if local_max_entries > 0 else None
+        self.invalidation_channel = invalidation_channel
+        self.instance_id = uuid.uuid4().hex  # 忽略自己发出的失效通知
+        self._listener = None
+        if self.local is not None and self.redis_client:
+            self._start_listener()
+    
+    def get_or_compute(self, key: str, compute, ttl: int = 300, stale_ttl: Optional[int] = None,
+                       namespace: Optional[str] = None) -> Any:
+        """读取缓存，缺失或过期时调用 compute() 重新计算"""
+        if not self.redis_client:
+            return compute()
+        if stale_ttl is None:
+            stale_ttl = self.stale_ttl
+        if namespace:
+            key = self.make_key(namespace, key)
+        
+        entry = self._get_entry(key)
+        if entry is not None:
+            if time.time() < entry['fresh_until']:
+                self.stats['hits'] += 1
+                return entry['data']
+            # 返回旧数据，只有一个线程在后台刷新
+            self.stats['stale_hits'] += 1
+            token = self._acquire_lock(key)
+            if token:
+                threading.Thread(
+                    target=self._refresh, args=(key, compute, ttl, stale_ttl, token), daemon=True
+                ).start()
+            return entry['data']
+        
+        self.stats['misses'] += 1
+        token = self._acquire_lock(key)
+        if token:
+            try:
+                return self._compute_and_store(key, compute, ttl, stale_ttl)
+            finally:
+                self._release_lock(key, token)
+        
+        # 其他请求正在计算，等待其写入结果
+        deadline = time.monotonic() + self.lock_wait
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = self._get_entry(key)
+            if entry is not None:
+                return entry['data']
+        logger.warning(f"等待缓存超时，直接查询: {key}")
+        return self._compute_and_store(key, compute, ttl, stale_ttl)
+    
+    def cached(self, key: str, ttl: int = 300, stale_ttl: Optional[int] = None,
+               namespace: Optional[str] = None):
+        """get_or_compute的装饰器形式
+        
+        key 和 namespace 为格式字符串，用函数参数填充，如 namespace='rankings:{0}', key='top_{1}'
+        """
+        def decorator(func):
+            def cache_location(*args, **kwargs):
+                """返回 (键名, 命名空间)"""
+                return key.format(*args, **kwargs), namespace.format(*args, **kwargs) if namespace else None
+            
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                cache_key, cache_namespace = cache_location(*args, **kwargs)
+                return self.get_or_compute(
+                    cache_key, lambda: func(*args, **kwargs), ttl, stale_ttl, cache_namespace
+                )
+            
+            # 供CacheWarmer预热使用
+            wrapper.uncached = func
+            wrapper.cache_location = cache_location
+            wrapper.ttl = ttl
+            wrapper.stale_ttl = stale_ttl
+            return wrapper
+        return decorator
+    
+    def make_key(self, namespace: str, name: str) -> str:
+        """命名空间当前代数下的缓存键"""
+        return f'{namespace}:v{self.get_generation(namespace)}:{name}'
+    
+    def get_generation(self, namespace: str) -> int:
+        """读取命名空间的代数（本地缓存，代数变化时由失效通知清除）"""
+        gen_key = f'{namespace}:gen'
+        if self.local is not None:
+            generation = self.local.get(gen_key)
+            if generation is not None:
+                return generation
+        if not self.redis_client:
+            return 0
+        try:
+            generation = int(self.redis_client.get(self._redis_key(gen_key)) or 0)
+        except Exception as e:
+            logger.error(f"读取缓存代数失败: {e}")
+            return 0
+        if self.local is not None:
+            self.local.set(gen_key, generation)
+        return generation
+    
+    def invalidate_namespace(self, *namespaces: str) -> bool:
+        """递增命名空间的代数，其下所有缓存键同时失效，耗时与键数量无关"""
+        if self.local is not None:
+            for namespace in namespaces:
+                self.local.delete(f'{namespace}:gen')
+        if not self.redis_client:
+            return False
+        
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for namespace in namespaces:
+                pipe.incr(self._redis_key(f'{namespace}:gen'))
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"使缓存命名空间失效失败: {e}")
+            return False
+        self._publish_invalidation(namespaces=namespaces)
+        return True
+    
+    def next_generations(self, namespaces) -> Dict[str, int]:
+        """从Redis读取命名空间的当前代数（不经本地缓存），返回各自的下一代"""
+        namespaces = list(namespaces)
+        pipe = self.redis_client.pipeline(transaction=False)
+        for namespace in namespaces:
+            pipe.get(self._redis_key(f'{namespace}:gen'))
+        return {namespace: int(value or 0) + 1 for namespace, value in zip(namespaces, pipe.execute())}
+    
+    def warm(self, namespace: str, name: str, compute, ttl: int = 300,
+             generation: int = 0, stale_ttl: Optional[int] = None) -> Any:
+        """计算数据并写入命名空间的指定一代，切换到该代之前对读取不可见"""
+        if stale_ttl is None:
+            stale_ttl = self.stale_ttl
+        return self._compute_and_store(f'{namespace}:v{generation}:{name}', compute, ttl, stale_ttl)
+    
+    def swap_generations(self, generations: Dict[str, int]) -> bool:
+        """在一个事务中把各命名空间切换到指定代数，并通知各进程"""
+        if self.local is not None:
+            for namespace in generations:
+                self.local.delete(f'{namespace}:gen')
+        try:
+            pipe = self.redis_client.pipeline(transaction=True)
+            for namespace, generation in generations.items():
+                pipe.set(self._redis_key(f'{namespace}:gen'), generation)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"切换缓存代数失败: {e}")
+            return False
+        self._publish_invalidation(namespaces=list(generations))
+        return True
+    
+    @contextmanager
+    def single_flight(self, name: str, timeout: Optional[int] = None):
+        """跨进程互斥：获得锁时产出True，锁被其他进程持有时产出False"""
+        token = self._acquire_lock(name, timeout)
+        try:
+            yield token is not None
+        finally:
+            if token:
+                self._release_lock(name, token)
+    
+    def delete_cache(self, pattern: str) -> int:
+        """删除匹配通配符的缓存键，返回删除数量
+        
+        用SCAN分批遍历、UNLINK在后台释放内存，不会像KEYS/DEL那样长时间阻塞Redis。
+        """
+        if self.local is not None:
+            self.local.delete_matching(pattern)
+        if not self.redis_client:
+            return 0
+        
+        deleted = 0
+        try:
+            batch = []
+            for key in self.redis_client.scan_iter(match=self._redis_key(pattern), count=self.scan_count):
+                batch.append(key)
+                if len(batch) >= self.scan_count:
+                    deleted += self.redis_client.unlink(*batch)
+                    batch = []
+            if batch:
+                deleted += self.redis_client.unlink(*batch)
+        except Exception as e:
+            logger.error(f"按模式删除缓存失败: {e}")
+        self._publish_invalidation(patterns=[pattern])
+        return deleted
+    
+    def _redis_key(self, key: str) -> str:
+        return f'{self.key_prefix}:{key}'
+    
+    def _get_entry(self, key: str) -> Optional[Dict]:
+        return self.get_cached_data(key)
+    
+    def _compute_and_store(self, key: str, compute, ttl: int, stale_ttl: int) -> Any:
+        self.stats['computes'] += 1
+        data = compute()
+        entry = {'data': data, 'fresh_until': time.time() + ttl}
+        # Redis中保留到旧数据也不可用为止
+        self.set_cached_data(key, entry, ttl + stale_ttl)
+        return data
+    
+    def _refresh(self, key: str, compute, ttl: int, stale_ttl: int, token: str):
+        try:
+            self._compute_and_store(key, compute, ttl, stale_ttl)
+        except Exception as e:
+            self.stats['refresh_errors'] += 1
+            logger.error(f"后台刷新缓存失败 {key}: {e}")
+        finally:
+            # 刷新线程没有请求teardown，归还计算中未归还的连接
+            self.db_manager.release_connections()
+            self._release_lock(key, token)
+    
+    def _acquire_lock(self, key: str, timeout: Optional[int] = None) -> Optional[str]:
+        """获取刷新锁，成功时返回锁令牌；Redis出错时视为获得锁，直接计算"""
+        token = uuid.uuid4().hex
+        try:
+            if self.redis_client.set(self._redis_key(f'{key}:lock'), token, nx=True,
+                                     ex=timeout or self.lock_timeout):
+                return token
+            return None
+        except Exception as e:
+            logger.error(f"获取缓存锁失败: {e}")
+            return token
+    
+    def _release_lock(self, key: str, token: str):
+        try:
+            self.redis_client.eval(RELEASE_LOCK_SCRIPT, 1, self._redis_key(f'{key}:lock'), token)
+        except Exception as e:
+            logger.error(f"释放缓存锁失败: {e}")
     
     def get_cached_data(self, key: str) -> Optional[Any]:
-        """获取缓存数据"""
+        """获取缓存数据，先查本地缓存再查Redis"""
         if not self.redis_client:
             return None
         
+        if self.local is not None:
+            data = self.local.get(key)
+            if data is not None:
+                return data
+        
         try:
-            data = self.redis_client.get(key)
+            data = self.redis_client.get(self._redis_key(key))
             if data:
-                return json.loads(data)
+                data = json.loads(data)
+                if self.local is not None:
+                    self.local.set(key, data)
+                return data
             return None
         except Exception as e:
             logger.error(f"获取缓存失败: {e}")
@@ -437,32 +1011,92 @@ class CacheManager:
             return False
         
         try:
-            self.redis_client.setex(key, timeout, json.dumps(data, default=str))
-            return True
+            self.redis_client.setex(self._redis_key(key), timeout, json.dumps(data, default=str))
         except Exception as e:
             logger.error(f"设置缓存失败: {e}")
             return False
+        if self.local is not None:
+            self.local.set(key, data, timeout)
+        self._publish_invalidation(keys=[key])
+        return True
     
     def delete_cached_data(self, key: str) -> bool:
         """删除缓存数据"""
+        if self.local is not None:
+            self.local.delete(key)
         if not self.redis_client:
             return False
         
         try:
-            self.redis_client.delete(key)
-            return True
+            self.redis_client.delete(self._redis_key(key))
         except Exception as e:
             logger.error(f"删除缓存失败: {e}")
             return False
+        self._publish_invalidation(keys=[key])
+        return True
     
     def clear_all_cache(self) -> bool:
-        """清空所有缓存"""
+        """清空所有缓存（只删除 key_prefix 下的键，不使用flushdb）"""
         if not self.redis_client:
+            if self.local is not None:
+                self.local.clear()
             return False
         
+        self.delete_cache('*')
+        return True
+    
+    def close(self):
+        """停止失效通知监听线程"""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+    
+    def _start_listener(self):
+        """订阅失效通知，在后台线程中丢弃其他进程修改过的本地缓存"""
         try:
-            self.redis_client.flushdb()
-            return True
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.invalidation_channel: self._handle_invalidation})
+            self._listener = pubsub.run_in_thread(
+                sleep_time=1, daemon=True, exception_handler=self._handle_listener_error
+            )
+        except Exception as e:
+            # 收不到通知时本地缓存只能靠TTL过期，关闭本地缓存以保证一致
+            logger.warning(f"订阅缓存失效通知失败，停用本地缓存: {e}")
+            self.local = None
+    
+    def _handle_listener_error(self, error, pubsub, thread):
+        # 断线期间可能丢失通知，清空本地缓存；下次循环时pubsub自动重连并重新订阅
+        logger.warning(f"缓存失效通知连接异常: {error}")
+        if self.local is not None:
+            self.local.clear()
+        time.sleep(1)
+    
+    def _handle_invalidation(self, message):
+        try:
+            payload = json.loads(message['data'])
+        except (TypeError, ValueError):
+            return
+        if payload.get('origin') == self.instance_id or self.local is None:
+            return
+        if payload.get('all'):
+            self.local.clear()
+        for key in payload.get('keys', ()):
+            self.local.delete(key)
+        for pattern in payload.get('patterns', ()):
+            self.local.delete_matching(pattern)
+        for namespace in payload.get('namespaces', ()):
+            self.local.delete(f'{namespace}:gen')
+    
+    def _publish_invalidation(self, keys=(), patterns=(), namespaces=(), clear_all=False):
+        # 消息格式与 scraper.utils.cache_invalidation 保持一致
+        message = {
+            'origin': self.instance_id,
+            'keys': list(keys),
+            'patterns': list(patterns),
+            'namespaces': list(namespaces),
+            'all': clear_all,
+        }
+        try:
+            self.redis_client.publish(self.invalidation_channel, json.dumps(message))
         except Exception as e:
-            logger.error(f"清空缓存失败: {e}")
-            return False 
\ No newline at end of file
+            logger.error(f"发布缓存失效通知失败: {e}") 
\ No newline at end of file